@@ -1,13 +1,53 @@
-from flask import Flask, send_file, url_for
+from flask import Flask, Response, request, send_file, url_for
 from pywebio.platform.flask import webio_view
 from pywebio import start_server
 from pywebio.input import *
 from pywebio.output import *
 from pywebio.session import *
-from models import db, User, Client, Vehicle, Policy
+from pywebio.session import local as session_local
+from pywebio.session.threadbased import ThreadBasedSession
+from pywebio.exceptions import SessionException
+from models import db, User, Client, Vehicle, Policy, NotificationLog, policy_actual_status, policy_status_label
+from update_db import run_migrations
+from policy_stats import collect_policy_statistics
+from charts import ChartCache, chart_data_from_statistics, render_statistics_chart
+from documents import (policy_document_fields, render_policy_pdf, statistics_report_data,
+                       render_statistics_report)
+from render_service import DEFAULT_START_METHOD as DEFAULT_RENDER_START_METHOD, RenderService
+from exports import DEFAULT_CHUNK_SIZE, write_policy_export_csv_resumable, write_policy_export_parquet
+from jobs import JobQueue, JobCancelled, job_handler, FINISHED_STATUSES
+from file_storage import REGISTRY_FILE_NAME, FileStorage
+from pdf_cache import PolicyPdfCache
+from notification_templates import (EXPIRY_EMAIL_TEMPLATE, EXPIRY_SMS_TEMPLATE, NotificationTemplates,
+                                    notification_context)
+from notification_dispatch import DEFAULT_CONCURRENCY, LogTransport, NotificationDispatcher, SmtpTransport
+from notification_outbox import (DEFAULT_MAX_ATTEMPTS, DEFAULT_NOTICE_WINDOWS, DEFAULT_RETRY_DELAY,
+                                 count_due_notifications, drop_stale_notifications, due_notifications,
+                                 enqueue_expiry_notifications, outbox_summary, record_delivery)
+from expiry_scanner import (DEFAULT_LOOKBACK_DAYS, DEFAULT_SCAN_INTERVAL, ExpiryScanner,
+                            expired_policy_rows, expiring_policy_rows, scanner_state)
+from bulk_documents import (DEFAULT_MAX_PDF_DOCUMENTS, DEFAULT_PART_SIZE, bulk_document_format,
+                            bulk_policy_criteria, count_policy_documents,
+                            iter_policy_documents, parse_policy_numbers,
+                            write_policy_documents_pdf, write_policy_documents_zip)
+from quotes import DEFAULT_QUOTE_CACHE_SIZE, QuoteService
+from policy_numbers import DEFAULT_BLOCK_SIZE, PolicyNumberAllocator
+from fleet_import import (DEFAULT_BATCH_SIZE as DEFAULT_IMPORT_BATCH_SIZE, FleetImporter, count_import_rows,
+                          read_import_rows)
+from validators import (validate_email, validate_passport, validate_phone, validate_reg_number,
+                        validate_vin)
+from tariffs import tariff_registry
+from query_stats import DEFAULT_SLOW_QUERY_MS, QueryStats
+from queries import (search_clients, search_vehicles, policy_status_criteria, fetch_policy_page,
+                     fetch_client_page, fetch_vehicle_page, DEFAULT_PAGE_SIZE, DEFAULT_SEARCH_LIMIT)
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.utils import safe_join
+from jinja2 import TemplateNotFound
+import csv
+import importlib.util
 import os
-import random
+import time
+import uuid
 from datetime import datetime, timedelta
 import threading
 from fpdf.enums import XPos, YPos
@@ -15,13 +55,31 @@ from fpdf.enums import XPos, YPos
 app = Flask(__name__)
 _thread_locals = threading.local()
 
+def _session_value(name):
+    """
+    Значение из хранилища сессии PyWebIO (pywebio.session.local). Обработчики
+    кнопок выполняются в отдельных потоках, где локальное хранилище потока
+    пусто, а хранилище сессии доступно. Вне сессии (фоновые задания,
+    планировщик) - None. Сессия ищется напрямую: обращение к
+    pywebio.session.local вне сессии запустило бы сервер режима скрипта.
+    """
+    try:
+        return ThreadBasedSession.get_current_session().save.get(name)
+    except SessionException:
+        return None
+
 def get_username():
     """Безопасное получение имени пользователя из локального хранилища потока"""
     try:
         return _thread_locals.username
     except AttributeError:
-        # Если username не установлен, перенаправляем на логин
-        return None
+        # В обработчике кнопки берем имя из хранилища сессии;
+        # если username не установлен, перенаправляем на логин
+        return _session_value('username')
+
+def is_admin():
+    """Является ли текущий пользователь администратором (роль хранится в сессии)"""
+    return _session_value('role') == 'admin'
 
 def go_to_main_menu():
     """Функция для перехода на главную страницу"""
@@ -31,6 +89,44 @@ app.config['SECRET_KEY'] = os.urandom(24)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///osago.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'files')
+app.config['POLICIES_PAGE_SIZE'] = DEFAULT_PAGE_SIZE  # Размер страницы списка полисов по умолчанию
+app.config['SEARCH_RESULTS_LIMIT'] = DEFAULT_SEARCH_LIMIT  # Максимум результатов поиска клиентов и ТС
+app.config['LIST_PAGE_SIZE'] = DEFAULT_PAGE_SIZE  # Размер страницы списков клиентов и ТС без поиска
+app.config['CHART_CACHE_BYTES'] = 32 * 1024 * 1024  # Объем кэша графиков статистики
+app.config['EXPORT_CHUNK_SIZE'] = DEFAULT_CHUNK_SIZE  # Порция строк при выгрузке полисов
+app.config['RENDER_WORKERS'] = 2  # Процессы для отрисовки графиков и PDF (0 - в потоке сессии)
+app.config['RENDER_START_METHOD'] = DEFAULT_RENDER_START_METHOD  # Способ запуска процессов отрисовки (forkserver, spawn)
+app.config['JOB_WORKERS'] = 2  # Потоки для фоновых заданий (выгрузки, отчеты, рассылки)
+app.config['JOB_POLL_INTERVAL'] = 0.5  # Период обновления прогресса задания на экране (сек)
+app.config['BULK_PDF_PART_SIZE'] = DEFAULT_PART_SIZE  # Полисов в одной части объединенного PDF
+app.config['BULK_PDF_MAX_POLICIES'] = DEFAULT_MAX_PDF_DOCUMENTS  # Больше - вместо одного PDF ZIP-архив
+app.config['MAIL_SERVER'] = None  # SMTP-сервер для уведомлений (None - отправка имитируется)
+app.config['MAIL_PORT'] = 25
+app.config['MAIL_USERNAME'] = None
+app.config['MAIL_PASSWORD'] = None
+app.config['MAIL_USE_TLS'] = False
+app.config['MAIL_DEFAULT_SENDER'] = 'noreply@osago.local'
+app.config['NOTIFICATION_CONCURRENCY'] = DEFAULT_CONCURRENCY  # Одновременных отправок уведомлений
+app.config['NOTIFICATION_WINDOWS'] = DEFAULT_NOTICE_WINDOWS  # Этапы напоминаний (дней до окончания)
+app.config['NOTIFICATION_MAX_ATTEMPTS'] = DEFAULT_MAX_ATTEMPTS  # Попыток отправки уведомления
+app.config['NOTIFICATION_RETRY_DELAY'] = DEFAULT_RETRY_DELAY  # Задержка первой повторной попытки (сек)
+app.config['EXPIRY_SCAN_INTERVAL'] = DEFAULT_SCAN_INTERVAL  # Период поиска истекающих полисов (сек)
+# Каналы автоматических уведомлений при проходе планировщика, например ('email', 'sms');
+# по умолчанию пусто - уведомления отправляются только вручную с экрана уведомлений
+app.config['EXPIRY_SCAN_CHANNELS'] = ()
+# Сколько дней показывать истекшие полисы на экране уведомлений (более старые -
+# в списке полисов с фильтром «Истекшие»)
+app.config['EXPIRED_LOOKBACK_DAYS'] = DEFAULT_LOOKBACK_DAYS
+app.config['QUOTE_CACHE_SIZE'] = DEFAULT_QUOTE_CACHE_SIZE  # Расчетов стоимости в кэше котировок
+app.config['POLICY_NUMBER_BLOCK_SIZE'] = DEFAULT_BLOCK_SIZE  # Номеров полисов, резервируемых процессом за раз
+app.config['IMPORT_BATCH_SIZE'] = DEFAULT_IMPORT_BATCH_SIZE  # Строк импорта, записываемых одной транзакцией
+# Загруженные файлы импорта (с паспортами и телефонами) - вне папки, доступной для скачивания
+app.config['IMPORT_FOLDER'] = os.path.join(app.instance_path, 'imports')
+app.config['QUERY_LOG_PATH'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'query_stats.log')  # Журнал запросов по экранам (None - не вести)
+app.config['SLOW_QUERY_MS'] = DEFAULT_SLOW_QUERY_MS  # Запросы дольше порога пишутся в журнал с текстом
+
+# Варианты размера страницы в списке полисов
+POLICIES_PAGE_SIZE_CHOICES = [20, 50, 100, 200]
 
 # Создаем директорию для временных файлов, если она не существует
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
@@ -38,50 +134,57 @@ if not os.path.exists(app.config['UPLOAD_FOLDER']):
 
 db.init_app(app)
 
-# Создание таблиц при первом запуске
-with app.app_context():
-    db.create_all()
-    # Создание тестового пользователя, если его нет
-    if not User.query.filter_by(username='admin').first():
-        test_user = User(
-            username='admin',
-            password=generate_password_hash('admin'),
-            role='admin'
-        )
-        db.session.add(test_user)
-        db.session.commit()
+# Учет SQL-запросов по экранам: журнал и сводка для экрана диагностики
+query_stats = QueryStats(app.config['QUERY_LOG_PATH'], app.config['SLOW_QUERY_MS'], user_getter=get_username)
+
+# Реестр сгенерированных файлов (выгрузки, отчеты); сам реестр хранится в папке
+# экземпляра приложения, вне папки, которую отдает маршрут скачивания
+file_storage = FileStorage(app.config['UPLOAD_FOLDER'], app.instance_path)
+
+# Кэш PDF полисов по отпечатку содержимого (повторное скачивание без отрисовки)
+policy_pdf_cache = PolicyPdfCache(os.path.join(app.config['UPLOAD_FOLDER'], 'policy_cache'))
 
-def validate_passport(passport):
-    """Валидация паспортных данных"""
-    # Проверка формата: 1234 567890
-    if len(passport.replace(" ", "")) != 10 or not passport.replace(" ", "").isdigit():
-        return "Паспорт должен содержать 10 цифр"
-    return None
-
-def validate_phone(phone):
-    """Валидация телефонного номера"""
-    if phone and (not phone.startswith('+') or not phone[1:].isdigit()):
-        return "Телефон должен начинаться с '+' и содержать только цифры"
-    return None
-
-def validate_email(email):
-    """Простая валидация email"""
-    if email and '@' not in email:
-        return "Email должен содержать символ '@'"
-    return None
-
-def validate_vin(vin):
-    """Валидация VIN-кода"""
-    if len(vin) != 17:
-        return "VIN должен содержать 17 символов"
-    return None
-
-def validate_reg_number(reg_number):
-    """Валидация государственного номера автомобиля"""
-    # Простая проверка на минимальную длину
-    if len(reg_number) < 6:
-        return "Государственный номер слишком короткий"
-    return None
+# Расчет стоимости полисов по действующему тарифу (tariffs/) с кэшем котировок
+quote_service = QuoteService(tariff_registry, app.config['QUOTE_CACHE_SIZE'])
+
+# Выдача номеров полисов блоками из последовательности дня
+policy_numbers = PolicyNumberAllocator(app.config['POLICY_NUMBER_BLOCK_SIZE'])
+
+# Скомпилированные шаблоны уведомлений (перекомпилируются при изменении файла)
+notification_templates = NotificationTemplates()
+
+# Кэш отрисованных графиков статистики (общий для всех сессий)
+chart_cache = ChartCache(app.config['CHART_CACHE_BYTES'])
+
+# Пул процессов для отрисовки графиков и PDF (запускается при первом задании)
+render_service = RenderService(app.config['RENDER_WORKERS'], app.config['RENDER_START_METHOD'])
+
+# Очередь фоновых заданий (рабочие потоки запускаются при первом запросе)
+job_queue = JobQueue(app, app.config['JOB_WORKERS'])
+
+# Планировщик поиска истекающих полисов и постановки уведомлений в очередь
+expiry_scanner = ExpiryScanner(app, app.config['EXPIRY_SCAN_INTERVAL'],
+                               channels=app.config['EXPIRY_SCAN_CHANNELS'],
+                               lookback_days=app.config['EXPIRED_LOOKBACK_DAYS'],
+                               windows=app.config['NOTIFICATION_WINDOWS'])
+
+# Создание таблиц при первом запуске. Рабочие процессы пула отрисовки заново
+# выполняют этот модуль под именем __mp_main__ (см. render_service.py) -
+# в них база не трогается
+if __name__ != '__mp_main__':
+    with app.app_context():
+        db.create_all()
+        # Доводим схему существующей базы до актуальной версии (индексы и т.п.)
+        run_migrations(db.engine)
+        # Создание тестового пользователя, если его нет
+        if not User.query.filter_by(username='admin').first():
+            test_user = User(
+                username='admin',
+                password=generate_password_hash('admin'),
+                role='admin'
+            )
+            db.session.add(test_user)
+            db.session.commit()
 
 def main_menu(username=None):
     clear()
@@ -103,12 +206,16 @@ def main_menu(username=None):
         'Список клиентов',
         'Добавить транспортное средство',
         'Список транспортных средств',
+        'Импорт клиентов и ТС',
         'Оформить полис ОСАГО',
         'Список полисов',
         'Статистика и аналитика',
         'Уведомления о полисах',
+        'Фоновые задачи',
         'Выход'
     ]
+    if is_admin():
+        choices.insert(-1, 'Диагностика запросов')
     
     while True:
         choice = actions("Выберите действие:", choices)
@@ -121,6 +228,8 @@ def main_menu(username=None):
             add_vehicle()
         elif choice == 'Список транспортных средств':
             list_vehicles()
+        elif choice == 'Импорт клиентов и ТС':
+            import_fleet()
         elif choice == 'Оформить полис ОСАГО':
             # Отображаем список ТС для выбора полиса для оформления
             list_vehicles_for_policy()
@@ -130,6 +239,10 @@ def main_menu(username=None):
             show_statistics()
         elif choice == 'Уведомления о полисах':
             check_expiring_policies()
+        elif choice == 'Фоновые задачи':
+            show_jobs()
+        elif choice == 'Диагностика запросов':
+            show_query_diagnostics()
         elif choice == 'Выход':
             clear()
             login()
@@ -147,12 +260,15 @@ def login():
     if user and check_password_hash(user.password, info['password']):
         clear()
         _thread_locals.username = user.username
+        session_local.username = user.username
+        session_local.role = user.role
         main_menu(_thread_locals.username)
     else:
         clear()
         put_error("Неверные учетные данные")
         login()
 
+@query_stats.track_screen
 def add_client():
     while True:
         info = input_group("Добавление нового клиента", [
@@ -204,32 +320,46 @@ def add_client():
                 put_error(f"Ошибка при добавлении клиента: {str(e)}")
                 continue  # Повторяем ввод данных
     
-    main_menu(_thread_locals.username)
+    # Главное меню покажет вызывающий цикл main_menu, посещение экрана завершается
 
+@query_stats.track_screen
 def list_clients():
     with app.app_context():
-        clients = Client.query.all()
+        has_clients = db.session.query(Client.query.exists()).scalar()
     
-    if not clients:
+    if not has_clients:
         put_warning("Список клиентов пуст")
         return
     
     # Добавляем поле поиска
     search_term = input("Поиск по ФИО или паспорту:", placeholder="Введите данные для поиска")
     
-    filtered_clients = clients
-    if search_term:
-        # Фильтруем список клиентов
-        filtered_clients = [c for c in clients if search_term.lower() in c.full_name.lower() or 
-                           search_term in c.passport]
+    if not search_term:
+        # Без поиска список выводится постранично, по одному запросу на страницу
+        put_scope('clients_page')
+        show_clients_page(app.config['LIST_PAGE_SIZE'])
+        put_button("Назад", onclick=lambda: main_menu(_thread_locals.username))
+        return
+    
+    with app.app_context():
+        # Полнотекстовый поиск, наиболее релевантные клиенты первыми
+        filtered_clients = search_clients(search_term, app.config['SEARCH_RESULTS_LIMIT'])
         
     if not filtered_clients:
         put_warning("Клиенты не найдены")
         put_button("Назад", onclick=lambda: main_menu(_thread_locals.username))
         return
     
+    if len(filtered_clients) >= app.config['SEARCH_RESULTS_LIMIT']:
+        put_info(f"Показаны {len(filtered_clients)} наиболее подходящих клиентов, уточните запрос")
+    
+    put_table(clients_table(filtered_clients))
+    put_button("Назад", onclick=lambda: main_menu(_thread_locals.username))
+
+def clients_table(clients):
+    """Таблица клиентов с кнопками действий"""
     table = [['ID', 'ФИО', 'Паспорт', 'Телефон', 'Email', 'Действия']]
-    for client in filtered_clients:
+    for client in clients:
         table.append([
             client.id,
             client.full_name,
@@ -241,10 +371,19 @@ def list_clients():
                        lambda c_id=client.id: edit_client(c_id), 
                        lambda c_id=client.id: delete_client(c_id)])
         ])
+    return table
+
+@query_stats.track_screen
+def show_clients_page(page_size, cursor=None, direction='next'):
+    """Отображение одной страницы списка клиентов с навигацией вперед/назад"""
+    with app.app_context():
+        page = fetch_client_page(cursor, direction, page_size)
     
-    put_table(table)
-    put_button("Назад", onclick=lambda: main_menu(_thread_locals.username))
+    with use_scope('clients_page', clear=True):
+        put_table(clients_table(page['rows']))
+        put_page_navigation(page, lambda c, d: show_clients_page(page_size, c, d))
 
+@query_stats.track_screen
 def show_client_details(client_id):
     with app.app_context():
         result = (Client.query
@@ -282,6 +421,7 @@ def show_client_details(client_id):
     
     put_button("Назад", onclick=lambda: main_menu(_thread_locals.username))
 
+@query_stats.track_screen
 def edit_client(client_id):
     """Редактирование информации о клиенте"""
     with app.app_context():
@@ -342,6 +482,11 @@ def edit_client(client_id):
                 client.phone = info['phone']
                 client.email = info['email']
                 db.session.commit()
+                # Документы полисов клиента содержат его данные - удаляем устаревшие
+                policy_pdf_cache.invalidate(
+                    policy_id for (policy_id,) in db.session.query(Policy.id)
+                    .join(Vehicle, Vehicle.id == Policy.vehicle_id)
+                    .filter(Vehicle.client_id == client.id))
                 clear()
                 put_success(f"Данные клиента {client.full_name} успешно обновлены")
                 break
@@ -353,6 +498,7 @@ def edit_client(client_id):
     
     show_client_details(client_id)
 
+@query_stats.track_screen
 def delete_client(client_id):
     """Удаление клиента из базы данных"""
     with app.app_context():
@@ -403,6 +549,7 @@ def delete_client(client_id):
     
     list_clients()
 
+@query_stats.track_screen
 def add_vehicle():
     with app.app_context():
         clients = Client.query.all()
@@ -486,14 +633,121 @@ def add_vehicle():
                 put_error(f"Ошибка при добавлении ТС: {str(e)}")
                 continue
     
-    main_menu(_thread_locals.username)
+    # Главное меню покажет вызывающий цикл main_menu, посещение экрана завершается
 
+@query_stats.track_screen
+def import_fleet():
+    """Пакетный импорт клиентов и транспортных средств из файла CSV или XLSX"""
+    clear()
+    put_markdown("# Импорт клиентов и транспортных средств")
+    put_markdown("Файл CSV (разделитель `,` или `;`, кодировка UTF-8) или XLSX с заголовком в первой строке. "
+                 "Столбцы: `ФИО`, `Паспорт`, `Телефон`, `Email`, `Марка`, `Модель`, `Год выпуска`, "
+                 "`VIN`, `Гос. номер`, `Мощность` (или `full_name`, `passport`, `phone`, `email`, `brand`, "
+                 "`model`, `year`, `vin`, `reg_number`, `engine_power`). Строка без данных ТС добавляет "
+                 "только клиента; ТС клиента, который уже есть в базе, добавляется ему.")
+    
+    info = input_group("Файл импорта", [
+        file_upload("Файл", name="file", accept=['.csv', '.xlsx'], required=True),
+        input("Строк в одной транзакции", name="batch_size", type=NUMBER,
+              value=app.config['IMPORT_BATCH_SIZE'], validate=lambda n: None if n > 0 else "Больше 0")
+    ])
+    
+    extension = os.path.splitext(info['file']['filename'])[1].lower()
+    # Проверяем наличие библиотеки до постановки задания
+    if extension == '.xlsx' and importlib.util.find_spec('openpyxl') is None:
+        put_error("Для импорта из XLSX требуется установить библиотеку openpyxl")
+        put_markdown("Выполните команду: `pip install openpyxl`")
+        put_button("Назад", onclick=lambda: import_fleet())
+        return
+    
+    # В файле паспорта и телефоны: он сохраняется вне папки для загрузок (ее отдает
+    # маршрут скачивания) и удаляется фоновым заданием после обработки
+    os.makedirs(app.config['IMPORT_FOLDER'], exist_ok=True)
+    file_name = f"import_{uuid.uuid4().hex}{extension}"
+    with open(os.path.join(app.config['IMPORT_FOLDER'], file_name), 'wb') as f:
+        f.write(info['file']['content'])
+    
+    job_id = job_queue.submit('fleet_import', {
+        'file_name': file_name,
+        # Имя списка ошибок нельзя подобрать по номеру задания
+        'errors_name': f"import_errors_{uuid.uuid4().hex}.csv",
+        'batch_size': int(info['batch_size'])
+    }, created_by=get_username())
+    show_job_progress(job_id, on_back=lambda: main_menu(_thread_locals.username))
+
+@job_handler('fleet_import', 'Импорт клиентов и ТС')
+@query_stats.track_job
+def fleet_import_job(job):
+    """
+    Фоновое задание импорта: строки записываются пакетами, после каждого
+    пакета сохраняется контрольная точка, ошибки строк пишутся в CSV-файл.
+    Загруженный файл удаляется, когда задание завершается (успешно, с ошибкой
+    или отменой); после аварийной остановки он остается для продолжения.
+    """
+    file_path = os.path.join(app.config['IMPORT_FOLDER'], job.params['file_name'])
+    errors_path = os.path.join(app.config['UPLOAD_FOLDER'], job.params['errors_name'])
+    try:
+        return import_fleet_file(job, file_path, errors_path)
+    except Exception:
+        # Прерванное (в том числе отмененное) задание не оставляет недописанный список ошибок
+        if os.path.exists(errors_path):
+            os.remove(errors_path)
+        raise
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+def import_fleet_file(job, file_path, errors_path):
+    """Импорт строк файла с контрольными точками (см. fleet_import_job)"""
+    try:
+        rows = read_import_rows(file_path)
+    except ValueError as e:
+        return {'error': str(e)}
+    total = count_import_rows(file_path)
+    
+    # После перезапуска задания пропускаем уже записанные строки
+    checkpoint = job.checkpoint or {}
+    done_line = checkpoint.get('line', 0)
+    
+    importer = FleetImporter(job.params['batch_size'])
+    importer.summary.update(checkpoint.get('summary', {}))
+    
+    with open(errors_path, 'a' if checkpoint else 'w', encoding='utf-8-sig', newline='') as errors_file:
+        writer = csv.writer(errors_file, delimiter=';')
+        if not checkpoint:
+            writer.writerow(['Строка', 'Ошибка'])
+        
+        def on_batch(last_line, batch_errors):
+            writer.writerows(batch_errors)
+            errors_file.flush()
+            job.report(importer.summary['rows'] / max(total, 1) * 100,
+                       {'line': last_line, 'summary': importer.summary})
+        
+        summary = importer.import_rows(((line, row) for line, row in rows if line > done_line),
+                                       on_batch)
+    
+    result = {
+        'message': f"Импорт завершен (строк: {summary['rows']})",
+        'details': [
+            f"Добавлено клиентов: {summary['clients_added']}",
+            f"Добавлено транспортных средств: {summary['vehicles_added']}",
+            f"Строк с ошибками: {summary['errors']}"
+        ]
+    }
+    if summary['errors']:
+        file_storage.register_file(errors_path)
+        result['download_url'] = f"/download/files/{os.path.basename(errors_path)}"
+        result['link_text'] = "Скачать список ошибок"
+    else:
+        os.remove(errors_path)
+    return result
+
+@query_stats.track_screen
 def list_vehicles():
     with app.app_context():
-        # Используем joined load для загрузки связанных данных клиента
-        vehicles = Vehicle.query.join(Vehicle.client).add_entity(Client).all()
+        has_vehicles = db.session.query(Vehicle.query.exists()).scalar()
     
-    if not vehicles:
+    if not has_vehicles:
         put_warning("Список транспортных средств пуст")
         return
     
@@ -501,23 +755,32 @@ def list_vehicles():
     search_term = input("Поиск по марке, модели, VIN или гос. номеру:", 
                        placeholder="Введите данные для поиска")
     
-    filtered_vehicles = vehicles
-    if search_term:
-        # Фильтруем список ТС
-        search_term = search_term.lower()
-        filtered_vehicles = [(v, c) for v, c in vehicles if 
-                            search_term in v.brand.lower() or
-                            search_term in v.model.lower() or
-                            search_term in v.vin.lower() or
-                            search_term in v.reg_number.lower()]
+    if not search_term:
+        # Без поиска список выводится постранично, по одному запросу на страницу
+        put_scope('vehicles_page')
+        show_vehicles_page(app.config['LIST_PAGE_SIZE'])
+        put_button("Назад", onclick=go_to_main_menu)
+        return
+    
+    with app.app_context():
+        # Полнотекстовый поиск, наиболее релевантные ТС первыми
+        filtered_vehicles = search_vehicles(search_term, app.config['SEARCH_RESULTS_LIMIT'])
         
     if not filtered_vehicles:
         put_warning("Транспортные средства не найдены")
         put_button("Назад", onclick=go_to_main_menu)
         return
     
+    if len(filtered_vehicles) >= app.config['SEARCH_RESULTS_LIMIT']:
+        put_info(f"Показаны {len(filtered_vehicles)} наиболее подходящих ТС, уточните запрос")
+    
+    put_table(vehicles_table(filtered_vehicles))
+    put_button("Назад", onclick=go_to_main_menu)
+
+def vehicles_table(vehicles):
+    """Таблица пар (ТС, владелец) с кнопками действий"""
     table = [['ID', 'Владелец', 'Марка', 'Модель', 'Год', 'Гос. номер', 'Действия']]
-    for vehicle, client in filtered_vehicles:
+    for vehicle, client in vehicles:
         table.append([
             vehicle.id,
             client.full_name,
@@ -530,10 +793,19 @@ def list_vehicles():
                        lambda v_id=vehicle.id: edit_vehicle(v_id),
                        lambda v_id=vehicle.id: delete_vehicle(v_id)])
         ])
+    return table
+
+@query_stats.track_screen
+def show_vehicles_page(page_size, cursor=None, direction='next'):
+    """Отображение одной страницы списка ТС с навигацией вперед/назад"""
+    with app.app_context():
+        page = fetch_vehicle_page(cursor, direction, page_size)
     
-    put_table(table)
-    put_button("Назад", onclick=go_to_main_menu)
+    with use_scope('vehicles_page', clear=True):
+        put_table(vehicles_table(page['rows']))
+        put_page_navigation(page, lambda c, d: show_vehicles_page(page_size, c, d))
 
+@query_stats.track_screen
 def edit_vehicle(vehicle_id):
     """Редактирование информации о транспортном средстве"""
     with app.app_context():
@@ -550,7 +822,7 @@ def edit_vehicle(vehicle_id):
         current_client = db.session.get(Client, vehicle.client_id)
     
     clear()
-    put_markdown(f"# Редактирование транспортного средства")
+    put_markdown("# Редактирование транспортного средства")
     put_markdown(f"Марка: {vehicle.brand}, Модель: {vehicle.model}, Гос. номер: {vehicle.reg_number}")
     
     while True:
@@ -632,6 +904,9 @@ def edit_vehicle(vehicle_id):
                 vehicle.engine_power = info['engine_power']
                 
                 db.session.commit()
+                policy_pdf_cache.invalidate(
+                    policy_id for (policy_id,) in db.session.query(Policy.id)
+                    .filter(Policy.vehicle_id == vehicle.id))
                 clear()
                 put_success(f"Транспортное средство {info['brand']} {info['model']} успешно обновлено")
                 break  # Выход из цикла
@@ -643,6 +918,7 @@ def edit_vehicle(vehicle_id):
     
     list_vehicles()
 
+@query_stats.track_screen
 def delete_vehicle(vehicle_id):
     """Удаление транспортного средства из базы данных"""
     with app.app_context():
@@ -657,7 +933,7 @@ def delete_vehicle(vehicle_id):
         policies = Policy.query.filter_by(vehicle_id=vehicle_id).all()
     
     clear()
-    put_markdown(f"# Удаление транспортного средства")
+    put_markdown("# Удаление транспортного средства")
     put_table([
         ['Марка', vehicle.brand],
         ['Модель', vehicle.model],
@@ -672,8 +948,9 @@ def delete_vehicle(vehicle_id):
         put_markdown("Перед удалением необходимо удалить все связанные полисы.")
         
         policies_table = [['ID', 'Номер полиса', 'Дата начала', 'Дата окончания', 'Стоимость', 'Статус']]
+        current_date = datetime.now()
         for policy in policies:
-            status = "Отменен" if policy.status == 'cancelled' else "Активен"
+            status = policy_status_label(policy.status, policy.end_date, current_date)
             policies_table.append([
                 policy.id,
                 policy.number,
@@ -704,6 +981,7 @@ def delete_vehicle(vehicle_id):
     
     list_vehicles()
 
+@query_stats.track_screen
 def list_vehicles_for_policy():
     """Отображает список транспортных средств для оформления полиса"""
     with app.app_context():
@@ -725,81 +1003,67 @@ def list_vehicles_for_policy():
             vehicle.model,
             vehicle.year,
             vehicle.reg_number,
-            put_buttons(['Оформить ОСАГО'], 
-                      lambda v_id=vehicle.id: create_policy_for_vehicle(v_id))
+            put_buttons(['Оформить ОСАГО', 'Сравнить варианты'],
+                      [lambda v_id=vehicle.id: create_policy_for_vehicle(v_id),
+                       lambda v_id=vehicle.id: compare_policy_quotes(v_id)])
         ])
     
     put_table(table)
     put_button("Назад", onclick=lambda: main_menu(_thread_locals.username))
 
-def calculate_policy_cost(vehicle, period_months=12, driver_experience=0, driver_age=30, bonus_malus=1.0):
-    """
-    Расчет стоимости полиса ОСАГО с учетом дополнительных факторов:
-    - Мощность двигателя
-    - Возраст транспортного средства
-    - Стаж вождения водителя
-    - Возраст водителя
-    - Коэффициент бонус-малус (скидка за безаварийную езду)
-    - Срок действия полиса
-    """
-    base_rate = 5000  # Базовый тариф
-    
-    # Коэффициент мощности двигателя
-    if vehicle.engine_power <= 50:
-        power_ratio = 0.6
-    elif vehicle.engine_power <= 100:
-        power_ratio = 1.0
-    elif vehicle.engine_power <= 150:
-        power_ratio = 1.4
-    elif vehicle.engine_power <= 200:
-        power_ratio = 1.8
-    else:
-        power_ratio = 2.2
-    
-    # Коэффициент возраста ТС
-    vehicle_age = datetime.now().year - vehicle.year
-    if vehicle_age <= 3:
-        age_ratio = 1.0
-    elif vehicle_age <= 7:
-        age_ratio = 1.1
-    elif vehicle_age <= 10:
-        age_ratio = 1.3
-    else:
-        age_ratio = 1.5
-    
-    # Коэффициент стажа вождения
-    if driver_experience <= 3:
-        experience_ratio = 1.3
-    elif driver_experience <= 5:
-        experience_ratio = 1.1
-    elif driver_experience <= 10:
-        experience_ratio = 0.9
-    else:
-        experience_ratio = 0.8
-    
-    # Коэффициент возраста водителя
-    if driver_age < 22:
-        driver_age_ratio = 1.7
-    elif driver_age < 25:
-        driver_age_ratio = 1.3
-    elif driver_age < 60:
-        driver_age_ratio = 1.0
-    else:
-        driver_age_ratio = 1.2
+@query_stats.track_screen
+def compare_policy_quotes(vehicle_id):
+    """Таблица стоимости полиса для всех сроков и классов КБМ действующего тарифа"""
+    with app.app_context():
+        vehicle = db.session.get(Vehicle, vehicle_id)
     
-    # Учет всех коэффициентов
-    total_cost = (base_rate * power_ratio * age_ratio * experience_ratio 
-                * driver_age_ratio * bonus_malus * (period_months / 12))
+    if not vehicle:
+        put_error("Транспортное средство не найдено")
+        return
     
-    return round(total_cost, 2)
+    driver = input_group("Сравнение вариантов полиса", [
+        input("Возраст водителя", name="driver_age", type=NUMBER, required=True,
+              value=30, validate=lambda a: 18 <= a <= 99),
+        input("Стаж вождения (лет)", name="driver_experience", type=NUMBER, required=True,
+              value=5, validate=lambda e: 0 <= e <= 60)
+    ])
+    driver_age = int(driver['driver_age'])
+    driver_experience = int(driver['driver_experience'])
+    
+    clear()
+    if driver_experience > (driver_age - 18):
+        put_error("Стаж вождения не может быть больше, чем (возраст водителя - 18)")
+        put_button("Назад", onclick=lambda: compare_policy_quotes(vehicle_id))
+        return
+    
+    comparison = quote_service.compare(vehicle, driver_experience, driver_age)
+    
+    put_markdown(f"# Сравнение вариантов полиса: {vehicle.brand} {vehicle.model} ({vehicle.reg_number})")
+    put_markdown(f"Возраст водителя: {driver_age} лет, стаж вождения: {driver_experience} лет, "
+                 f"тариф версии {comparison['tariff_version']}")
+    
+    table = [['Класс КБМ'] + [label for _, label in comparison['periods']]]
+    for (_, label), costs in zip(comparison['bonus_malus'], comparison['costs']):
+        table.append([label] + [f"{cost} руб." for cost in costs])
+    put_table(table)
+    
+    stats = quote_service.stats()
+    put_text(f"Кэш расчетов: {stats['size']} из {stats['maxsize']}, "
+             f"попаданий {stats['hits']}, промахов {stats['misses']}")
+    
+    put_buttons(['Оформить ОСАГО', 'Назад'],
+                [lambda: create_policy_for_vehicle(vehicle_id),
+                 lambda: main_menu(_thread_locals.username)])
 
+@query_stats.track_screen
 def create_policy_for_vehicle(vehicle_id):
     try:
         # Попытка преобразовать vehicle_id в целое число, если он передан как строка
         vehicle_id = int(vehicle_id) if not isinstance(vehicle_id, int) else vehicle_id
         
         with app.app_context():
-            vehicle = Vehicle.query.join(Vehicle.client).filter(Vehicle.id == vehicle_id).first()
+            vehicle = (Vehicle.query.options(db.joinedload(Vehicle.client))
+                       .filter(Vehicle.id == vehicle_id).first())
         
         if not vehicle:
             put_error("Транспортное средство не найдено")
@@ -808,22 +1072,13 @@ def create_policy_for_vehicle(vehicle_id):
         put_error("Некорректный ID транспортного средства")
         return
     
-    period_choices = [
-        ('3', '3 месяца'),
-        ('6', '6 месяцев'),
-        ('12', '12 месяцев')
-    ]
+    # Сроки и классы КБМ берутся из действующего тарифа; расчет ведется по
+    # той же версии, даже если во время заполнения формы вышла новая
+    tariff = tariff_registry.current()
     
-    bonus_malus_choices = [
-        ('0.5', 'Класс M (50% скидка)'),
-        ('0.65', 'Класс 13-14 (35% скидка)'),
-        ('0.8', 'Класс 10-12 (20% скидка)'),
-        ('0.9', 'Класс 7-9 (10% скидка)'),
-        ('1.0', 'Класс 3-6 (нет скидки/надбавки)'),
-        ('1.4', 'Класс 2-1 (40% надбавка)'),
-        ('1.6', 'Класс 0,-1,-2 (60% надбавка)'),
-        ('2.45', 'Класс M (145% надбавка)')
-    ]
+    period_choices = [(str(months), label) for months, label in tariff.periods]
+    
+    bonus_malus_choices = [(str(value), label) for value, label in tariff.bonus_malus]
     
     # Собираем данные для расчета полиса
     info = input_group("Оформление полиса ОСАГО", [
@@ -856,7 +1111,7 @@ def create_policy_for_vehicle(vehicle_id):
     # Проверка корректности данных о стаже и возрасте
     if driver_experience > (driver_age - 18):
         clear()
-        put_error(f"Стаж вождения не может быть больше, чем (возраст водителя - 18)")
+        put_error("Стаж вождения не может быть больше, чем (возраст водителя - 18)")
         put_button("Назад", onclick=lambda v_id=vehicle_id: create_policy_for_vehicle(v_id))
         return
     
@@ -864,28 +1119,27 @@ def create_policy_for_vehicle(vehicle_id):
     end_date = start_date + timedelta(days=30*period_months)
     
     # Расчитываем стоимость с учетом всех параметров
-    cost = calculate_policy_cost(vehicle, period_months, driver_experience, driver_age, bonus_malus)
-    
-    # Генерация номера полиса (улучшенная версия)
-    prefix = "OSG"
-    date_part = datetime.now().strftime('%Y%m%d')
-    random_part = ''.join([str(random.randint(0, 9)) for _ in range(4)])
-    policy_number = f"{prefix}-{date_part}-{random_part}"
+    cost = quote_service.quote(vehicle, period_months, driver_experience, driver_age, bonus_malus,
+                               tariff=tariff)['cost']
     
     with app.app_context():
+        # Номер из последовательности дня (без совпадений с уже выданными)
+        policy_number = policy_numbers.allocate(start_date)
+        
         policy = Policy(
             number=policy_number,
             vehicle_id=vehicle.id,
             start_date=start_date,
             end_date=end_date,
-            cost=cost
+            cost=cost,
+            tariff_version=tariff.version
         )
         
         db.session.add(policy)
         db.session.commit()
     
     clear()
-    put_success(f"Полис ОСАГО успешно оформлен")
+    put_success("Полис ОСАГО успешно оформлен")
     put_markdown("## Информация о полисе")
     put_table([
         ['Номер полиса', policy_number],
@@ -895,6 +1149,7 @@ def create_policy_for_vehicle(vehicle_id):
         ['Возраст водителя', f"{driver_age} лет"],
         ['Стаж вождения', f"{driver_experience} лет"],
         ['Класс КБМ', next((desc for val, desc in bonus_malus_choices if val == info['bonus_malus']), '-')],
+        ['Тариф', f"{tariff.name} (версия {tariff.version})"],
         ['Стоимость', f"{cost} руб."]
     ])
     
@@ -905,95 +1160,49 @@ def create_policy_for_vehicle(vehicle_id):
                 lambda: send_policy_by_email(policy.id, vehicle.client)])
     put_button("В главное меню", onclick=lambda: main_menu(_thread_locals.username))
 
+@query_stats.track_screen
 def generate_policy_pdf(policy_id):
     """Генерация PDF для страхового полиса"""
-    try:
-        from fpdf import FPDF
-        import tempfile
-        import os
-        
-        with app.app_context():
-            result = (Policy.query
-                     .filter(Policy.id == policy_id)
-                     .join(Policy.vehicle)
-                     .join(Vehicle.client)
-                     .add_entity(Vehicle)
-                     .add_entity(Client)
-                     .first())
-        
-        if not result:
-            put_error("Полис не найден")
-            return None
-            
-        policy, vehicle, client = result
-          # Создаем PDF документ с поддержкой кириллицы
-        pdf = FPDF()
-        # Добавляем кириллический шрифт (обычный и полужирный)
-        font_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts', 'arial.ttf')
-        pdf.add_font('CustomFont', '', font_path)
-        pdf.add_font('CustomFont', 'B', font_path)
-        pdf.add_page()
-        
-        # Используем шрифт с поддержкой кириллицы
-        pdf.set_font("CustomFont", "", 16)
-        pdf.cell(0, 10, "СТРАХОВОЙ ПОЛИС ОСАГО", 0, 1, 'C')
-        pdf.ln(10)
-          # Информация о полисе
-        pdf.set_font("CustomFont", "B", 12)
-        pdf.cell(0, 10, f"Полис №: {policy.number}", 0, 1)
-        pdf.cell(0, 10, f"Дата оформления: {policy.created_at.strftime('%d.%m.%Y')}", 0, 1)
-        pdf.cell(0, 10, f"Срок действия: {policy.start_date.strftime('%d.%m.%Y')} - {policy.end_date.strftime('%d.%m.%Y')}", 0, 1)
-        pdf.cell(0, 10, f"Стоимость: {policy.cost} руб.", 0, 1)
-        pdf.ln(5)
-        
-        # Информация о ТС
-        pdf.set_font("CustomFont", "B", 14)
-        pdf.cell(0, 10, "Информация о транспортном средстве:", 0, 1)
-        pdf.set_font("CustomFont", "", 12)
-        pdf.cell(0, 10, f"Марка и модель: {vehicle.brand} {vehicle.model}", 0, 1)
-        pdf.cell(0, 10, f"Год выпуска: {vehicle.year}", 0, 1)
-        pdf.cell(0, 10, f"VIN: {vehicle.vin}", 0, 1)
-        pdf.cell(0, 10, f"Гос. номер: {vehicle.reg_number}", 0, 1)
-        pdf.ln(5)
-        
-        # Информация о владельце
-        pdf.set_font("CustomFont", "B", 14)
-        pdf.cell(0, 10, "Информация о владельце:", 0, 1)
-        pdf.set_font("CustomFont", "", 12)
-        pdf.cell(0, 10, f"ФИО: {client.full_name}", 0, 1)
-        pdf.cell(0, 10, f"Паспорт: {client.passport}", 0, 1)
-        if client.phone:
-            pdf.cell(0, 10, f"Телефон: {client.phone}", 0, 1)
-        if client.email:
-            pdf.cell(0, 10, f"Email: {client.email}", 0, 1)
-        
-        # Подпись
-        pdf.ln(20)
-        pdf.cell(80, 10, "Подпись страховщика: _________________", 0, 1)
-        pdf.cell(80, 10, "Подпись страхователя: _________________", 0, 1)
-          # Создаем файл в папке для загрузок
-        file_name = f"policy_{policy.number}.pdf"
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], file_name)
-        
-        try:
-            # Сохраняем PDF в файл
-            pdf.output(file_path)
-            put_success(f"PDF полиса успешно создан")
-              # Создаем ссылку для скачивания прямо из статической директории
-            filename = f"policy_{policy.number}.pdf"
-            download_url = f"/download/files/{filename}"
-            put_markdown(f"[Скачать полис {policy.number}.pdf]({download_url})")
-            return file_path
-            
-        except Exception as e:
-            put_error(f"Ошибка при создании PDF: {str(e)}")
-            return None
-        
-    except ImportError:
+    # Проверяем наличие библиотеки до формирования документа
+    if importlib.util.find_spec('fpdf') is None:
         put_error("Для создания PDF требуется установить библиотеку fpdf2.")
         put_markdown("Выполните команду: `pip install fpdf2`")
         return None
+    
+    with app.app_context():
+        result = (Policy.query
+                 .filter(Policy.id == policy_id)
+                 .join(Policy.vehicle)
+                 .join(Vehicle.client)
+                 .add_entity(Vehicle)
+                 .add_entity(Client)
+                 .first())
+    
+    if not result:
+        put_error("Полис не найден")
+        return None
+        
+    policy, vehicle, client = result
+    fields = policy_document_fields(policy, vehicle, client)
+    
+    try:
+        # Неизмененный полис отдается из кэша, иначе документ формируется
+        # в пуле процессов, а сессия только ждет результат
+        file_path = policy_pdf_cache.get_or_render(
+            policy.id, fields, policy.status,
+            lambda path: render_service.run(render_policy_pdf, fields, path))
+        put_success("PDF полиса успешно создан")
+        # Создаем ссылку для скачивания прямо из статической директории
+        relative_path = os.path.relpath(file_path, app.config['UPLOAD_FOLDER'])
+        download_url = f"/download/files/{relative_path.replace(os.sep, '/')}"
+        put_markdown(f"[Скачать полис {policy.number}.pdf]({download_url})")
+        return file_path
+        
+    except Exception as e:
+        put_error(f"Ошибка при создании PDF: {str(e)}")
+        return None
 
+@query_stats.track_screen
 def send_policy_by_email(policy_id, client):
     """Имитация отправки полиса по электронной почте"""
     clear()
@@ -1017,6 +1226,7 @@ def send_policy_by_email(policy_id, client):
     put_success(f"Полис успешно отправлен на адрес {client.email}")
     put_button("Назад", onclick=lambda: show_policy_details(policy_id))
 
+@query_stats.track_screen
 def cancel_policy(policy_id):
     """Отмена полиса ОСАГО"""
     with app.app_context():
@@ -1057,6 +1267,7 @@ def cancel_policy(policy_id):
                 policy.status = 'cancelled'
                 policy.notes = reason  # Добавляем причину отмены в примечания
                 db.session.commit()
+                policy_pdf_cache.invalidate([policy.id])
                 clear()
                 put_success("Полис успешно отменен")
             except Exception as e:
@@ -1071,31 +1282,13 @@ def cancel_policy(policy_id):
         # Если пользователь отменил действие, возвращаемся к деталям полиса
         show_policy_details(policy_id)
 
+@query_stats.track_screen
 def list_policies():
     """Отображение списка полисов со статистикой и фильтрами"""
-    # Статистика по полисам
+    # Статистика по полисам (один агрегирующий запрос)
     with app.app_context():
         current_date = datetime.now()
-        
-        total_policies = Policy.query.count()
-        active_policies = Policy.query.filter_by(status='active').count()
-        cancelled_policies = Policy.query.filter_by(status='cancelled').count()
-        
-        # Полисы с истекшим сроком действия
-        expired_policies = Policy.query.filter(
-            Policy.status == 'active', 
-            Policy.end_date < current_date
-        ).count()
-        
-        # Общая сумма всех активных полисов
-        sum_active = db.session.query(db.func.sum(Policy.cost)).filter_by(status='active').scalar() or 0
-        
-        # Полисы, срок действия которых заканчивается в ближайшие 30 дней
-        expiring_soon = Policy.query.filter(
-            Policy.status == 'active',
-            Policy.end_date > current_date,
-            Policy.end_date < (current_date + timedelta(days=30))
-        ).count()
+        stats = collect_policy_statistics(current_date)
     
     clear()
     put_markdown("# Управление полисами ОСАГО")
@@ -1103,25 +1296,16 @@ def list_policies():
     # Отображаем статистику
     put_markdown("## Статистика по полисам")
     stats_table = [
-        ['Всего полисов', total_policies],
-        ['Активные', active_policies],
-        ['Отмененные', cancelled_policies],
-        ['Истекшие', expired_policies],
-        ['Истекают в ближайшие 30 дней', expiring_soon],
-        ['Общая сумма активных полисов', f"{round(sum_active, 2)} руб."]
+        ['Всего полисов', stats['total']],
+        ['Активные', stats['active_status']],
+        ['Отмененные', stats['cancelled']],
+        ['Истекшие', stats['expired']],
+        ['Истекают в ближайшие 30 дней', stats['expiring_soon']],
+        ['Общая сумма активных полисов', f"{round(stats['active_status_sum'], 2)} руб."]
     ]
     put_table(stats_table)
     
-    with app.app_context():
-        # Получаем все полисы с данными клиентов и ТС
-        results = (Policy.query
-                  .join(Policy.vehicle)
-                  .join(Vehicle.client)
-                  .add_entity(Vehicle)
-                  .add_entity(Client)
-                  .all())
-    
-    if not results:
+    if not stats['total']:
         put_warning("Список полисов пуст")
         put_button("В главное меню", onclick=lambda: main_menu(_thread_locals.username))
         return
@@ -1141,65 +1325,198 @@ def list_policies():
     search_term = input("Поиск по номеру полиса, владельцу или ТС:", 
                        placeholder="Введите данные для поиска")
     
-    # Применяем фильтрацию
-    filtered_results = results
-    
-    # Фильтр по статусу
-    if status_filter == 'active':
-        filtered_results = [(p, v, c) for p, v, c in results 
-                           if p.status == 'active' and p.end_date >= current_date]
-    elif status_filter == 'cancelled':
-        filtered_results = [(p, v, c) for p, v, c in results 
-                           if p.status == 'cancelled']
-    elif status_filter == 'expired':
-        filtered_results = [(p, v, c) for p, v, c in results 
-                           if p.status == 'active' and p.end_date < current_date]
-    elif status_filter == 'expiring_soon':
-        filtered_results = [(p, v, c) for p, v, c in results 
-                           if p.status == 'active' and p.end_date > current_date 
-                           and p.end_date < (current_date + timedelta(days=30))]
-    
-    # Поиск по строке
-    if search_term:
-        search_term = search_term.lower()
-        filtered_results = [(p, v, c) for p, v, c in filtered_results if 
-                           search_term in p.number.lower() or
-                           search_term in c.full_name.lower() or
-                           search_term in v.brand.lower() or
-                           search_term in v.model.lower() or
-                           search_term in v.reg_number.lower()]
-    
-    if not filtered_results:
+    page_size = select("Полисов на странице:", options=[
+        (str(size), str(size)) for size in POLICIES_PAGE_SIZE_CHOICES
+    ], value=str(app.config['POLICIES_PAGE_SIZE']))
+    
+    # Фильтры применяются в SQL, на каждую страницу выполняется один запрос;
+    # при поиске полисы упорядочены по релевантности
+    criteria = policy_status_criteria(status_filter, current_date)
+    
+    put_markdown("## Список полисов")
+    put_scope('policies_page')
+    show_policies_page(criteria, search_term, int(page_size))
+    put_button("Пакетная печать полисов", onclick=lambda: bulk_policy_documents())
+    put_button("В главное меню", onclick=lambda: main_menu(_thread_locals.username))
+
+def put_page_navigation(page, show_page):
+    """Кнопки перехода к соседним страницам; show_page(cursor, direction) выводит страницу"""
+    nav_labels = []
+    nav_actions = []
+    if page['has_prev']:
+        nav_labels.append('← Предыдущая страница')
+        nav_actions.append(lambda c=page['first_cursor']: show_page(c, 'prev'))
+    if page['has_next']:
+        nav_labels.append('Следующая страница →')
+        nav_actions.append(lambda c=page['last_cursor']: show_page(c, 'next'))
+    if nav_labels:
+        put_buttons(nav_labels, nav_actions)
+
+@query_stats.track_screen
+def show_policies_page(criteria, search_term, page_size, cursor=None, direction='next'):
+    """Отображение одной страницы списка полисов с навигацией вперед/назад"""
+    with app.app_context():
+        page = fetch_policy_page(criteria, cursor, direction, page_size, search_term)
+    
+    current_date = datetime.now()
+    
+    with use_scope('policies_page', clear=True):
+        if not page['rows']:
+            put_warning("Полисы по заданным критериям не найдены")
+            put_button("Сбросить фильтры", onclick=lambda: list_policies())
+            return
+        
+        table = [['Номер полиса', 'Владелец', 'Транспортное средство', 'Срок действия', 'Стоимость', 'Статус', 'Действия']]
+        
+        for policy, vehicle, client in page['rows']:
+            # Определяем актуальный статус
+            actual_status = policy_status_label(policy.status, policy.end_date, current_date)
+                
+            table.append([
+                policy.number,
+                client.full_name,
+                f"{vehicle.brand} {vehicle.model}",
+                f"{policy.start_date.strftime('%d.%m.%Y')} - {policy.end_date.strftime('%d.%m.%Y')}",
+                f"{policy.cost} руб.",
+                actual_status,
+                put_buttons(['Подробнее'], lambda p_id=policy.id: show_policy_details(p_id))
+            ])
+        
+        put_table(table)
+        
+        put_page_navigation(page, lambda c, d: show_policies_page(criteria, search_term, page_size, c, d))
+
+@query_stats.track_screen
+def bulk_policy_documents():
+    """
+    Пакетная печать полисов: отбор по периоду оформления, статусу и номерам,
+    результат - ZIP-архив или один PDF-файл, формируемый фоновым заданием
+    """
+    # Проверяем наличие библиотеки до постановки задания
+    if importlib.util.find_spec('fpdf') is None:
+        clear()
+        put_error("Для создания PDF требуется установить библиотеку fpdf2.")
+        put_markdown("Выполните команду: `pip install fpdf2`")
+        put_button("Назад", onclick=lambda: list_policies())
+        return
+    
+    clear()
+    put_markdown("# Пакетная печать полисов")
+    
+    info = input_group("Отбор полисов", [
+        input("Оформлены с", name="date_from", type=DATE),
+        input("Оформлены по", name="date_to", type=DATE),
+        select("Статус полиса", name="status", options=[
+            ('all', 'Все'),
+            ('active', 'Только активные'),
+            ('cancelled', 'Отмененные'),
+            ('expired', 'Истекшие'),
+            ('expiring_soon', 'Истекают в ближайшие 30 дней')
+        ], value='all'),
+        textarea("Номера полисов", name="numbers", rows=3,
+                 help_text="Через запятую или с новой строки; пусто - все полисы по условиям выше"),
+        select("Формат", name="format", options=[
+            ('zip', 'ZIP-архив (файл на каждый полис)'),
+            ('pdf', f"Один PDF-файл (до {app.config['BULK_PDF_MAX_POLICIES']} полисов)")
+        ], value='zip', help_text="Если полисов больше, вместо одного PDF-файла формируется ZIP-архив")
+    ])
+    
+    # Проверяем наличие библиотеки до постановки задания
+    if info['format'] == 'pdf' and importlib.util.find_spec('pypdf') is None:
+        put_error("Для объединения полисов в один PDF требуется установить библиотеку pypdf")
+        put_markdown("Выполните команду: `pip install pypdf`")
+        put_button("Назад", onclick=lambda: bulk_policy_documents())
+        return
+    
+    date_from = datetime.strptime(info['date_from'], '%Y-%m-%d') if info['date_from'] else None
+    date_to = datetime.strptime(info['date_to'], '%Y-%m-%d') if info['date_to'] else None
+    if date_from and date_to and date_from > date_to:
+        put_error("Дата начала периода позже даты окончания")
+        put_button("Назад", onclick=lambda: bulk_policy_documents())
+        return
+    
+    current_date = datetime.now()
+    numbers = parse_policy_numbers(info['numbers'])
+    with app.app_context():
+        total = count_policy_documents(bulk_policy_criteria(current_date, date_from, date_to,
+                                                            info['status'], numbers))
+    
+    if not total:
         put_warning("Полисы по заданным критериям не найдены")
-        put_button("Сбросить фильтры", onclick=lambda: list_policies())
+        put_button("Назад", onclick=lambda: bulk_policy_documents())
         return
     
-    # Отображаем список полисов
-    put_markdown("## Список полисов")
-    table = [['Номер полиса', 'Владелец', 'Транспортное средство', 'Срок действия', 'Стоимость', 'Статус', 'Действия']]
-    
-    for policy, vehicle, client in filtered_results:
-        # Определяем актуальный статус
-        if current_date > policy.end_date and policy.status == 'active':
-            actual_status = "Истек"
-        elif policy.status == 'cancelled':
-            actual_status = "Отменен"
-        else:
-            actual_status = "Активен"
-            
-        table.append([
-            policy.number,
-            client.full_name,
-            f"{vehicle.brand} {vehicle.model}",
-            f"{policy.start_date.strftime('%d.%m.%Y')} - {policy.end_date.strftime('%d.%m.%Y')}",
-            f"{policy.cost} руб.",
-            actual_status,
-            put_buttons(['Подробнее'], lambda p_id=policy.id: show_policy_details(p_id))
-        ])
+    file_name = f"policies_{current_date.strftime('%Y-%m-%d_%H%M%S')}.{info['format']}"
+    job_id = job_queue.submit('bulk_policy_documents', {
+        'file_name': file_name,
+        'format': info['format'],
+        'date_from': date_from.isoformat() if date_from else None,
+        'date_to': date_to.isoformat() if date_to else None,
+        'status': info['status'],
+        'numbers': numbers,
+        'current_date': current_date.isoformat()
+    }, created_by=get_username())
+    show_job_progress(job_id, on_back=list_policies)
+
+@job_handler('bulk_policy_documents', 'Пакетная печать полисов')
+@query_stats.track_job
+def bulk_policy_documents_job(job):
+    """
+    Фоновое задание пакетной печати: документы отрисовываются параллельно
+    в пуле процессов и по готовности пишутся в ZIP-архив или общий PDF
+    """
+    params = job.params
+    criteria = bulk_policy_criteria(
+        datetime.fromisoformat(params['current_date']),
+        datetime.fromisoformat(params['date_from']) if params['date_from'] else None,
+        datetime.fromisoformat(params['date_to']) if params['date_to'] else None,
+        params['status'], params['numbers'])
+    
+    total = count_policy_documents(criteria)
+    documents = iter_policy_documents(criteria)
+    
+    # Объединенный PDF собирается в памяти, поэтому большой отбор выгружается ZIP-архивом
+    file_format = bulk_document_format(params['format'], total, app.config['BULK_PDF_MAX_POLICIES'])
+    file_name = f"{os.path.splitext(params['file_name'])[0]}.{file_format}"
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], file_name)
+    
+    def on_document(done):
+        # Прогресс сохраняется примерно каждым процентом, а не после каждого полиса
+        if done == total or done % max(total // 100, 1) == 0:
+            job.report(done / max(total, done) * 100)
     
-    put_table(table)
-    put_button("В главное меню", onclick=lambda: main_menu(_thread_locals.username))
+    try:
+        if file_format == 'pdf':
+            written = write_policy_documents_pdf(file_path, documents, render_service, on_document,
+                                                 app.config['BULK_PDF_PART_SIZE'],
+                                                 app.config['BULK_PDF_MAX_POLICIES'])
+        else:
+            written = write_policy_documents_zip(file_path, documents, render_service,
+                                                 policy_pdf_cache, on_document)
+    except Exception:
+        # Прерванное (в том числе отмененное) задание не оставляет недописанный файл
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    
+    if not written:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        return {'error': "Полисы по заданным критериям не найдены"}
+    
+    file_storage.register_file(file_path)
+    
+    result = {
+        'message': f"Документы полисов сформированы (полисов: {written})",
+        'download_url': f"/download/files/{file_name}",
+        'link_text': f"Скачать {file_name}"
+    }
+    if file_format != params['format']:
+        result['details'] = [f"Полисов больше {app.config['BULK_PDF_MAX_POLICIES']}, "
+                             "поэтому вместо одного PDF-файла сформирован ZIP-архив"]
+    return result
 
+@query_stats.track_screen
 def show_policy_details(policy_id):
     """Просмотр детальной информации о полисе и управление им"""
     with app.app_context():
@@ -1220,14 +1537,8 @@ def show_policy_details(policy_id):
     clear()
     put_markdown(f"# Информация о полисе {policy.number}")
     
-    # Определяем статус полиса (действующий, истекший)
-    current_date = datetime.now()
-    if current_date > policy.end_date:
-        actual_status = "Истек"
-    elif policy.status == 'cancelled':
-        actual_status = "Отменен"
-    else:
-        actual_status = "Действующий"
+    # Определяем статус полиса (действующий, истекший, отмененный)
+    actual_status = policy_actual_status(policy.status, policy.end_date, datetime.now())
     
     # Если полис отменен, показываем причину отмены
     if policy.status == 'cancelled' and policy.notes:
@@ -1237,12 +1548,12 @@ def show_policy_details(policy_id):
     # Отображаем кнопки действий в зависимости от статуса полиса
     put_markdown("## Действия с полисом")
     
-    if actual_status == "Действующий":
+    if actual_status == 'active':
         put_buttons(['Отменить полис', 'Скачать PDF', 'Отправить на Email'], 
                   [lambda p_id=policy_id: cancel_policy(p_id), 
                    lambda p_id=policy_id: generate_policy_pdf(p_id),
                    lambda: send_policy_by_email(policy_id, client)])
-    elif actual_status == "Истек":
+    elif actual_status == 'expired':
         put_buttons(['Оформить новый полис', 'Скачать PDF'],
                   [lambda v_id=vehicle.id: create_policy_for_vehicle(v_id),
                    lambda p_id=policy_id: generate_policy_pdf(p_id)])
@@ -1252,6 +1563,7 @@ def show_policy_details(policy_id):
     
     put_button("Назад", onclick=lambda: list_policies())
 
+@query_stats.track_screen
 def check_expiring_policies():
     """
     Функция для проверки истекающих полисов и отправки уведомлений
@@ -1260,28 +1572,18 @@ def check_expiring_policies():
     put_markdown("# Уведомления о полисах")
     
     with app.app_context():
-        current_date = datetime.now()
+        if scanner_state() is None:
+            # Планировщик еще не запускался - выполняем первый проход сразу
+            expiry_scanner.run_once()
         
-        # Полисы, срок действия которых заканчивается в ближайшие 30 дней
-        expiring_policies = (Policy.query
-                            .filter(Policy.status == 'active')
-                            .filter(Policy.end_date > current_date)
-                            .filter(Policy.end_date < (current_date + timedelta(days=30)))
-                            .join(Policy.vehicle)
-                            .join(Vehicle.client)
-                            .add_entity(Vehicle)
-                            .add_entity(Client)
-                            .all())
+        current_date = datetime.now()
+        scanned_at = scanner_state().last_run_at
         
-        # Просроченные полисы (истекшие, но активные)
-        expired_policies = (Policy.query
-                           .filter(Policy.status == 'active')
-                           .filter(Policy.end_date < current_date)
-                           .join(Policy.vehicle)
-                           .join(Vehicle.client)
-                           .add_entity(Vehicle)
-                           .add_entity(Client)
-                           .all())
+        # Списки читаются из таблицы, которую поддерживает планировщик
+        expiring_policies = expiring_policy_rows(current_date)
+        expired_policies = expired_policy_rows(current_date)
+    
+    put_markdown(f"Данные обновлены {scanned_at.strftime('%d.%m.%Y %H:%M')}")
     
     # Отображение истекающих полисов
     put_markdown("## Полисы, истекающие в ближайшие 30 дней")
@@ -1314,7 +1616,7 @@ def check_expiring_policies():
         put_warning("Нет полисов, истекающих в ближайшие 30 дней")
     
     # Отображение просроченных полисов
-    put_markdown("## Просроченные полисы")
+    put_markdown(f"## Просроченные полисы (за последние {app.config['EXPIRED_LOOKBACK_DAYS']} дней)")
     
     if expired_policies:
         table = [['Номер полиса', 'Владелец', 'ТС', 'Срок окончания', 'Просрочен (дней)', 'Действия']]
@@ -1336,10 +1638,69 @@ def check_expiring_policies():
         put_table(table)
     else:
         put_warning("Нет просроченных полисов")
+    put_text("Полисы, истекшие раньше, показываются в списке полисов с фильтром «Истекшие»")
+    
+    put_buttons(['Отправить массовые уведомления', 'Очередь уведомлений', 'Обновить списки',
+                 'В главное меню'], 
+              [send_mass_notifications, show_notification_outbox, refresh_expiring_policies,
+               lambda: main_menu(_thread_locals.username)])
+
+def refresh_expiring_policies():
+    """Внеочередной проход планировщика истекающих полисов"""
+    expiry_scanner.run_once()
+    check_expiring_policies()
+
+def notification_transports():
+    """Транспорты уведомлений по каналам согласно настройкам приложения"""
+    if app.config['MAIL_SERVER']:
+        def email_transport():
+            return SmtpTransport(app.config['MAIL_SERVER'], app.config['MAIL_PORT'],
+                                 app.config['MAIL_DEFAULT_SENDER'], app.config['MAIL_USERNAME'],
+                                 app.config['MAIL_PASSWORD'], app.config['MAIL_USE_TLS'])
+    else:
+        email_transport = LogTransport
+    
+    # Шлюз SMS не подключен - отправка SMS имитируется
+    return {'email': email_transport, 'sms': LogTransport}
+
+def expiry_notification_message(channel, policy, vehicle, client, current_date, template=None):
+    """Сообщение об окончании срока действия полиса для указанного канала"""
+    if template is None:
+        template = notification_templates.get(EXPIRY_EMAIL_TEMPLATE if channel == 'email'
+                                              else EXPIRY_SMS_TEMPLATE)
+    return {
+        'policy_id': policy.id,
+        'channel': channel,
+        'recipient': client.email if channel == 'email' else client.phone,
+        'subject': f"Срок действия полиса ОСАГО {policy.number} заканчивается",
+        'body': template.render(notification_context(policy, vehicle, client, current_date))
+    }
+
+def record_notification_results(results, job_id=None):
+    """Добавляет в сессию записи журнала уведомлений (фиксируются вызывающим кодом)"""
+    if results:
+        db.session.execute(db.insert(NotificationLog), [
+            {'policy_id': result['policy_id'], 'channel': result['channel'],
+             'recipient': result['recipient'], 'status': result['status'],
+             'error': result['error'], 'job_id': job_id, 'created_at': datetime.now()}
+            for result in results
+        ])
+
+def dispatch_notifications(batches):
+    """Отправляет порции сообщений и записывает результаты в журнал, возвращает результаты"""
+    delivered = []
+    
+    def on_batch(results):
+        with app.app_context():
+            record_notification_results(results)
+            db.session.commit()
+        delivered.extend(results)
     
-    put_buttons(['Отправить массовые уведомления', 'В главное меню'], 
-              [send_mass_notifications, lambda: main_menu(_thread_locals.username)])
+    NotificationDispatcher(notification_transports(), app.config['NOTIFICATION_CONCURRENCY']).run(
+        batches, on_batch)
+    return delivered
 
+@query_stats.track_screen
 def send_expiry_notification(policy, client, vehicle):
     """
     Функция для отправки уведомления об истекающем полисе
@@ -1367,68 +1728,45 @@ def send_expiry_notification(policy, client, vehicle):
     
     if method == 'email':
         try:
-            # Здесь будет код для отправки email с использованием flask-mail
-            # В данной реализации покажем шаблон уведомления
+            message = expiry_notification_message('email', policy, vehicle, client, current_date)
+            result = dispatch_notifications([[message]])[0]
             
-            # Подготовка HTML шаблона
-            import os
-            template_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'notification_template.html')
-            
-            if os.path.exists(template_path):
-                with open(template_path, 'r', encoding='utf-8') as f:
-                    template = f.read()
-                    
-                # Заполнение данных шаблона
-                email_html = template.replace('{{client_name}}', client.full_name)
-                email_html = email_html.replace('{{policy_number}}', policy.number)
-                email_html = email_html.replace('{{expiry_date}}', policy.end_date.strftime('%d.%m.%Y'))
-                email_html = email_html.replace('{{days_left}}', str(days_left))
-                email_html = email_html.replace('{{vehicle_name}}', f"{vehicle.brand} {vehicle.model}")
-                email_html = email_html.replace('{{reg_number}}', vehicle.reg_number)
-                email_html = email_html.replace('{{start_date}}', policy.start_date.strftime('%d.%m.%Y'))
-                email_html = email_html.replace('{{end_date}}', policy.end_date.strftime('%d.%m.%Y'))
-                
+            if result['status'] == 'sent':
                 put_success(f"Уведомление успешно отправлено на адрес {client.email}")
                 put_markdown("## Предварительный просмотр отправленного уведомления:")
-                put_html(email_html)
+                put_html(message['body'])
             else:
-                put_error("Шаблон уведомления не найден")
-                put_warning(f"Имитация отправки email на адрес {client.email}")
-                put_success("Уведомление об истечении срока действия полиса успешно отправлено")
+                put_error(f"Ошибка при отправке уведомления: {result['error']}")
+            
+        except TemplateNotFound:
+            put_error("Шаблон уведомления не найден")
+            put_warning(f"Имитация отправки email на адрес {client.email}")
+            put_success("Уведомление об истечении срока действия полиса успешно отправлено")
                 
         except Exception as e:
             put_error(f"Ошибка при отправке уведомления: {str(e)}")
     
     elif method == 'sms':
-        # Имитация отправки SMS
-        put_success(f"SMS-уведомление успешно отправлено на номер {client.phone}")
-        put_markdown(f"""
-## Текст SMS:
-Уважаемый(ая) {client.full_name}, срок действия Вашего полиса ОСАГО {policy.number} заканчивается {policy.end_date.strftime('%d.%m.%Y')} (через {days_left} дн.). Для оформления нового полиса обратитесь в нашу компанию.
-        """)
+        try:
+            message = expiry_notification_message('sms', policy, vehicle, client, current_date)
+            result = dispatch_notifications([[message]])[0]
+            
+            if result['status'] == 'sent':
+                put_success(f"SMS-уведомление успешно отправлено на номер {client.phone}")
+                put_markdown(f"## Текст SMS:\n{message['body']}")
+            else:
+                put_error(f"Ошибка при отправке SMS: {result['error']}")
+        except Exception as e:
+            put_error(f"Ошибка при отправке уведомления: {str(e)}")
     
     elif method == 'preview':
-        # Подготовка HTML шаблона
-        import os
-        template_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'notification_template.html')
-        
-        if os.path.exists(template_path):
-            with open(template_path, 'r', encoding='utf-8') as f:
-                template = f.read()
-                
-            # Заполнение данных шаблона
-            email_html = template.replace('{{client_name}}', client.full_name)
-            email_html = email_html.replace('{{policy_number}}', policy.number)
-            email_html = email_html.replace('{{expiry_date}}', policy.end_date.strftime('%d.%m.%Y'))
-            email_html = email_html.replace('{{days_left}}', str(days_left))
-            email_html = email_html.replace('{{vehicle_name}}', f"{vehicle.brand} {vehicle.model}")
-            email_html = email_html.replace('{{reg_number}}', vehicle.reg_number)
-            email_html = email_html.replace('{{start_date}}', policy.start_date.strftime('%d.%m.%Y'))
-            email_html = email_html.replace('{{end_date}}', policy.end_date.strftime('%d.%m.%Y'))
+        try:
+            email_html = notification_templates.render(
+                EXPIRY_EMAIL_TEMPLATE, notification_context(policy, vehicle, client, current_date))
             
             put_markdown("## Предварительный просмотр уведомления:")
             put_html(email_html)
-        else:
+        except TemplateNotFound:
             put_error("Шаблон уведомления не найден")
             put_markdown(f"""
 ## Предварительный просмотр уведомления:
@@ -1454,6 +1792,7 @@ def send_expiry_notification(policy, client, vehicle):
     
     put_button("Назад", onclick=lambda: check_expiring_policies())
 
+@query_stats.track_screen
 def send_mass_notifications():
     """
     Функция для массовой отправки уведомлений об истекающих полисах
@@ -1462,18 +1801,14 @@ def send_mass_notifications():
     put_markdown("# Массовая отправка уведомлений")
     
     with app.app_context():
+        if scanner_state() is None:
+            expiry_scanner.run_once()
+        
         current_date = datetime.now()
         
         # Полисы, срок действия которых заканчивается в ближайшие 30 дней
-        expiring_policies = (Policy.query
-                            .filter(Policy.status == 'active')
-                            .filter(Policy.end_date > current_date)
-                            .filter(Policy.end_date < (current_date + timedelta(days=30)))
-                            .join(Policy.vehicle)
-                            .join(Vehicle.client)
-                            .add_entity(Vehicle)
-                            .add_entity(Client)
-                            .all())
+        # (из таблицы, которую поддерживает планировщик)
+        expiring_policies = expiring_policy_rows(current_date)
     
     if not expiring_policies:
         put_warning("Нет полисов, требующих уведомления")
@@ -1529,41 +1864,129 @@ def send_mass_notifications():
                          ["Отправить", "Отменить"])
     
     if confirmation == "Отправить":
-        # Имитация процесса отправки
-        import time
-        
-        put_markdown("## Процесс отправки уведомлений")
-        put_processbar('sending', 0, 'Отправка...')
-        
-        emails_sent = 0
-        sms_sent = 0
-        
-        for i, (policy, vehicle, client) in enumerate(filtered_policies):
-            time.sleep(0.1)  # Имитация задержки для наглядности
-            set_processbar('sending', (i + 1) / len(filtered_policies))
-            
-            methods_used = []
-            if 'email' in notification_settings['methods'] and client.email:
-                # Здесь будет реальная отправка email
-                emails_sent += 1
-                methods_used.append(f"email: {client.email}")
-            
-            if 'sms' in notification_settings['methods'] and client.phone:
-                # Здесь будет реальная отправка SMS
-                sms_sent += 1
-                methods_used.append(f"SMS: {client.phone}")
+        # Рассылка выполняется фоновым заданием и не прерывается при закрытии страницы
+        job_id = job_queue.submit('mass_notifications', {
+            'methods': notification_settings['methods'],
+            'min_days': notification_settings['min_days'],
+            'max_days': notification_settings['max_days'],
+            'current_date': current_date.isoformat()
+        }, created_by=get_username())
+        show_job_progress(job_id, on_back=check_expiring_policies)
+        return
+    
+    put_button("Назад", onclick=lambda: check_expiring_policies())
+
+@job_handler('mass_notifications', 'Массовая отправка уведомлений')
+@query_stats.track_job
+def mass_notifications_job(job):
+    """
+    Фоновое задание массовой рассылки: ставит уведомления в очередь
+    (уже отправленные ранее пропускаются) и отправляет готовые к отправке
+    """
+    params = job.params
+    checkpoint = job.checkpoint
+    if checkpoint is None:
+        # Постановка в очередь идемпотентна, поэтому после сбоя задание
+        # продолжает с отправки и не создает дубликатов
+        queued = enqueue_expiry_notifications(datetime.fromisoformat(params['current_date']),
+                                              params['methods'], params['min_days'], params['max_days'],
+                                              app.config['NOTIFICATION_WINDOWS'])
+        checkpoint = {'queued': queued}
+    return deliver_notification_outbox(job, checkpoint)
+
+@job_handler('notification_outbox', 'Отправка уведомлений из очереди')
+@query_stats.track_job
+def notification_outbox_job(job):
+    """Фоновое задание отправки уведомлений, ожидающих в очереди (в том числе повторных)"""
+    return deliver_notification_outbox(job, job.checkpoint or {})
+
+def deliver_notification_outbox(job, checkpoint):
+    """
+    Отправляет готовые уведомления из очереди порциями по возрастанию id.
+    Сообщения порции отправляются асинхронно (см. notification_dispatch.py),
+    после чего журнал отправки, состояние записей очереди и контрольная
+    точка задания сохраняются одной транзакцией.
+    """
+    now = datetime.now()
+    if 'total' not in checkpoint:
+        drop_stale_notifications(now)
+        checkpoint = dict(checkpoint, last_id=0, processed=0, total=count_due_notifications(now),
+                          emails_sent=0, sms_sent=0, failed=0)
+        job.report(0, checkpoint)
+    
+    # Шаблоны компилируются один раз на всю рассылку
+    templates = {'email': notification_templates.get(EXPIRY_EMAIL_TEMPLATE),
+                 'sms': notification_templates.get(EXPIRY_SMS_TEMPLATE)}
+    # Последняя запись очереди, отданная на отправку
+    position = {}
+    
+    def message_batches():
+        while True:
+            chunk = due_notifications(now, checkpoint['last_id'], app.config['EXPORT_CHUNK_SIZE'])
+            if not chunk:
+                return
             
-            if methods_used:
-                put_text(f"Отправлено уведомление клиенту {client.full_name} ({', '.join(methods_used)})")
-        
-        clear()
-        put_markdown("# Результаты отправки уведомлений")
-        put_success(f"Отправка завершена. Всего отправлено {emails_sent + sms_sent} уведомлений.")
-        put_markdown(f"- По email: {emails_sent}")
-        put_markdown(f"- По SMS: {sms_sent}")
+            messages = []
+            for outbox, policy, vehicle, client in chunk:
+                message = expiry_notification_message(outbox.channel, policy, vehicle, client, now,
+                                                      templates[outbox.channel])
+                messages.append(dict(message, outbox_id=outbox.id, attempts=outbox.attempts))
+            position['last_id'] = chunk[-1][0].id
+            yield messages
+    
+    def on_batch(results):
+        nonlocal checkpoint
+        record_notification_results(results, job.job_id)
+        record_delivery(results, datetime.now(), app.config['NOTIFICATION_MAX_ATTEMPTS'],
+                        app.config['NOTIFICATION_RETRY_DELAY'])
+        sent = [result['channel'] for result in results if result['status'] == 'sent']
+        checkpoint = dict(checkpoint, last_id=position['last_id'],
+                          processed=checkpoint['processed'] + len(results),
+                          emails_sent=checkpoint['emails_sent'] + sent.count('email'),
+                          sms_sent=checkpoint['sms_sent'] + sent.count('sms'),
+                          failed=checkpoint['failed'] + len(results) - len(sent))
+        job.report(checkpoint['processed'] / max(checkpoint['total'], checkpoint['processed'], 1) * 100,
+                   checkpoint)
+    
+    NotificationDispatcher(notification_transports(), app.config['NOTIFICATION_CONCURRENCY']).run(
+        message_batches(), on_batch)
+    
+    details = [f"По email: {checkpoint['emails_sent']}", f"По SMS: {checkpoint['sms_sent']}"]
+    if 'queued' in checkpoint:
+        details.insert(0, f"Новых уведомлений в очереди: {checkpoint['queued']} "
+                          f"(уже отправленные ранее пропущены)")
+    if checkpoint['failed']:
+        details.append(f"Не доставлено: {checkpoint['failed']} (будут отправлены повторно)")
+    return {
+        'message': f"Отправка завершена. Всего отправлено "
+                   f"{checkpoint['emails_sent'] + checkpoint['sms_sent']} уведомлений.",
+        'details': details
+    }
+
+@query_stats.track_screen
+def show_notification_outbox():
+    """Состояние очереди уведомлений и отправка ожидающих"""
+    clear()
+    put_markdown("# Очередь уведомлений")
+    
+    with app.app_context():
+        summary = outbox_summary()
+        due = count_due_notifications(datetime.now())
     
+    put_table([
+        ['Ожидают отправки', summary['pending']],
+        ['Из них готовы к отправке сейчас', due],
+        ['Отправлены', summary['sent']],
+        ['Не доставлены', summary['failed']]
+    ])
+    
+    if due:
+        put_button("Отправить ожидающие уведомления", onclick=lambda: show_job_progress(
+            job_queue.submit('notification_outbox', created_by=get_username()),
+            on_back=show_notification_outbox))
     put_button("Назад", onclick=lambda: check_expiring_policies())
 
+@query_stats.track_screen
 def show_statistics():
     """
     Отображение статистики по полисам ОСАГО
@@ -1572,429 +1995,423 @@ def show_statistics():
     put_markdown("# Статистика и аналитика")
     
     with app.app_context():
-        current_date = datetime.now()
-        
-        # Общие данные о полисах
-        total_policies = Policy.query.count()
-        active_policies = Policy.query.filter_by(status='active').filter(Policy.end_date >= current_date).count()
-        cancelled_policies = Policy.query.filter_by(status='cancelled').count()
-        expired_policies = Policy.query.filter(Policy.status == 'active', Policy.end_date < current_date).count()
-        
-        # Общая сумма по полисам
-        total_sum = db.session.query(db.func.sum(Policy.cost)).scalar() or 0
-        active_sum = db.session.query(db.func.sum(Policy.cost)).filter_by(status='active').filter(Policy.end_date >= current_date).scalar() or 0
-        
-        # Количество полисов по периодам (3, 6, 12 месяцев)
-        period_data = {}
-        all_policies = Policy.query.all()
-        for policy in all_policies:
-            days = (policy.end_date - policy.start_date).days
-            if days <= 100:  # ~3 месяца
-                period = "3 месяца"
-            elif days <= 190:  # ~6 месяцев
-                period = "6 месяцев"
-            else:
-                period = "12 месяцев"
-            
-            period_data[period] = period_data.get(period, 0) + 1
+        # Все показатели, включая распределение по срокам, - одним запросом
+        stats = collect_policy_statistics()
+    
+    total_policies = stats['total']
     
     # Отображаем основную статистику
     put_markdown("## Общая статистика по полисам")
     stats_table = [
         ['Всего полисов', total_policies],
-        ['Действующие полисы', active_policies],
-        ['Отмененные полисы', cancelled_policies],
-        ['Истекшие полисы', expired_policies],
-        ['Общая сумма всех полисов', f"{round(total_sum, 2)} руб."],
-        ['Общая сумма действующих полисов', f"{round(active_sum, 2)} руб."]
+        ['Действующие полисы', stats['active']],
+        ['Отмененные полисы', stats['cancelled']],
+        ['Истекшие полисы', stats['expired']],
+        ['Общая сумма всех полисов', f"{round(stats['total_sum'], 2)} руб."],
+        ['Общая сумма действующих полисов', f"{round(stats['active_sum'], 2)} руб."]
     ]
     put_table(stats_table)
     
     # Отображаем статистику по периодам
     put_markdown("## Распределение полисов по срокам")
     period_table = [['Период', 'Количество полисов', 'Процент']]
-    for period, count in period_data.items():
+    for period, count in stats['periods'].items():
         percent = round(count / total_policies * 100, 2) if total_policies > 0 else 0
         period_table.append([period, count, f"{percent}%"])
     put_table(period_table)
     
     # Кнопки для дополнительных действий
     put_markdown("## Дополнительные отчеты и анализ")
-    put_buttons(['Графическая статистика', 'Экспорт в CSV', 'PDF-отчет'], 
+    put_buttons(['Графическая статистика', 'Экспорт в CSV', 'Экспорт в Parquet', 'PDF-отчет'], 
                [show_graphic_statistics, 
                 export_statistics_to_csv, 
+                export_statistics_to_parquet, 
                 generate_statistics_report_pdf])
     
     put_button("В главное меню", onclick=lambda: main_menu(_thread_locals.username))
 
+@query_stats.track_screen
 def show_graphic_statistics():
     """
     Отображение графической статистики по полисам ОСАГО
     """
+    clear()
+    put_markdown("# Графическая статистика")
+    
+    # Проверяем наличие библиотеки до построения графика
+    if importlib.util.find_spec('matplotlib') is None:
+        put_error("Для отображения графиков требуется установить библиотеку matplotlib")
+        put_markdown("Выполните команду: `pip install matplotlib`")
+    else:
+        show_statistics_chart()
+    
+    put_buttons(['Экспорт в CSV', 'Экспорт в Parquet', 'PDF-отчет'], 
+               [export_statistics_to_csv, 
+                export_statistics_to_parquet, 
+                generate_statistics_report_pdf])
+    put_button("Назад", onclick=lambda: show_statistics())
+
+def show_statistics_chart():
+    """Выводит график статистики (из кэша или построенный в пуле отрисовки)"""
     try:
-        import matplotlib.pyplot as plt
-        import io
-        import base64
-        from matplotlib.figure import Figure
-        from matplotlib.backends.backend_agg import FigureCanvasAgg
-        
-        clear()
-        put_markdown("# Графическая статистика")
-        
         with app.app_context():
-            current_date = datetime.now()
-            
-            # Данные для круговой диаграммы статусов полисов
-            active_policies = Policy.query.filter_by(status='active').filter(Policy.end_date >= current_date).count()
-            cancelled_policies = Policy.query.filter_by(status='cancelled').count()
-            expired_policies = Policy.query.filter(Policy.status == 'active', Policy.end_date < current_date).count()
-            
-            # Данные для диаграммы по периодам полисов
-            period_data = {}
-            all_policies = Policy.query.all()
-            for policy in all_policies:
-                days = (policy.end_date - policy.start_date).days
-                if days <= 100:  # ~3 месяца
-                    period = "3 месяца"
-                elif days <= 190:  # ~6 месяцев
-                    period = "6 месяцев"
-                else:
-                    period = "12 месяцев"
-                
-                period_data[period] = period_data.get(period, 0) + 1
-                
-            # Данные по месяцам
-            monthly_data = {}
-            for policy in all_policies:
-                month = policy.created_at.strftime('%Y-%m')
-                monthly_data[month] = monthly_data.get(month, 0) + 1
-            
-            # Отсортированные данные по месяцам для графика
-            sorted_months = sorted(monthly_data.keys())
-            monthly_counts = [monthly_data[month] for month in sorted_months]
+            stats = collect_policy_statistics()
         
-        # Создаем фигуру с тремя диаграммами
-        fig = Figure(figsize=(15, 10))
-        fig.subplots_adjust(hspace=0.4)  # Добавляем вертикальное пространство между графиками
-        
-        # 1. Круговая диаграмма статусов полисов
-        ax1 = fig.add_subplot(2, 2, 1)
-        status_labels = ['Активные', 'Отмененные', 'Истекшие']
-        status_values = [active_policies, cancelled_policies, expired_policies]
-        status_colors = ['#4CAF50', '#F44336', '#FFC107']
-        
-        # Исключаем нулевые значения для лучшего отображения
-        non_zero_labels = []
-        non_zero_values = []
-        non_zero_colors = []
-        for i, val in enumerate(status_values):
-            if val > 0:
-                non_zero_labels.append(status_labels[i])
-                non_zero_values.append(val)
-                non_zero_colors.append(status_colors[i])
-                
-        if sum(non_zero_values) > 0:
-            ax1.pie(non_zero_values, labels=non_zero_labels, colors=non_zero_colors, autopct='%1.1f%%', startangle=90)
-            ax1.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
-            ax1.set_title('Распределение полисов по статусам')
-        else:
-            ax1.text(0.5, 0.5, 'Нет данных для отображения', horizontalalignment='center', verticalalignment='center')
-            
-        # 2. Столбчатая диаграмма периодов полисов
-        ax2 = fig.add_subplot(2, 2, 2)
-        periods = list(period_data.keys())
-        counts = list(period_data.values())
-        
-        if periods and counts:
-            bars = ax2.bar(periods, counts, color='#2196F3')
-            ax2.set_title('Распределение полисов по периодам')
-            ax2.set_ylabel('Количество полисов')
-            ax2.set_xlabel('Период')
-            
-            # Добавляем подписи с количеством над столбцами
-            for bar in bars:
-                height = bar.get_height()
-                ax2.text(bar.get_x() + bar.get_width()/2., height + 0.1,
-                         f'{int(height)}',
-                         ha='center', va='bottom')
-        else:
-            ax2.text(0.5, 0.5, 'Нет данных для отображения', horizontalalignment='center', verticalalignment='center')
-            
-        # 3. График динамики оформления полисов по месяцам
-        ax3 = fig.add_subplot(2, 1, 2)
-        
-        if sorted_months and monthly_counts:
-            # Упрощаем названия месяцев для отображения
-            display_months = [month.split('-')[1] + '/' + month.split('-')[0][2:] for month in sorted_months]
-            
-            ax3.plot(display_months, monthly_counts, marker='o', linestyle='-', color='#673AB7')
-            ax3.set_title('Динамика оформления полисов по месяцам')
-            ax3.set_ylabel('Количество полисов')
-            ax3.set_xlabel('Месяц/Год')
-            ax3.grid(True, linestyle='--', alpha=0.7)
-            
-            # Поворачиваем подписи по оси X для лучшей читаемости
-            ax3.tick_params(axis='x', rotation=45)
-            
-            # Добавляем точные значения над точками графика
-            for i, count in enumerate(monthly_counts):
-                ax3.annotate(str(count), (display_months[i], monthly_counts[i]), 
-                            textcoords="offset points", 
-                            xytext=(0,10), 
-                            ha='center')
-        else:
-            ax3.text(0.5, 0.5, 'Нет данных для отображения', horizontalalignment='center', verticalalignment='center')
-            
-        # Сохраняем изображение в память и конвертируем в base64
-        canvas = FigureCanvasAgg(fig)
-        buf = io.BytesIO()
-        canvas.print_png(buf)
-        data = base64.b64encode(buf.getbuffer()).decode("ascii")
+        # График строится только при изменении агрегированных данных,
+        # иначе берется готовый PNG из кэша
+        fingerprint = chart_cache.get_or_render(
+            chart_data_from_statistics(stats),
+            render=lambda data: render_service.run(render_statistics_chart, data)
+        )
         
         # Отображаем изображение
         put_markdown("## Визуализация статистики по полисам")
-        put_html(f"<img src='data:image/png;base64,{data}' style='width:100%;'>")
-        
-    except ImportError:
-        put_error("Для отображения графиков требуется установить библиотеку matplotlib")
-        put_markdown("Выполните команду: `pip install matplotlib`")
+        put_html(f"<img src='/charts/{fingerprint}.png' style='width:100%;'>")
         
     except Exception as e:
         put_error(f"Ошибка при создании графиков: {str(e)}")
-    
-    put_buttons(['Экспорт в CSV', 'PDF-отчет'], 
-               [export_statistics_to_csv, 
-                generate_statistics_report_pdf])
-    put_button("Назад", onclick=lambda: show_statistics())
 
+@query_stats.track_screen
 def export_statistics_to_csv():
     """
     Экспорт статистики по полисам в CSV-файл
     """
+    # Выгрузка выполняется фоновым заданием и продолжается после сбоя
+    job_id = job_queue.submit('export_csv', {
+        'current_date': datetime.now().isoformat()
+    }, created_by=get_username())
+    show_job_progress(job_id, on_back=show_statistics)
+
+@job_handler('export_csv', 'Экспорт полисов в CSV')
+@query_stats.track_job
+def export_csv_job(job):
+    """Фоновое задание выгрузки полисов в CSV с контрольной точкой после каждой порции"""
+    current_date = datetime.fromisoformat(job.params['current_date'])
+    # Номер задания в имени файла: одновременные выгрузки не перезаписывают
+    # друг друга, а возобновленное задание продолжает свой файл
+    file_name = f"policies_export_{current_date.strftime('%Y-%m-%d')}_{job.job_id}.csv"
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], file_name)
+    
     try:
-        import csv
-        import tempfile
-        import os
-        import pandas as pd
-        from datetime import date
-        
+        exported = write_policy_export_csv_resumable(file_path, current_date,
+                                                     app.config['EXPORT_CHUNK_SIZE'],
+                                                     job.checkpoint, job.report)
+    except JobCancelled:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    
+    if not exported:
+        os.remove(file_path)
+        return {'error': "Нет данных для экспорта"}
+    
+    file_storage.register_file(file_path)
+    
+    return {
+        'message': f"Данные успешно экспортированы в CSV (полисов: {exported})",
+        'download_url': f"/download/files/{file_name}",
+        'link_text': "Скачать CSV-файл"
+    }
+
+@query_stats.track_screen
+def export_statistics_to_parquet():
+    """
+    Экспорт полисов в Parquet с типизированными столбцами для аналитики
+    """
+    # Проверяем наличие библиотеки до постановки задания
+    if importlib.util.find_spec('pyarrow') is None:
         clear()
-        put_markdown("# Экспорт статистики в CSV")
-        
-        with app.app_context():
-            current_date = datetime.now()
-            
-            # Получаем данные о полисах
-            policies = Policy.query.all()
-            
-            # Создаем DataFrame для полисов
-            policy_data = []
-            for policy in policies:
-                vehicle = db.session.get(Vehicle, policy.vehicle_id)
-                client = db.session.get(Client, vehicle.client_id) if vehicle else None
-                
-                # Определяем текущий статус
-                if policy.status == 'cancelled':
-                    status = 'Отменен'
-                elif policy.end_date < current_date:
-                    status = 'Истек'
-                else:
-                    status = 'Активен'
-                    
-                policy_data.append({
-                    'Номер полиса': policy.number,
-                    'Статус': status,
-                    'Дата создания': policy.created_at.strftime('%d.%m.%Y'),
-                    'Дата начала': policy.start_date.strftime('%d.%m.%Y'),
-                    'Дата окончания': policy.end_date.strftime('%d.%m.%Y'),
-                    'Стоимость': policy.cost,
-                    'Марка ТС': vehicle.brand if vehicle else '',
-                    'Модель ТС': vehicle.model if vehicle else '',
-                    'Гос. номер': vehicle.reg_number if vehicle else '',
-                    'Владелец': client.full_name if client else ''
-                })
-        
-        if not policy_data:
-            put_error("Нет данных для экспорта")
-            put_button("Назад", onclick=lambda: show_statistics())
-            return
-            
-        # Создаем DataFrame и сохраняем в CSV
-        df = pd.DataFrame(policy_data)
-          # Создаем файл в папке для загрузок
-        current_date_str = date.today().strftime('%Y-%m-%d')
-        file_name = f"policies_export_{current_date_str}.csv"
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], file_name)
-        
-        # Сохраняем DataFrame в CSV
-        df.to_csv(file_path, index=False, encoding='utf-8-sig')
-          # Создаем ссылку для скачивания прямо из статической директории
-        filename = f"policies_export_{current_date_str}.csv"
-        download_url = f"/download/files/{filename}"
-        put_success("Данные успешно экспортированы в CSV")
-        put_markdown(f"[Скачать CSV-файл]({download_url})")
-        
-    except ImportError:
-        put_error("Для экспорта в CSV требуется установить библиотеку pandas")
-        put_markdown("Выполните команду: `pip install pandas`")
-        
-    except Exception as e:
-        put_error(f"Ошибка при экспорте данных: {str(e)}")
+        put_error("Для экспорта в Parquet требуется установить библиотеку pyarrow")
+        put_markdown("Выполните команду: `pip install pyarrow`")
+        put_button("Назад", onclick=lambda: show_statistics())
+        return
     
-    put_button("Назад", onclick=lambda: show_statistics())
+    # Выгрузка выполняется фоновым заданием, как и выгрузка в CSV
+    job_id = job_queue.submit('export_parquet', {
+        'current_date': datetime.now().isoformat()
+    }, created_by=get_username())
+    show_job_progress(job_id, on_back=show_statistics)
+
+@job_handler('export_parquet', 'Экспорт полисов в Parquet')
+@query_stats.track_job
+def export_parquet_job(job):
+    """Фоновое задание выгрузки полисов в Parquet (после сбоя выполняется заново)"""
+    current_date = datetime.fromisoformat(job.params['current_date'])
+    # Номер задания в имени файла: одновременные выгрузки не перезаписывают друг друга
+    file_name = f"policies_export_{current_date.strftime('%Y-%m-%d')}_{job.job_id}.parquet"
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], file_name)
+    
+    try:
+        # Полисы читаются порциями и пишутся группами строк
+        exported = write_policy_export_parquet(file_path, current_date, app.config['EXPORT_CHUNK_SIZE'],
+                                               on_chunk=job.report)
+    except JobCancelled:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    
+    if not exported:
+        os.remove(file_path)
+        return {'error': "Нет данных для экспорта"}
+    
+    file_storage.register_file(file_path)
+    
+    return {
+        'message': f"Данные успешно экспортированы в Parquet (полисов: {exported})",
+        'download_url': f"/download/files/{file_name}",
+        'link_text': "Скачать Parquet-файл"
+    }
 
+@query_stats.track_screen
 def generate_statistics_report_pdf():
     """
     Генерация PDF-отчета со статистикой по полисам
     """
-    try:
-        from fpdf import FPDF
-        import tempfile
-        import os
-        from datetime import date
-        
+    # Проверяем наличие библиотеки до постановки задания
+    if importlib.util.find_spec('fpdf') is None:
         clear()
-        put_markdown("# Генерация PDF-отчета")
-        
-        with app.app_context():
-            current_date = datetime.now()
-            
-            # Общие данные о полисах
-            total_policies = Policy.query.count()
-            active_policies = Policy.query.filter_by(status='active').filter(Policy.end_date >= current_date).count()
-            cancelled_policies = Policy.query.filter_by(status='cancelled').count()
-            expired_policies = Policy.query.filter(Policy.status == 'active', Policy.end_date < current_date).count()
-            
-            # Общая сумма по полисам
-            total_sum = db.session.query(db.func.sum(Policy.cost)).scalar() or 0
-            active_sum = db.session.query(db.func.sum(Policy.cost)).filter_by(status='active').filter(Policy.end_date >= current_date).scalar() or 0
-            
-            # Количество полисов по периодам (3, 6, 12 месяцев)
-            period_data = {}
-            all_policies = Policy.query.all()
-            for policy in all_policies:
-                days = (policy.end_date - policy.start_date).days
-                if days <= 100:  # ~3 месяца
-                    period = "3 месяца"
-                elif days <= 190:  # ~6 месяцев
-                    period = "6 месяцев"
-                else:
-                    period = "12 месяцев"
-                
-                period_data[period] = period_data.get(period, 0) + 1
-            
-            # Данные по месяцам
-            monthly_data = {}
-            for policy in all_policies:
-                month = policy.created_at.strftime('%Y-%m')
-                monthly_data[month] = monthly_data.get(month, 0) + 1
-            
-            # Последние 10 полисов
-            recent_policies = (Policy.query
-                              .join(Policy.vehicle)
-                              .join(Vehicle.client)
-                              .add_entity(Vehicle)
-                              .add_entity(Client)
-                              .order_by(Policy.created_at.desc())
-                              .limit(10)
-                              .all())
-          # Создаем PDF документ с поддержкой кириллицы
-        pdf = FPDF()
-        # Добавляем кириллический шрифт (обычный и полужирный)
-        font_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts', 'arial.ttf')
-        pdf.add_font('CustomFont', '', font_path)
-        pdf.add_font('CustomFont', 'B', font_path)
-        pdf.add_page()
-        
-        # Добавляем шапку
-        pdf.set_font("CustomFont", "B", 16)
-        pdf.cell(0, 10, "СТАТИСТИЧЕСКИЙ ОТЧЕТ ПО ПОЛИСАМ ОСАГО", 0, 1, 'C')
-        pdf.cell(0, 10, f"Дата формирования: {current_date.strftime('%d.%m.%Y')}", 0, 1, 'C')
-        pdf.ln(10)
-          # Общая статистика
-        pdf.set_font("CustomFont", "B", 14)
-        pdf.cell(0, 10, "1. Общая статистика по полисам", 0, 1)
-        pdf.set_font("CustomFont", "", 12)
-        pdf.cell(0, 8, f"Всего полисов: {total_policies}", 0, 1)
-        pdf.cell(0, 8, f"Действующие полисы: {active_policies}", 0, 1)
-        pdf.cell(0, 8, f"Отмененные полисы: {cancelled_policies}", 0, 1)
-        pdf.cell(0, 8, f"Истекшие полисы: {expired_policies}", 0, 1)
-        pdf.cell(0, 8, f"Общая сумма всех полисов: {round(total_sum, 2)} руб.", 0, 1)
-        pdf.cell(0, 8, f"Общая сумма действующих полисов: {round(active_sum, 2)} руб.", 0, 1)
-        pdf.ln(5)
-        
-        # Распределение по периодам
-        pdf.set_font("CustomFont", "B", 14)
-        pdf.cell(0, 10, "2. Распределение полисов по срокам", 0, 1)
-        pdf.set_font("CustomFont", "", 12)
-        for period, count in period_data.items():
-            percent = round(count / total_policies * 100, 2) if total_policies > 0 else 0
-            pdf.cell(0, 8, f"{period}: {count} полисов ({percent}%)", 0, 1)
-        pdf.ln(5)
-        
-        # Последние оформленные полисы
-        pdf.set_font("CustomFont", "B", 14)
-        pdf.cell(0, 10, "3. Последние оформленные полисы", 0, 1)
-        pdf.set_font("CustomFont", "", 10)
-        
-        if recent_policies:
-            # Заголовки таблицы
-            pdf.cell(40, 8, "Номер полиса", 1, 0, 'C')
-            pdf.cell(50, 8, "Владелец", 1, 0, 'C')
-            pdf.cell(40, 8, "ТС", 1, 0, 'C')
-            pdf.cell(30, 8, "Стоимость", 1, 0, 'C')
-            pdf.cell(30, 8, "Дата", 1, 1, 'C')
-            
-            # Данные таблицы
-            for policy, vehicle, client in recent_policies:
-                pdf.cell(40, 8, policy.number, 1, 0)
-                pdf.cell(50, 8, client.full_name[:25], 1, 0)  # Ограничиваем длину имени
-                pdf.cell(40, 8, f"{vehicle.brand} {vehicle.model}"[:20], 1, 0)
-                pdf.cell(30, 8, f"{policy.cost} руб.", 1, 0)
-                pdf.cell(30, 8, policy.created_at.strftime('%d.%m.%Y'), 1, 1)
-        else:
-            pdf.cell(0, 8, "Нет данных о полисах", 0, 1)
-          # Создаем файл в папке для загрузок
-        current_date_str = date.today().strftime('%Y-%m-%d')
-        file_name = f"policies_report_{current_date_str}.pdf"
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], file_name)
-        
-        try:
-            # Сохраняем PDF в файл
-            pdf.output(file_path)
-            put_success("PDF-отчет успешно создан")
-              # Создаем ссылку для скачивания прямо из статической директории
-            filename = f"policies_report_{current_date_str}.pdf"
-            download_url = f"/download/files/{filename}"
-            put_markdown(f"[Скачать отчет {current_date_str}.pdf]({download_url})")
-            
-        except Exception as e:
-            put_error(f"Ошибка при создании PDF: {str(e)}")
-        
-    except ImportError:
         put_error("Для создания PDF требуется установить библиотеку fpdf2.")
         put_markdown("Выполните команду: `pip install fpdf2`")
+        put_button("Назад", onclick=lambda: show_statistics())
+        return
     
-    put_button("Назад", onclick=lambda: show_statistics())
+    job_id = job_queue.submit('statistics_report', {'current_date': datetime.now().isoformat()},
+                              created_by=get_username())
+    show_job_progress(job_id, on_back=show_statistics)
+
+@job_handler('statistics_report', 'PDF-отчет со статистикой')
+@query_stats.track_job
+def statistics_report_job(job):
+    """Фоновое задание формирования PDF-отчета со статистикой"""
+    current_date = datetime.fromisoformat(job.params['current_date'])
+    stats = collect_policy_statistics(current_date)
+    
+    # Последние 10 полисов (только нужные столбцы)
+    recent_policies = (db.session.query(Policy.number, Client.full_name, Vehicle.brand,
+                                        Vehicle.model, Policy.cost, Policy.created_at)
+                      .join(Policy.vehicle)
+                      .join(Vehicle.client)
+                      .order_by(Policy.created_at.desc())
+                      .limit(10)
+                      .all())
+    job.report(30)
+    
+    report = statistics_report_data(stats, recent_policies, current_date)
+    
+    # Создаем файл в папке для загрузок; номер задания в имени файла:
+    # одновременные отчеты не перезаписывают друг друга
+    current_date_str = current_date.strftime('%Y-%m-%d')
+    file_name = f"policies_report_{current_date_str}_{job.job_id}.pdf"
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], file_name)
+    
+    # Отчет формируется в пуле процессов отрисовки
+    render_service.run(render_statistics_report, report, file_path)
+    file_storage.register_file(file_path)
+    
+    return {
+        'message': "PDF-отчет успешно создан",
+        'download_url': f"/download/files/{file_name}",
+        'link_text': f"Скачать отчет {current_date_str}.pdf"
+    }
+
+def show_job_result(job):
+    """Отображает итог завершенного фонового задания"""
+    if job['status'] == 'cancelled':
+        put_warning("Задача отменена")
+    elif job['status'] == 'failed':
+        put_error(f"Ошибка при выполнении задачи: {job['error']}")
+    elif job['result'] and job['result'].get('error'):
+        put_error(job['result']['error'])
+    elif job['result']:
+        put_success(job['result']['message'])
+        for line in job['result'].get('details', []):
+            put_markdown(f"- {line}")
+        if job['result'].get('download_url'):
+            put_markdown(f"[{job['result']['link_text']}]({job['result']['download_url']})")
+
+@query_stats.track_screen
+def show_job_progress(job_id, on_back=None):
+    """
+    Экран фонового задания: прогресс обновляется, пока задание не завершится.
+    Закрытие страницы не прерывает задание, его можно снова открыть
+    в разделе «Фоновые задачи».
+    """
+    if on_back is None:
+        on_back = show_jobs
+    job = job_queue.get(job_id)
+    
+    clear()
+    put_markdown(f"# {job['title']}")
+    put_markdown(f"Задача №{job_id} выполняется в фоновом режиме. "
+                 "Результат будет доступен в разделе «Фоновые задачи».")
+    put_processbar('job_progress', job['progress'] / 100)
+    put_scope('job_status')
+    with use_scope('job_actions'):
+        put_button("Отменить задачу", onclick=lambda: job_queue.cancel(job_id))
+    
+    while job['status'] not in FINISHED_STATUSES:
+        with use_scope('job_status', clear=True):
+            put_text(job['status_label'])
+        time.sleep(app.config['JOB_POLL_INTERVAL'])
+        job = job_queue.get(job_id)
+        set_processbar('job_progress', job['progress'] / 100)
+    
+    clear('job_status')
+    clear('job_actions')
+    show_job_result(job)
+    put_button("Назад", onclick=lambda: on_back())
+
+@query_stats.track_screen
+def show_jobs():
+    """Список последних фоновых задач"""
+    clear()
+    put_markdown("# Фоновые задачи")
+    
+    jobs = job_queue.list_jobs()
+    if not jobs:
+        put_info("Фоновых задач пока нет")
+    else:
+        jobs_table = [['№', 'Задача', 'Статус', 'Прогресс', 'Создана', 'Пользователь', 'Действия']]
+        for job in jobs:
+            jobs_table.append([
+                job['id'],
+                job['title'],
+                job['status_label'],
+                f"{round(job['progress'])}%",
+                job['created_at'].strftime('%d.%m.%Y %H:%M'),
+                job['created_by'] or '-',
+                put_button("Открыть", onclick=lambda j_id=job['id']: show_job_progress(j_id), small=True)
+            ])
+        put_table(jobs_table)
+    
+    put_button("Обновить", onclick=lambda: show_jobs())
+    put_button("В главное меню", onclick=lambda: main_menu(_thread_locals.username))
+
+def reset_query_diagnostics():
+    query_stats.reset()
+    show_query_diagnostics()
+
+def put_query_summary(summaries, name_title, visit_title):
+    """Таблица сводки query_stats.snapshot() и самые затратные запросы каждой строки"""
+    summary_table = [[name_title, 'Выполнений', f'Запросов за {visit_title}', 'Макс. запросов',
+                      'Время в базе, мс', 'Среднее, мс', 'Макс., мс']]
+    for summary in summaries:
+        summary_table.append([
+            summary['screen'],
+            summary['visits'],
+            round(summary['queries'] / summary['visits'], 1),
+            summary['max_queries'],
+            round(summary['db_time'] * 1000, 1),
+            round(summary['db_time'] * 1000 / summary['visits'], 1),
+            round(summary['max_db_time'] * 1000, 1)
+        ])
+    put_table(summary_table)
+
+    put_text(f"Запрос, выполненный много раз за {visit_title}, обычно означает выборку N+1")
+    for summary in summaries:
+        statements_table = [['Запрос', 'Выполнений', f'Макс. за {visit_title}', 'Всего, мс', 'Макс., мс']]
+        for statement in summary['statements']:
+            statements_table.append([
+                put_code(statement['statement'], language='sql'),
+                statement['count'],
+                statement['max_per_visit'],
+                round(statement['db_time'] * 1000, 1),
+                round(statement['max_time'] * 1000, 1)
+            ])
+        put_collapse(f"{summary['screen']}: запросов {summary['queries']}", put_table(statements_table))
+
+def show_query_diagnostics():
+    """
+    Число SQL-запросов и время в базе по экранам и фоновым заданиям и
+    состояние пула отрисовки
+    (только для администратора)
+    """
+    clear()
+    put_markdown("# Диагностика запросов")
+
+    if not is_admin():
+        put_error("Раздел доступен только администратору")
+        put_button("В главное меню", onclick=go_to_main_menu)
+        return
+
+    screens = query_stats.snapshot()
+    if not screens:
+        put_info("Экраны еще не открывались с момента запуска или сброса статистики")
+    else:
+        put_markdown("## Экраны (по суммарному времени в базе)")
+        put_query_summary(screens, 'Экран', 'открытие')
+
+    # Фоновые задания учитываются отдельно, чтобы выгрузки не искажали сводку по экранам
+    jobs = query_stats.snapshot('job')
+    if jobs:
+        put_markdown("## Фоновые задания (по суммарному времени в базе)")
+        put_query_summary(jobs, 'Задание', 'запуск')
+
+    # Состояние пула отрисовки графиков и PDF (см. render_service.py)
+    render_stats = render_service.stats()
+    put_markdown("## Пул отрисовки")
+    put_table([
+        ['Процессов (запущено / максимум)', f"{render_stats['workers']} / {render_stats['max_workers']}"],
+        ['Заданий отправлено', render_stats['submitted']],
+        ['Выполнено', render_stats['completed']],
+        ['С ошибкой', render_stats['failed']],
+        ['Выполняются сейчас', render_stats['in_flight']],
+        ['Ожидают свободного процесса', render_stats['queued']]
+    ])
+    if render_stats['timings']:
+        timings_table = [['Задание', 'Выполнений', 'Среднее, мс', 'Макс., мс']]
+        for name, timing in render_stats['timings'].items():
+            timings_table.append([name, timing['count'], round(timing['avg'] * 1000, 1),
+                                  round(timing['max'] * 1000, 1)])
+        put_table(timings_table)
+
+    if app.config['QUERY_LOG_PATH']:
+        put_text(f"Журнал запросов: {app.config['QUERY_LOG_PATH']} "
+                 f"(медленные запросы - дольше {app.config['SLOW_QUERY_MS']} мс)")
+    put_buttons(['Обновить', 'Сбросить статистику'], [show_query_diagnostics, reset_query_diagnostics])
+    put_button("В главное меню", onclick=go_to_main_menu)
 
 # Настройка статических маршрутов для файлов
 @app.route('/download/files/<path:filename>', methods=['GET'])
 def download_file(filename):
     """Маршрут для скачивания файлов из статической директории"""
+    # Реестр файлов не отдается, даже если остался в папке от прежних версий
+    if os.path.basename(filename) == REGISTRY_FILE_NAME:
+        return "Файл не найден", 404
     try:
-        download_name = filename  # Имя файла при скачивании
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        download_name = os.path.basename(filename)  # Имя файла при скачивании
+        # safe_join не выпускает путь за пределы папки для загрузок
+        file_path = safe_join(app.config['UPLOAD_FOLDER'], filename)
         
         # Проверка существует ли файл
-        if os.path.exists(file_path) and os.path.isfile(file_path):
+        if file_path and os.path.isfile(file_path):
             return send_file(file_path, as_attachment=True, download_name=download_name)
         else:
             return "Файл не найден", 404
     except Exception as e:
         return f"Ошибка при скачивании файла: {str(e)}", 500
 
+@app.route('/charts/<fingerprint>.png', methods=['GET'])
+def chart_image(fingerprint):
+    """Маршрут для получения графика из кэша по отпечатку данных (вытесненный строится заново)"""
+    png = chart_cache.get_or_rerender(
+        fingerprint, render=lambda data: render_service.run(render_statistics_chart, data))
+    if png is None:
+        return "График не найден", 404
+    
+    # Адрес определяется содержимым, поэтому изображение можно кэшировать надолго
+    response = Response(png, mimetype='image/png')
+    response.set_etag(fingerprint)
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
+    # Запускаем обработку фоновых заданий (в том числе прерванных при прошлом запуске)
+    job_queue.start()
+    expiry_scanner.start()
     return webio_view(login)()
 
 if __name__ == '__main__':
@@ -0,0 +1,461 @@
+"""
+Замеры основных операций приложения на тестовых базах разного объема
+с сохранением результатов и сравнением с базовым прогоном.
+
+Для каждого объема (small, medium, large) база создается скриптом
+generate_test_data.py с фиксированным начальным значением и сохраняется
+в --data-dir для следующих запусков. Замеряются те же функции и запросы,
+которые выполняют экраны app.py (без вывода pywebio):
+расчет стоимости полиса, выборки списков клиентов, ТС и полисов, сбор
+статистики, выгрузка в CSV, формирование PDF полиса, построение графиков
+и регистрация файла в FileStorage. Каждая выборка выполняется в новом
+контексте приложения, как в экранах.
+
+Порядок проверки изменения:
+    git checkout main
+    python benchmarks/hot_paths.py --save benchmarks/baselines/main.json
+    git checkout my-branch
+    python benchmarks/hot_paths.py --compare benchmarks/baselines/main.json --report bench_report.md
+
+Сравнение ведется по медиане. Изменение в пределах --threshold процентов
+или при пересечении межквартильных интервалов двух прогонов считается
+шумом; с --fail-on-regression скрипт завершается с кодом 1, если
+какая-либо операция стала медленнее порога.
+
+Запуск из корня проекта:
+    python benchmarks/hot_paths.py [--sizes small,medium] [--only list_clients,export_csv]
+                                   [--rounds 5] [--min-time 1.0] [--data-dir DIR] [--regenerate]
+                                   [--save FILE] [--compare FILE] [--report FILE]
+                                   [--threshold 10] [--fail-on-regression]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from flask import Flask
+from models import db, Client, Vehicle, Policy
+from charts import chart_data_from_statistics, render_statistics_chart
+from documents import FONT_PATH, policy_document_fields, render_policy_pdf, warm_up
+from exports import DEFAULT_CHUNK_SIZE, write_policy_export_csv_resumable
+from file_storage import FileStorage
+from pdf_cache import PolicyPdfCache
+from policy_stats import collect_policy_statistics
+from pricing import calculate_policy_cost
+from queries import (DEFAULT_PAGE_SIZE, DEFAULT_SEARCH_LIMIT, fetch_policy_page, policy_status_criteria,
+                     search_clients, search_vehicles)
+
+# Объемы тестовых баз: параметры generate_test_data.py и число записей
+# в реестре FileStorage перед замером
+DATASET_SIZES = {
+    'small': {'clients': 1000, 'vehicles': 1500, 'policies': 4000, 'files': 100},
+    'medium': {'clients': 10000, 'vehicles': 15000, 'policies': 40000, 'files': 1000},
+    'large': {'clients': 100000, 'vehicles': 150000, 'policies': 400000, 'files': 10000}
+}
+
+DEFAULT_SIZES = ('small', 'medium')
+DEFAULT_SEED = 20250514
+DEFAULT_THRESHOLD = 10  # процентов
+MAX_ROUNDS = 1000
+
+# Расчетов стоимости в одном замере calculate_policy_cost
+COST_CALLS = 1000
+
+class Dataset:
+    """Тестовая база одного объема и приложение, подключенное к ней"""
+
+    def __init__(self, name, params, database_path, work_dir):
+        self.name = name
+        self.params = params
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(self.app)
+        self.work_dir = work_dir
+        self.current_date = datetime.now()
+
+def prepare_database(name, params, data_dir, seed, regenerate=False):
+    """Создает тестовую базу объема name (если ее еще нет) и возвращает путь к ней"""
+    database_path = os.path.join(data_dir, f"hot_paths_{name}_{seed}.db")
+    if os.path.exists(database_path) and not regenerate:
+        return database_path
+    if os.path.exists(database_path):
+        os.remove(database_path)
+
+    print(f"Создание тестовой базы {name}: клиентов {params['clients']}, ТС {params['vehicles']}, "
+          f"полисов {params['policies']}")
+    started = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(ROOT_DIR, 'generate_test_data.py'),
+                    '--database', database_path, '--seed', str(seed),
+                    '--clients', str(params['clients']), '--vehicles', str(params['vehicles']),
+                    '--policies', str(params['policies'])],
+                   cwd=ROOT_DIR, check=True, stdout=subprocess.DEVNULL)
+    print(f"База создана за {time.perf_counter() - started:.1f} с")
+    return database_path
+
+def bench_calculate_policy_cost(dataset):
+    """calculate_policy_cost для COST_CALLS ТС с разными параметрами водителя"""
+    rng = random.Random(1)
+    with dataset.app.app_context():
+        vehicles = Vehicle.query.order_by(Vehicle.id).limit(COST_CALLS).all()
+        db.session.expunge_all()
+    calls = [(vehicles[i % len(vehicles)], rng.choice((3, 6, 12)), rng.randint(0, 30), rng.randint(18, 75),
+              rng.choice((0.5, 0.8, 1.0, 1.55))) for i in range(COST_CALLS)]
+
+    def run():
+        for vehicle, period, experience, age, bonus_malus in calls:
+            calculate_policy_cost(vehicle, period, experience, age, bonus_malus)
+    return run
+
+def bench_list_clients(dataset):
+    """Список клиентов без поиска (list_clients)"""
+    def run():
+        with dataset.app.app_context():
+            Client.query.all()
+    return run
+
+def bench_search_clients(dataset):
+    """Поиск клиентов (list_clients со строкой поиска)"""
+    def run():
+        with dataset.app.app_context():
+            search_clients('Иванова', DEFAULT_SEARCH_LIMIT)
+    return run
+
+def bench_list_vehicles(dataset):
+    """Список ТС с владельцами без поиска (list_vehicles)"""
+    def run():
+        with dataset.app.app_context():
+            Vehicle.query.join(Vehicle.client).add_entity(Client).all()
+    return run
+
+def bench_search_vehicles(dataset):
+    """Поиск ТС (list_vehicles со строкой поиска)"""
+    def run():
+        with dataset.app.app_context():
+            search_vehicles('Toyota Camry', DEFAULT_SEARCH_LIMIT)
+    return run
+
+def bench_list_policies(dataset):
+    """Первая страница списка полисов без фильтров (list_policies)"""
+    def run():
+        with dataset.app.app_context():
+            fetch_policy_page([], page_size=DEFAULT_PAGE_SIZE)
+    return run
+
+def bench_list_policies_expiring(dataset):
+    """Страница полисов с фильтром «истекают в ближайшие 30 дней»"""
+    def run():
+        with dataset.app.app_context():
+            fetch_policy_page(policy_status_criteria('expiring_soon', dataset.current_date),
+                              page_size=DEFAULT_PAGE_SIZE)
+    return run
+
+def bench_list_policies_search(dataset):
+    """Страница полисов со строкой поиска"""
+    def run():
+        with dataset.app.app_context():
+            fetch_policy_page([], page_size=DEFAULT_PAGE_SIZE, search_term='Петрова')
+    return run
+
+def bench_statistics(dataset):
+    """Сбор статистики по полисам (show_statistics)"""
+    def run():
+        with dataset.app.app_context():
+            collect_policy_statistics(dataset.current_date)
+    return run
+
+def bench_export_csv(dataset):
+    """Выгрузка всех полисов в CSV (задание export_csv)"""
+    file_path = os.path.join(dataset.work_dir, 'policies_export.csv')
+
+    def run():
+        with dataset.app.app_context():
+            write_policy_export_csv_resumable(file_path, dataset.current_date, DEFAULT_CHUNK_SIZE)
+    return run
+
+def _policy_query(policy_id):
+    # Тот же запрос, что в generate_policy_pdf
+    return (Policy.query
+            .filter(Policy.id == policy_id)
+            .join(Policy.vehicle)
+            .join(Vehicle.client)
+            .add_entity(Vehicle)
+            .add_entity(Client)
+            .first())
+
+def bench_generate_policy_pdf(dataset):
+    """Выборка полиса и формирование PDF без кэша (generate_policy_pdf при промахе)"""
+    if not os.path.exists(FONT_PATH):
+        return None
+    warm_up()
+    file_path = os.path.join(dataset.work_dir, 'policy.pdf')
+    with dataset.app.app_context():
+        policy_ids = [row[0] for row in db.session.query(Policy.id).order_by(Policy.id).limit(50)]
+    position = [0]
+
+    def run():
+        policy_id = policy_ids[position[0] % len(policy_ids)]
+        position[0] += 1
+        with dataset.app.app_context():
+            policy, vehicle, client = _policy_query(policy_id)
+            fields = policy_document_fields(policy, vehicle, client)
+        render_policy_pdf(fields, file_path)
+    return run
+
+def bench_generate_policy_pdf_cached(dataset):
+    """Выборка полиса и выдача готового PDF из кэша (generate_policy_pdf при попадании)"""
+    if not os.path.exists(FONT_PATH):
+        return None
+    cache = PolicyPdfCache(os.path.join(dataset.work_dir, 'policy_cache'))
+    with dataset.app.app_context():
+        policy_id = db.session.query(db.func.min(Policy.id)).scalar()
+
+    def run():
+        with dataset.app.app_context():
+            policy, vehicle, client = _policy_query(policy_id)
+            fields = policy_document_fields(policy, vehicle, client)
+        cache.get_or_render(policy.id, fields, policy.status, lambda path: render_policy_pdf(fields, path))
+    return run
+
+def bench_render_chart(dataset):
+    """Построение панели графиков статистики без кэша (show_graphic_statistics)"""
+    with dataset.app.app_context():
+        chart_data = chart_data_from_statistics(collect_policy_statistics(dataset.current_date))
+    render_statistics_chart(chart_data)  # Загрузка matplotlib не входит в замер
+
+    def run():
+        render_statistics_chart(chart_data)
+    return run
+
+def bench_register_file(dataset):
+    """FileStorage.register_file при заполненном реестре"""
+    storage_dir = os.path.join(dataset.work_dir, 'files')
+    registry_dir = os.path.join(dataset.work_dir, 'registry')
+    registry_path = os.path.join(registry_dir, 'file_registry.json')
+    if os.path.exists(registry_path):
+        os.remove(registry_path)
+    storage = FileStorage(storage_dir, registry_dir)
+    for number in range(dataset.params['files']):
+        storage.file_registry[f'file-{number}'] = {
+            'path': os.path.join(storage_dir, f'policies_export_{number}.csv'),
+            'filename': f'policies_export_{number}.csv',
+            'created_at': datetime.now().isoformat()
+        }
+    storage._save_registry()
+    file_path = os.path.join(storage_dir, 'report.pdf')
+
+    def run():
+        storage.register_file(file_path)
+    return run
+
+# Имя замера -> функция подготовки (возвращает замеряемую функцию или None,
+# если замер невозможен в этом окружении)
+BENCHMARKS = {
+    'calculate_policy_cost': bench_calculate_policy_cost,
+    'list_clients': bench_list_clients,
+    'search_clients': bench_search_clients,
+    'list_vehicles': bench_list_vehicles,
+    'search_vehicles': bench_search_vehicles,
+    'list_policies': bench_list_policies,
+    'list_policies_expiring': bench_list_policies_expiring,
+    'list_policies_search': bench_list_policies_search,
+    'statistics': bench_statistics,
+    'export_csv': bench_export_csv,
+    'generate_policy_pdf': bench_generate_policy_pdf,
+    'generate_policy_pdf_cached': bench_generate_policy_pdf_cached,
+    'render_chart': bench_render_chart,
+    'register_file': bench_register_file
+}
+
+def measure(run, rounds, min_time):
+    """
+    Время выполнения run в миллисекундах: прогрев, затем не меньше rounds
+    замеров и не меньше min_time секунд в сумме (но не больше MAX_ROUNDS)
+    """
+    run()
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < rounds or (time.perf_counter() - started < min_time and len(timings) < MAX_ROUNDS):
+        round_started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - round_started) * 1000)
+    quartiles = statistics.quantiles(timings, n=4, method='inclusive')
+    return {
+        'median': statistics.median(timings),
+        'q1': quartiles[0],
+        'q3': quartiles[2],
+        'mean': statistics.mean(timings),
+        'min': min(timings),
+        'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'rounds': len(timings)
+    }
+
+def run_benchmarks(sizes, names, args):
+    """Результаты {объем: {замер: статистика}}"""
+    results = {}
+    os.makedirs(args.data_dir, exist_ok=True)
+    for size in sizes:
+        params = DATASET_SIZES[size]
+        database_path = prepare_database(size, params, args.data_dir, args.seed, args.regenerate)
+        with tempfile.TemporaryDirectory() as work_dir:
+            dataset = Dataset(size, params, database_path, work_dir)
+            results[size] = {}
+            print(f"\nОбъем {size}:")
+            for name in names:
+                run = BENCHMARKS[name](dataset)
+                if run is None:
+                    print(f"  {name:<28} пропущен (нет шрифта {FONT_PATH})")
+                    continue
+                result = measure(run, args.rounds, args.min_time)
+                results[size][name] = result
+                print(f"  {name:<28} медиана {result['median']:>10.2f} мс, "
+                      f"мин {result['min']:>10.2f} мс, замеров {result['rounds']}")
+    return results
+
+def git_commit():
+    """Текущий коммит (для подписи результатов) или None вне репозитория git"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_results(baseline, current, threshold):
+    """
+    Строки сравнения (объем, замер, медиана базового прогона, текущая медиана,
+    изменение в процентах, вывод). Изменение считается значимым, если медиана
+    изменилась больше чем на threshold процентов и межквартильные интервалы
+    двух прогонов не пересекаются - иначе это разброс замеров.
+    """
+    rows = []
+    for size, benchmarks in current['results'].items():
+        for name, result in benchmarks.items():
+            base = baseline['results'].get(size, {}).get(name)
+            if base is None:
+                rows.append((size, name, None, result['median'], None, 'новый замер'))
+                continue
+            change = (result['median'] / base['median'] - 1) * 100 if base['median'] else 0.0
+            if change > threshold and result['q1'] > base['q3']:
+                verdict = 'медленнее'
+            elif change < -threshold and result['q3'] < base['q1']:
+                verdict = 'быстрее'
+            else:
+                verdict = 'без изменений'
+            rows.append((size, name, base['median'], result['median'], change, verdict))
+    return rows
+
+def _format_ms(value):
+    return '-' if value is None else f"{value:.2f}"
+
+def _format_change(value):
+    return '-' if value is None else f"{value:+.1f}%"
+
+def print_comparison(rows, baseline, current):
+    print(f"\nСравнение с базовым прогоном {baseline['meta'].get('commit') or ''} "
+          f"({baseline['meta']['created_at']}), текущий {current['meta'].get('commit') or ''}:")
+    print(f"{'Объем':<8}{'Замер':<30}{'База, мс':>12}{'Сейчас, мс':>12}{'Изменение':>11}  Вывод")
+    for size, name, base, value, change, verdict in rows:
+        print(f"{size:<8}{name:<30}{_format_ms(base):>12}{_format_ms(value):>12}"
+              f"{_format_change(change):>11}  {verdict}")
+
+def write_report(path, rows, baseline, current, threshold):
+    """Отчет о сравнении в Markdown (для описания изменения)"""
+    lines = [
+        "## Замеры основных операций",
+        "",
+        f"База: {baseline['meta'].get('commit') or '-'} ({baseline['meta']['created_at']}), "
+        f"текущий прогон: {current['meta'].get('commit') or '-'} ({current['meta']['created_at']}). "
+        f"Медиана времени, порог шума {threshold}%.",
+        "",
+        "| Объем | Замер | База, мс | Сейчас, мс | Изменение | Вывод |",
+        "|---|---|---:|---:|---:|---|"
+    ]
+    for size, name, base, value, change, verdict in rows:
+        lines.append(f"| {size} | {name} | {_format_ms(base)} | {_format_ms(value)} | "
+                     f"{_format_change(change)} | {verdict} |")
+    if baseline['meta'].get('machine') != current['meta'].get('machine'):
+        lines += ["", "Прогоны выполнены в разных окружениях, сравнение может быть неточным."]
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+def main():
+    parser = argparse.ArgumentParser(description='Замеры основных операций приложения')
+    parser.add_argument('--sizes', default=','.join(DEFAULT_SIZES),
+                        help=f"Объемы баз через запятую: {', '.join(DATASET_SIZES)}")
+    parser.add_argument('--only', help='Замеры через запятую (по умолчанию все)')
+    parser.add_argument('--rounds', type=int, default=5, help='Минимальное число замеров каждой операции')
+    parser.add_argument('--min-time', type=float, default=1.0, help='Минимальное время замеров операции (сек)')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='Начальное значение генератора данных')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'osago_benchmarks'),
+                        help='Каталог тестовых баз (сохраняются между запусками)')
+    parser.add_argument('--regenerate', action='store_true', help='Создать тестовые базы заново')
+    parser.add_argument('--save', help='Сохранить результаты в JSON-файл (базовый прогон)')
+    parser.add_argument('--compare', help='Сравнить с результатами из JSON-файла')
+    parser.add_argument('--report', help='Записать отчет о сравнении в Markdown-файл')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Порог изменения медианы, ниже которого изменение считается шумом (%%)')
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help='Код завершения 1, если какая-либо операция стала медленнее порога')
+    args = parser.parse_args()
+
+    sizes = [size.strip() for size in args.sizes.split(',') if size.strip()]
+    names = [name.strip() for name in args.only.split(',')] if args.only else list(BENCHMARKS)
+    unknown = [size for size in sizes if size not in DATASET_SIZES] + [name for name in names
+                                                                       if name not in BENCHMARKS]
+    if unknown:
+        print(f"Неизвестные объемы или замеры: {', '.join(unknown)}")
+        return 2
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    current = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'machine': f"{platform.system()} {platform.machine()} {platform.processor()}".strip(),
+            'seed': args.seed,
+            'sizes': {size: DATASET_SIZES[size] for size in sizes}
+        },
+        'results': run_benchmarks(sizes, names, args)
+    }
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены в {args.save}")
+
+    if baseline is None:
+        return 0
+
+    if baseline['meta'].get('seed') != args.seed or any(
+            baseline['meta'].get('sizes', {}).get(size, params) != params
+            for size, params in current['meta']['sizes'].items()):
+        print("\nВнимание: базовый прогон выполнен на других тестовых данных")
+    rows = compare_results(baseline, current, args.threshold)
+    print_comparison(rows, baseline, current)
+    if args.report:
+        write_report(args.report, rows, baseline, current, args.threshold)
+        print(f"\nОтчет записан в {args.report}")
+
+    regressions = [row for row in rows if row[5] == 'медленнее']
+    if regressions:
+        print(f"\nМедленнее порога {args.threshold}%: {len(regressions)}")
+    return 1 if args.fail_on_regression and regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
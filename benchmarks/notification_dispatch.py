@@ -0,0 +1,93 @@
+"""
+Замер скорости асинхронной отправки уведомлений на локальный SMTP-сервер.
+
+Запускает сервер aiosmtpd на 127.0.0.1, который принимает письма с заданной
+задержкой (имитация сети и почтового сервера), и отправляет на него
+сообщения через NotificationDispatcher с разным числом обработчиков.
+Первая строка (1 обработчик) соответствует последовательной отправке.
+
+Запуск из корня проекта (нужны aiosmtpd и aiosmtplib):
+    python benchmarks/notification_dispatch.py [--messages 2000] [--latency 20]
+"""
+import argparse
+import asyncio
+import importlib.util
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from notification_dispatch import NotificationDispatcher, SmtpTransport
+
+class CountingHandler:
+    """Обработчик aiosmtpd: считает письма и SMTP-сессии, отвечает с задержкой"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.messages = 0
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.messages += 1
+        self.sessions.add(id(session))
+        return '250 OK'
+
+def sample_messages(count):
+    body = '<p>Уважаемый(ая) Иванов Иван Иванович, срок действия Вашего полиса ОСАГО заканчивается.</p>' * 20
+    return [{
+        'policy_id': number,
+        'channel': 'email',
+        'recipient': f'client{number}@example.com',
+        'subject': f'Срок действия полиса ОСАГО OSG-{number:06d} заканчивается',
+        'body': body
+    } for number in range(count)]
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер скорости отправки уведомлений')
+    parser.add_argument('--messages', type=int, default=2000, help='Число писем в каждом замере')
+    parser.add_argument('--latency', type=float, default=20, help='Задержка ответа сервера на письмо, мс')
+    parser.add_argument('--batch', type=int, default=1000, help='Писем в одной порции')
+    parser.add_argument('--port', type=int, default=8025, help='Порт локального SMTP-сервера')
+    args = parser.parse_args()
+
+    try:
+        from aiosmtpd.controller import Controller
+    except ImportError:
+        Controller = None
+    # aiosmtplib импортирует сам NotificationDispatcher - здесь только проверяем наличие
+    if Controller is None or importlib.util.find_spec('aiosmtplib') is None:
+        print('Для замера требуется установить библиотеки aiosmtpd и aiosmtplib')
+        print('Выполните команду: pip install aiosmtpd aiosmtplib')
+        return 1
+
+    messages = sample_messages(args.messages)
+    batches = [messages[start:start + args.batch] for start in range(0, len(messages), args.batch)]
+
+    print(f'Писем в замере: {args.messages}, задержка сервера: {args.latency:.0f} мс')
+    print(f"{'Обработчиков':<14}{'писем':>8}{'время, с':>10}{'писем/мин':>12}{'сессий SMTP':>14}{'ошибок':>8}")
+    for concurrency in (1, 5, 20, 50):
+        # Последовательная отправка с задержкой занимает слишком долго - ограничиваем ее
+        sample = batches if concurrency > 1 or not args.latency else [messages[:max(args.batch // 10, 1)]]
+        handler = CountingHandler(args.latency / 1000)
+        controller = Controller(handler, hostname='127.0.0.1', port=args.port)
+        controller.start()
+        try:
+            dispatcher = NotificationDispatcher(
+                {'email': lambda: SmtpTransport('127.0.0.1', args.port, 'noreply@osago.local')},
+                concurrency)
+            started = time.perf_counter()
+            totals = dispatcher.run(sample)
+            elapsed = time.perf_counter() - started
+        finally:
+            controller.stop()
+
+        sent = totals['sent'] + totals['failed']
+        print(f"{concurrency:<14}{sent:>8}{elapsed:>10.2f}{sent / elapsed * 60:>12.0f}"
+              f"{len(handler.sessions):>14}{totals['failed']:>8}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+Нагрузочная проверка выдачи номеров полисов (PolicyNumberAllocator).
+
+Несколько процессов с несколькими потоками в каждом одновременно получают
+номера из одной временной базы SQLite. Скрипт проверяет, что номера не
+повторяются и все попадают в таблицу полисов (уникальный индекс по номеру),
+и печатает скорость выдачи и число обращений к последовательности.
+Для сравнения приводится число совпадений у прежней схемы (дата и
+четыре случайные цифры) при том же числе номеров за день. Та же проверка
+в малом объеме входит в тесты (tests/test_policy_numbers.py).
+
+Запуск из корня проекта:
+    python benchmarks/policy_numbers.py [--processes 4] [--threads 8] [--numbers 500] [--block-size 20]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from models import db, Client, Vehicle, Policy
+from policy_numbers import PolicyNumberAllocator
+
+def create_app(database_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+def issue_numbers(database_path, threads, numbers, block_size, start_event, results):
+    """Процесс-выдающий: threads потоков по numbers номеров, затем запись полисов"""
+    app = create_app(database_path)
+    allocator = PolicyNumberAllocator(block_size)
+    issued = []
+    issued_lock = threading.Lock()
+
+    def worker():
+        with app.app_context():
+            local = [allocator.allocate() for _ in range(numbers)]
+        with issued_lock:
+            issued.extend(local)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start_event.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    # Полисы с выданными номерами - уникальный индекс по номеру отвергнет повтор
+    now = datetime.now()
+    with app.app_context():
+        vehicle_id = db.session.query(Vehicle.id).scalar()
+        db.session.execute(db.insert(Policy), [
+            {'number': number, 'vehicle_id': vehicle_id, 'start_date': now, 'end_date': now,
+             'cost': 0, 'created_at': now, 'status': 'active'}
+            for number in issued])
+        db.session.commit()
+    results.put((issued, elapsed, allocator.blocks_reserved))
+
+def random_scheme_collisions(count):
+    """Число номеров прежней схемы (4 случайные цифры за день), совпавших с уже выданными"""
+    seen = set()
+    collisions = 0
+    for _ in range(count):
+        number = ''.join(str(random.randint(0, 9)) for _ in range(4))
+        if number in seen:
+            collisions += 1
+        seen.add(number)
+    return collisions
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочная проверка выдачи номеров полисов')
+    parser.add_argument('--processes', type=int, default=4, help='Число процессов')
+    parser.add_argument('--threads', type=int, default=8, help='Потоков в каждом процессе')
+    parser.add_argument('--numbers', type=int, default=500, help='Номеров на поток')
+    parser.add_argument('--block-size', type=int, default=20, help='Номеров в резервируемом блоке')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database_path = os.path.join(workdir, 'numbers.db')
+        app = create_app(database_path)
+        with app.app_context():
+            db.create_all()
+            client = Client(full_name='Тестовый клиент', passport='0000 000000', phone='+70000000000')
+            db.session.add(client)
+            db.session.flush()
+            db.session.add(Vehicle(client_id=client.id, brand='Лада', model='Веста', year=2020,
+                                   vin='XTA00000000000000', reg_number='А000АА00', engine_power=106))
+            db.session.commit()
+
+        context = multiprocessing.get_context('spawn')
+        start_event = context.Event()
+        results = context.Queue()
+        processes = [context.Process(target=issue_numbers,
+                                     args=(database_path, args.threads, args.numbers, args.block_size,
+                                           start_event, results))
+                     for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        start_event.set()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        if any(process.exitcode for process in processes):
+            print('Процесс завершился с ошибкой')
+            return 1
+
+        issued = [number for numbers, _, _ in collected for number in numbers]
+        elapsed = max(elapsed for _, elapsed, _ in collected)
+        blocks = sum(blocks for _, _, blocks in collected)
+        with app.app_context():
+            stored = db.session.query(db.func.count(Policy.id)).scalar()
+
+    total = args.processes * args.threads * args.numbers
+    duplicates = len(issued) - len(set(issued))
+    print(f'Процессов: {args.processes}, потоков: {args.threads}, блок: {args.block_size}')
+    print(f'Выдано номеров: {len(issued)} из {total}, повторов: {duplicates}, записано полисов: {stored}')
+    print(f'Время выдачи: {elapsed:.2f} с, номеров/с: {len(issued) / elapsed:.0f}, '
+          f'обращений к последовательности: {blocks}')
+    print(f'Прежняя схема: совпадений номеров за день при {total} полисах: '
+          f'{random_scheme_collisions(total)}')
+    return 0 if duplicates == 0 and stored == total == len(issued) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
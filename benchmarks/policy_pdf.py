@@ -0,0 +1,94 @@
+"""
+Замер времени формирования PDF полиса: прежний способ (разбор и урезание
+полного шрифта в каждом документе) против облегченной копии шрифта,
+подготовленной один раз на процесс.
+
+Запуск из корня проекта:
+    python benchmarks/policy_pdf.py [--documents 50]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from documents import (FONT_PATH, _new_document, draw_policy_heading, draw_policy_fields,
+                       prepared_font, render_policy_pdf)
+
+SAMPLE_FIELDS = {
+    'number': 'OSG-20250514-0001',
+    'created_at': '14.05.2025',
+    'start_date': '14.05.2025',
+    'end_date': '13.05.2026',
+    'cost': 7842.56,
+    'brand': 'Лада',
+    'model': 'Веста',
+    'year': 2021,
+    'vin': 'XTA210990Y2766389',
+    'reg_number': 'А123ВС77',
+    'full_name': 'Иванов Иван Иванович',
+    'passport': '4510 123456',
+    'phone': '+79001234567',
+    'email': 'ivanov@mail.ru'
+}
+
+def render_policy_pdf_uncached(fields, file_path, font_path=FONT_PATH):
+    """Прежний способ: каждый полис разбирает и урезает полный шрифт"""
+    pdf = _new_document(font_path)
+    draw_policy_heading(pdf)
+    draw_policy_fields(pdf, fields)
+    pdf.output(file_path)
+    return file_path
+
+def measure(render, documents, file_path):
+    """Время формирования каждого документа в миллисекундах"""
+    timings = []
+    for _ in range(documents):
+        started = time.perf_counter()
+        render(SAMPLE_FIELDS, file_path)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+def describe(timings):
+    timings = sorted(timings)
+    return {
+        'mean': statistics.mean(timings),
+        'median': statistics.median(timings),
+        'p95': timings[max(int(len(timings) * 0.95) - 1, 0)]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер времени формирования PDF полиса')
+    parser.add_argument('--documents', type=int, default=50, help='Число документов в каждом замере')
+    args = parser.parse_args()
+
+    if not os.path.exists(FONT_PATH):
+        print(f'Не найден шрифт {FONT_PATH}')
+        return 1
+
+    file_path = os.path.join(tempfile.mkdtemp(), 'policy.pdf')
+
+    # Копия шрифта готовится один раз на процесс - считаем это временем прогрева
+    started = time.perf_counter()
+    prepared_font()
+    warm_up_ms = (time.perf_counter() - started) * 1000
+
+    results = {
+        'Полный шрифт': describe(measure(render_policy_pdf_uncached, args.documents, file_path)),
+        'Копия шрифта': describe(measure(render_policy_pdf, args.documents, file_path))
+    }
+
+    print(f'Документов в замере: {args.documents}, подготовка шрифта: {warm_up_ms:.1f} мс')
+    print(f"{'Способ':<16}{'среднее, мс':>14}{'медиана, мс':>14}{'p95, мс':>10}")
+    for name, result in results.items():
+        print(f"{name:<16}{result['mean']:>14.1f}{result['median']:>14.1f}{result['p95']:>10.1f}")
+
+    speedup = results['Полный шрифт']['mean'] / results['Копия шрифта']['mean']
+    print(f'Ускорение: {speedup:.1f}x')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Проверка и замер пакетного расчета стоимости полисов (batch_policy_cost)
+против поэлементного вызова calculate_policy_cost.
+
+Сначала на случайных факторах (включая значения на границах коэффициентов,
+классы КБМ действующего тарифа и произвольные КБМ) проверяется, что
+результаты совпадают бит в бит; при расхождении скрипт печатает примеры и
+завершается с кодом 1. Затем сравнивается время расчета.
+
+Запуск из корня проекта:
+    python benchmarks/premium_batch.py [--policies 200000] [--seed 1]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from pricing import batch_policy_cost, calculate_policy_cost
+from tariffs import tariff_registry
+
+# Классы КБМ действующего тарифа
+BONUS_MALUS_CLASSES = [value for value, _ in tariff_registry.current().bonus_malus]
+
+# Значения вокруг границ коэффициентов
+POWER_EDGES = [49, 50, 51, 99, 100, 101, 149, 150, 151, 199, 200, 201]
+AGE_EDGES = [2, 3, 4, 6, 7, 8, 9, 10, 11]
+EXPERIENCE_EDGES = [0, 2, 3, 4, 5, 6, 9, 10, 11]
+DRIVER_AGE_EDGES = [18, 21, 22, 23, 24, 25, 26, 59, 60, 61]
+
+def sample_factors(count, current_year, rng):
+    """Случайные факторы: половина - произвольные, половина - на границах"""
+    edge = rng.random(count) < 0.5
+    engine_power = np.where(edge, rng.choice(POWER_EDGES, count), rng.integers(30, 400, count))
+    vehicle_age = np.where(edge, rng.choice(AGE_EDGES, count), rng.integers(0, 30, count))
+    driver_age = np.where(edge, rng.choice(DRIVER_AGE_EDGES, count), rng.integers(18, 90, count))
+    driver_experience = np.where(edge, rng.choice(EXPERIENCE_EDGES, count),
+                                 rng.integers(0, 60, count))
+    bonus_malus = np.where(rng.random(count) < 0.7, rng.choice(BONUS_MALUS_CLASSES, count),
+                           rng.uniform(0.5, 2.45, count))
+    period_months = rng.choice([3, 6, 12] + list(range(1, 13)), count)
+    return {
+        'engine_power': engine_power,
+        'vehicle_year': current_year - vehicle_age,
+        'driver_age': driver_age,
+        'driver_experience': driver_experience,
+        'bonus_malus': bonus_malus,
+        'period_months': period_months
+    }
+
+def scalar_costs(factors):
+    """Стоимость каждого полиса через calculate_policy_cost"""
+    costs = []
+    for power, year, age, experience, bonus_malus, period in zip(
+            factors['engine_power'].tolist(), factors['vehicle_year'].tolist(),
+            factors['driver_age'].tolist(), factors['driver_experience'].tolist(),
+            factors['bonus_malus'].tolist(), factors['period_months'].tolist()):
+        vehicle = SimpleNamespace(engine_power=power, year=year)
+        costs.append(calculate_policy_cost(vehicle, period, experience, age, bonus_malus))
+    return np.array(costs, dtype=np.float64)
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка и замер пакетного расчета стоимости полисов')
+    parser.add_argument('--policies', type=int, default=200000, help='Число полисов в проверке и замере')
+    parser.add_argument('--seed', type=int, default=1, help='Начальное значение генератора')
+    args = parser.parse_args()
+
+    current_year = datetime.now().year
+    factors = sample_factors(args.policies, current_year, np.random.default_rng(args.seed))
+
+    started = time.perf_counter()
+    expected = scalar_costs(factors)
+    scalar_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    actual = batch_policy_cost(current_year=current_year, **factors)
+    batch_elapsed = time.perf_counter() - started
+
+    mismatches = np.flatnonzero(expected.view(np.uint64) != actual.view(np.uint64))
+    if len(mismatches):
+        print(f'Расхождений: {len(mismatches)} из {args.policies}')
+        for index in mismatches[:10]:
+            sample = {name: values[index].item() for name, values in factors.items()}
+            print(f'  {sample}: {expected[index]!r} != {actual[index]!r}')
+        return 1
+    print(f'Результаты совпадают бит в бит для {args.policies} полисов')
+
+    print(f"{'Способ':<26}{'время, с':>10}{'полисов/с':>14}")
+    print(f"{'calculate_policy_cost':<26}{scalar_elapsed:>10.3f}{args.policies / scalar_elapsed:>14.0f}")
+    print(f"{'batch_policy_cost':<26}{batch_elapsed:>10.3f}{args.policies / batch_elapsed:>14.0f}")
+    print(f'Ускорение: {scalar_elapsed / batch_elapsed:.0f}x')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
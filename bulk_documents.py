@@ -0,0 +1,200 @@
+"""
+Модуль пакетного формирования документов полисов.
+
+Отбор полисов (период оформления, статус, список номеров) читается из базы
+порциями по id, документы отрисовываются параллельно в пуле процессов
+(см. render_service.py) и по мере готовности в исходном порядке пишутся
+в ZIP-архив или объединяются в один PDF. Одновременно в работе находится
+не больше window заданий, поэтому скорость растет с числом рабочих
+процессов, а память при записи архива не зависит от числа полисов.
+
+В ZIP-архив документы попадают через кэш PDF полисов (см. pdf_cache.py):
+неизмененные полисы не отрисовываются повторно, а отрисованные пакетом
+затем скачиваются по одному без ожидания. Для объединенного PDF полисы
+отрисовываются частями по part_size полисов, части склеиваются библиотекой pypdf.
+pypdf держит все страницы объединенного документа в памяти до записи,
+поэтому в один PDF объединяется не больше DEFAULT_MAX_PDF_DOCUMENTS полисов;
+большие отборы выгружаются ZIP-архивом (см. bulk_document_format).
+"""
+import os
+import shutil
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import Future, wait
+from datetime import timedelta
+from models import db, Client, Vehicle, Policy
+from queries import policy_status_criteria
+from documents import policy_document_fields, render_policy_pdf, render_policy_pdf_batch
+
+# Число полисов, читаемых из базы за один запрос
+DEFAULT_CHUNK_SIZE = 500
+
+# Число полисов в одной части объединенного PDF
+DEFAULT_PART_SIZE = 50
+
+# Наибольшее число полисов в объединенном PDF (страницы собираются в памяти)
+DEFAULT_MAX_PDF_DOCUMENTS = 2000
+
+def parse_policy_numbers(text):
+    """Номера полисов из текста (через запятую, пробел или с новой строки)"""
+    if not text:
+        return []
+    return sorted({number for number in text.replace(',', ' ').split()})
+
+def bulk_policy_criteria(current_date, date_from=None, date_to=None, status_filter='all', numbers=None):
+    """Условия WHERE для отбора полисов: период оформления (включительно), статус, номера"""
+    criteria = policy_status_criteria(status_filter, current_date)
+    if date_from is not None:
+        criteria.append(Policy.created_at >= date_from)
+    if date_to is not None:
+        criteria.append(Policy.created_at < date_to + timedelta(days=1))
+    if numbers:
+        criteria.append(Policy.number.in_(numbers))
+    return criteria
+
+def bulk_document_format(requested_format, total, max_pdf_documents=DEFAULT_MAX_PDF_DOCUMENTS):
+    """Формат результата: объединенный PDF только для отбора не больше max_pdf_documents полисов"""
+    if requested_format == 'pdf' and total > max_pdf_documents:
+        return 'zip'
+    return requested_format
+
+def count_policy_documents(criteria):
+    """Число полисов, попадающих в отбор"""
+    return db.session.query(db.func.count(Policy.id)).filter(*criteria).scalar()
+
+def iter_policy_documents(criteria, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Генератор (id полиса, статус, поля документа) по возрастанию id.
+    Каждая порция - один запрос с соединением ТС и владельца.
+    """
+    last_id = 0
+    while True:
+        rows = (db.session.query(Policy, Vehicle, Client)
+                .join(Policy.vehicle)
+                .join(Vehicle.client)
+                .filter(*criteria, Policy.id > last_id)
+                .order_by(Policy.id)
+                .limit(chunk_size)
+                .all())
+        if not rows:
+            return
+        for policy, vehicle, client in rows:
+            yield policy.id, policy.status, policy_document_fields(policy, vehicle, client)
+        last_id = rows[-1][0].id
+
+def _completed(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+def _bounded(tasks, window):
+    """
+    Принимает пары (элемент, функция, возвращающая Future), запускает задания
+    так, чтобы одновременно выполнялось не больше window, и отдает пары
+    (элемент, результат) в исходном порядке.
+    """
+    pending = deque()
+    try:
+        for item, submit in tasks:
+            pending.append((item, submit()))
+            if len(pending) >= window:
+                item, future = pending.popleft()
+                yield item, future.result()
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+    finally:
+        # При ошибке или отмене дожидаемся уже отправленных заданий,
+        # чтобы они не писали в удаленный рабочий каталог
+        wait([future for _, future in pending])
+
+def _window(render_service):
+    return max(render_service.max_workers, 1) * 2
+
+def write_policy_documents_zip(file_path, documents, render_service, pdf_cache, on_document=None):
+    """
+    Записывает документы полисов в ZIP-архив, возвращает их число.
+    documents - итератор (id полиса, статус, поля), on_document(число готовых)
+    вызывается после добавления каждого документа в архив.
+    """
+    work_dir = tempfile.mkdtemp(prefix='bulk_', dir=os.path.dirname(os.path.abspath(file_path)))
+
+    def task(policy_id, status, fields):
+        cached_path = pdf_cache.get(policy_id, fields, status)
+        if cached_path is not None:
+            return fields, lambda: _completed(cached_path)
+        temp_path = os.path.join(work_dir, f"{policy_id}.pdf")
+
+        def submit():
+            future = Future()
+            render = render_service.submit(render_policy_pdf, fields, temp_path)
+
+            def on_done(render):
+                try:
+                    render.result()
+                    future.set_result(pdf_cache.store(policy_id, fields, status, temp_path))
+                except Exception as e:
+                    future.set_exception(e)
+
+            render.add_done_callback(on_done)
+            return future
+        return fields, submit
+
+    written = 0
+    try:
+        # PDF уже сжат, поэтому документы кладутся в архив без повторного сжатия
+        with zipfile.ZipFile(file_path, 'w', zipfile.ZIP_STORED) as archive:
+            tasks = (task(*document) for document in documents)
+            for fields, path in _bounded(tasks, _window(render_service)):
+                archive.write(path, arcname=f"policy_{fields['number']}.pdf")
+                written += 1
+                if on_document is not None:
+                    on_document(written)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return written
+
+def _chunked(documents, size):
+    part = []
+    for document in documents:
+        part.append(document[2])
+        if len(part) >= size:
+            yield part
+            part = []
+    if part:
+        yield part
+
+def write_policy_documents_pdf(file_path, documents, render_service, on_document=None,
+                               part_size=DEFAULT_PART_SIZE, max_documents=DEFAULT_MAX_PDF_DOCUMENTS):
+    """
+    Записывает документы полисов в один PDF (каждый полис с новой страницы),
+    возвращает их число. Части отрисовываются параллельно, но объединенный
+    документ держит страницы в памяти до записи, поэтому отбор больше
+    max_documents полисов отклоняется с ValueError - такие пакеты пишутся
+    в ZIP-архив. Требуется библиотека pypdf.
+    """
+    from pypdf import PdfWriter
+
+    work_dir = tempfile.mkdtemp(prefix='bulk_', dir=os.path.dirname(os.path.abspath(file_path)))
+
+    def task(number, part):
+        part_path = os.path.join(work_dir, f"part_{number}.pdf")
+        return len(part), lambda: render_service.submit(render_policy_pdf_batch, part, part_path)
+
+    written = 0
+    try:
+        writer = PdfWriter()
+        tasks = (task(number, part) for number, part in enumerate(_chunked(documents, part_size)))
+        for count, part_path in _bounded(tasks, _window(render_service)):
+            if written + count > max_documents:
+                raise ValueError(f"В один PDF объединяется не больше {max_documents} полисов")
+            writer.append(part_path)
+            written += count
+            if on_document is not None:
+                on_document(written)
+        if written:
+            writer.write(file_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return written
@@ -0,0 +1,200 @@
+"""
+Модуль построения и кэширования графиков статистики по полисам.
+
+Отрисовка панели matplotlib занимает около секунды процессорного времени,
+а исходные данные меняются редко, поэтому готовые PNG хранятся в LRU-кэше
+с ограничением по объему. Ключ кэша - отпечаток агрегированных данных
+(количество по статусам, периодам и месяцам); по нему же браузер получает
+изображение через маршрут /charts/<отпечаток>.png. Исходные данные последних
+графиков хранятся отдельно от PNG, поэтому вытесненное изображение строится
+заново, когда браузер запрашивает его по отпечатку.
+"""
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+
+# Максимальный суммарный объем PNG в кэше по умолчанию (байт)
+DEFAULT_CACHE_BYTES = 32 * 1024 * 1024
+
+# Число отпечатков, для которых хранятся исходные данные графика
+DEFAULT_MAX_SOURCES = 1024
+
+def chart_data_from_statistics(stats):
+    """Выбирает из статистики (см. policy_stats.py) данные, нужные для графиков"""
+    return {
+        'status': [stats['active'], stats['cancelled'], stats['expired']],
+        'periods': stats['periods'],
+        'monthly': stats['monthly']
+    }
+
+def chart_fingerprint(chart_data):
+    """Отпечаток данных графика: одинаковые данные дают одинаковый отпечаток"""
+    payload = json.dumps(chart_data, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def render_statistics_chart(chart_data):
+    """Строит панель из трех диаграмм и возвращает ее в виде PNG (bytes)"""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    active_policies, cancelled_policies, expired_policies = chart_data['status']
+    period_data = chart_data['periods']
+    sorted_months = list(chart_data['monthly'].keys())
+    monthly_counts = list(chart_data['monthly'].values())
+
+    # Создаем фигуру с тремя диаграммами
+    fig = Figure(figsize=(15, 10))
+    fig.subplots_adjust(hspace=0.4)  # Добавляем вертикальное пространство между графиками
+    
+    # 1. Круговая диаграмма статусов полисов
+    ax1 = fig.add_subplot(2, 2, 1)
+    status_labels = ['Активные', 'Отмененные', 'Истекшие']
+    status_values = [active_policies, cancelled_policies, expired_policies]
+    status_colors = ['#4CAF50', '#F44336', '#FFC107']
+    
+    # Исключаем нулевые значения для лучшего отображения
+    non_zero_labels = []
+    non_zero_values = []
+    non_zero_colors = []
+    for i, val in enumerate(status_values):
+        if val > 0:
+            non_zero_labels.append(status_labels[i])
+            non_zero_values.append(val)
+            non_zero_colors.append(status_colors[i])
+            
+    if sum(non_zero_values) > 0:
+        ax1.pie(non_zero_values, labels=non_zero_labels, colors=non_zero_colors, autopct='%1.1f%%', startangle=90)
+        ax1.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
+        ax1.set_title('Распределение полисов по статусам')
+    else:
+        ax1.text(0.5, 0.5, 'Нет данных для отображения', horizontalalignment='center', verticalalignment='center')
+        
+    # 2. Столбчатая диаграмма периодов полисов
+    ax2 = fig.add_subplot(2, 2, 2)
+    periods = list(period_data.keys())
+    counts = list(period_data.values())
+    
+    if periods and counts:
+        bars = ax2.bar(periods, counts, color='#2196F3')
+        ax2.set_title('Распределение полисов по периодам')
+        ax2.set_ylabel('Количество полисов')
+        ax2.set_xlabel('Период')
+        
+        # Добавляем подписи с количеством над столбцами
+        for bar in bars:
+            height = bar.get_height()
+            ax2.text(bar.get_x() + bar.get_width()/2., height + 0.1,
+                     f'{int(height)}',
+                     ha='center', va='bottom')
+    else:
+        ax2.text(0.5, 0.5, 'Нет данных для отображения', horizontalalignment='center', verticalalignment='center')
+        
+    # 3. График динамики оформления полисов по месяцам
+    ax3 = fig.add_subplot(2, 1, 2)
+    
+    if sorted_months and monthly_counts:
+        # Упрощаем названия месяцев для отображения
+        display_months = [month.split('-')[1] + '/' + month.split('-')[0][2:] for month in sorted_months]
+        
+        ax3.plot(display_months, monthly_counts, marker='o', linestyle='-', color='#673AB7')
+        ax3.set_title('Динамика оформления полисов по месяцам')
+        ax3.set_ylabel('Количество полисов')
+        ax3.set_xlabel('Месяц/Год')
+        ax3.grid(True, linestyle='--', alpha=0.7)
+        
+        # Поворачиваем подписи по оси X для лучшей читаемости
+        ax3.tick_params(axis='x', rotation=45)
+        
+        # Добавляем точные значения над точками графика
+        for i, count in enumerate(monthly_counts):
+            ax3.annotate(str(count), (display_months[i], monthly_counts[i]), 
+                        textcoords="offset points", 
+                        xytext=(0,10), 
+                        ha='center')
+    else:
+        ax3.text(0.5, 0.5, 'Нет данных для отображения', horizontalalignment='center', verticalalignment='center')
+        
+    # Сохраняем изображение в память
+    canvas = FigureCanvasAgg(fig)
+    buf = io.BytesIO()
+    canvas.print_png(buf)
+    return buf.getvalue()
+
+class ChartCache:
+    """
+    Потокобезопасный LRU-кэш PNG-изображений с ограничением суммарного объема.
+    Для последних max_sources отпечатков хранятся данные графика, чтобы
+    вытесненное изображение можно было построить заново (см. get_or_rerender).
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES, max_sources=DEFAULT_MAX_SOURCES):
+        self.max_bytes = max_bytes
+        self.max_sources = max_sources
+        self._items = OrderedDict()
+        self._sources = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, fingerprint):
+        """Возвращает PNG по отпечатку или None"""
+        with self._lock:
+            png = self._items.get(fingerprint)
+            if png is not None:
+                self._items.move_to_end(fingerprint)
+            return png
+
+    def put(self, fingerprint, png):
+        """Сохраняет PNG, вытесняя давно не использованные изображения"""
+        with self._lock:
+            if fingerprint in self._items:
+                self._size -= len(self._items.pop(fingerprint))
+            self._items[fingerprint] = png
+            self._size += len(png)
+            while self._size > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _lookup(self, fingerprint, chart_data=None):
+        """
+        PNG по отпечатку с учетом попадания или промаха; запоминает данные
+        графика (если переданы) и возвращает (PNG или None, данные графика или None)
+        """
+        with self._lock:
+            if chart_data is not None:
+                self._sources[fingerprint] = chart_data
+            elif fingerprint in self._sources:
+                chart_data = self._sources[fingerprint]
+            if chart_data is not None:
+                self._sources.move_to_end(fingerprint)
+                while len(self._sources) > self.max_sources:
+                    self._sources.popitem(last=False)
+            png = self._items.get(fingerprint)
+            if png is not None:
+                self._items.move_to_end(fingerprint)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return png, chart_data
+
+    def get_or_render(self, chart_data, render=render_statistics_chart):
+        """Возвращает отпечаток данных, при промахе строит и сохраняет график"""
+        fingerprint = chart_fingerprint(chart_data)
+        png, _ = self._lookup(fingerprint, chart_data)
+        if png is None:
+            self.put(fingerprint, render(chart_data))
+        return fingerprint
+
+    def get_or_rerender(self, fingerprint, render=render_statistics_chart):
+        """
+        Возвращает PNG по отпечатку; вытесненное изображение строится заново по
+        сохраненным данным. None - данные с таким отпечатком неизвестны.
+        """
+        png, chart_data = self._lookup(fingerprint)
+        if png is None and chart_data is not None:
+            png = render(chart_data)
+            self.put(fingerprint, png)
+        return png
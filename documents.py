@@ -0,0 +1,252 @@
+"""
+Модуль формирования PDF-документов: страховой полис и статистический отчет.
+
+Функции отрисовки принимают только простые данные (словари, строки, числа),
+а не объекты ORM, поэтому их можно выполнять в отдельных процессах
+(см. render_service.py).
+
+Большую часть времени создания документа занимают разбор TrueType-шрифта
+(несколько тысяч глифов) и его урезание при сохранении PDF. Поэтому полный
+шрифт разбирается один раз на процесс: из него строится облегченная копия
+только с нужными документам символами (латиница, кириллица, знаки), она
+сохраняется во временный каталог и используется всеми документами. Если
+в данных встретился символ вне этого набора, документ строится на полном шрифте.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from itertools import chain
+
+# Шрифт с поддержкой кириллицы
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts', 'arial.ttf')
+
+# Символы облегченной копии шрифта: латиница, кириллица, типографские знаки, №, ₽
+DOCUMENT_CHARSET = frozenset(chain(range(0x20, 0x7F), range(0xA0, 0x180), range(0x400, 0x530),
+                                   range(0x2010, 0x2040), (0x2116, 0x20BD)))
+
+# Версия набора символов: при его изменении копия шрифта строится заново
+DOCUMENT_CHARSET_VERSION = 1
+
+_prepared_fonts = {}
+_fonts_lock = threading.Lock()
+
+def _build_reduced_font(font_path):
+    """Строит (или находит готовую) облегченную копию шрифта, возвращает путь к ней"""
+    stat = os.stat(font_path)
+    key = hashlib.sha1(f"{os.path.abspath(font_path)}:{stat.st_size}:{stat.st_mtime_ns}:"
+                       f"{DOCUMENT_CHARSET_VERSION}".encode('utf-8')).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(font_path))[0]
+    reduced_dir = os.path.join(tempfile.gettempdir(), 'osago_fonts')
+    reduced_path = os.path.join(reduced_dir, f"{name}-{key}.ttf")
+    if os.path.exists(reduced_path):
+        return reduced_path
+
+    from fontTools import subset, ttLib
+
+    font = ttLib.TTFont(font_path, recalcTimestamp=False)
+    options = subset.Options()
+    options.glyph_names = True
+    options.notdef_outline = True
+    options.name_IDs = ['*']
+    options.drop_tables += ['FFTM']
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=DOCUMENT_CHARSET)
+    subsetter.subset(font)
+
+    # Пишем во временный файл и переименовываем: другие процессы не увидят недописанный шрифт
+    os.makedirs(reduced_dir, exist_ok=True)
+    temp_path = f"{reduced_path}.{os.getpid()}.tmp"
+    font.save(temp_path)
+    os.replace(temp_path, reduced_path)
+    return reduced_path
+
+def prepared_font(font_path=FONT_PATH):
+    """
+    Путь к облегченной копии шрифта (строится один раз на процесс).
+    Если копию подготовить не удалось, возвращает путь к исходному шрифту.
+    """
+    with _fonts_lock:
+        if font_path not in _prepared_fonts:
+            try:
+                _prepared_fonts[font_path] = _build_reduced_font(font_path)
+            except Exception:
+                _prepared_fonts[font_path] = font_path
+        return _prepared_fonts[font_path]
+
+def document_font(font_path, values):
+    """Шрифт для документа: облегченная копия, если в ней есть все символы значений"""
+    for value in values:
+        if any(ord(char) not in DOCUMENT_CHARSET for char in str(value)):
+            return font_path
+    return prepared_font(font_path)
+
+def _new_document(font_path):
+    """Создает PDF документ с кириллическим шрифтом (обычный и полужирный)"""
+    from fpdf import FPDF
+
+    pdf = FPDF()
+    pdf.add_font('CustomFont', '', font_path)
+    pdf.add_font('CustomFont', 'B', font_path)
+    pdf.add_page()
+    return pdf
+
+def warm_up(font_path=FONT_PATH):
+    """Загружает fpdf и готовит шрифт, чтобы первый документ не тратил на это время"""
+    if os.path.exists(font_path):
+        _new_document(prepared_font(font_path))
+
+def policy_document_fields(policy, vehicle, client):
+    """Собирает значения полей документа полиса из объектов модели"""
+    return {
+        'number': policy.number,
+        'created_at': policy.created_at.strftime('%d.%m.%Y'),
+        'start_date': policy.start_date.strftime('%d.%m.%Y'),
+        'end_date': policy.end_date.strftime('%d.%m.%Y'),
+        'cost': policy.cost,
+        'brand': vehicle.brand,
+        'model': vehicle.model,
+        'year': vehicle.year,
+        'vin': vehicle.vin,
+        'reg_number': vehicle.reg_number,
+        'full_name': client.full_name,
+        'passport': client.passport,
+        'phone': client.phone,
+        'email': client.email
+    }
+
+def render_policy_pdf(fields, file_path, font_path=FONT_PATH):
+    """Формирует PDF страхового полиса по словарю полей и сохраняет его в file_path"""
+    pdf = _new_document(document_font(font_path, fields.values()))
+    draw_policy_heading(pdf)
+    draw_policy_fields(pdf, fields)
+    pdf.output(file_path)
+    return file_path
+
+def render_policy_pdf_batch(fields_list, file_path, font_path=FONT_PATH):
+    """Формирует один PDF с несколькими полисами (каждый с новой страницы)"""
+    values = chain.from_iterable(fields.values() for fields in fields_list)
+    pdf = _new_document(document_font(font_path, values))
+    for number, fields in enumerate(fields_list):
+        if number:
+            pdf.add_page()
+        draw_policy_heading(pdf)
+        draw_policy_fields(pdf, fields)
+    pdf.output(file_path)
+    return file_path
+
+def draw_policy_heading(pdf):
+    """Рисует заголовок полиса"""
+    # Используем шрифт с поддержкой кириллицы
+    pdf.set_font("CustomFont", "", 16)
+    pdf.cell(0, 10, "СТРАХОВОЙ ПОЛИС ОСАГО", 0, 1, 'C')
+    pdf.ln(10)
+
+def draw_policy_fields(pdf, fields):
+    """Рисует данные полиса, ТС и владельца и строки для подписей"""
+    # Информация о полисе
+    pdf.set_font("CustomFont", "B", 12)
+    pdf.cell(0, 10, f"Полис №: {fields['number']}", 0, 1)
+    pdf.cell(0, 10, f"Дата оформления: {fields['created_at']}", 0, 1)
+    pdf.cell(0, 10, f"Срок действия: {fields['start_date']} - {fields['end_date']}", 0, 1)
+    pdf.cell(0, 10, f"Стоимость: {fields['cost']} руб.", 0, 1)
+    pdf.ln(5)
+
+    # Информация о ТС
+    pdf.set_font("CustomFont", "B", 14)
+    pdf.cell(0, 10, "Информация о транспортном средстве:", 0, 1)
+    pdf.set_font("CustomFont", "", 12)
+    pdf.cell(0, 10, f"Марка и модель: {fields['brand']} {fields['model']}", 0, 1)
+    pdf.cell(0, 10, f"Год выпуска: {fields['year']}", 0, 1)
+    pdf.cell(0, 10, f"VIN: {fields['vin']}", 0, 1)
+    pdf.cell(0, 10, f"Гос. номер: {fields['reg_number']}", 0, 1)
+    pdf.ln(5)
+
+    # Информация о владельце
+    pdf.set_font("CustomFont", "B", 14)
+    pdf.cell(0, 10, "Информация о владельце:", 0, 1)
+    pdf.set_font("CustomFont", "", 12)
+    pdf.cell(0, 10, f"ФИО: {fields['full_name']}", 0, 1)
+    pdf.cell(0, 10, f"Паспорт: {fields['passport']}", 0, 1)
+    if fields['phone']:
+        pdf.cell(0, 10, f"Телефон: {fields['phone']}", 0, 1)
+    if fields['email']:
+        pdf.cell(0, 10, f"Email: {fields['email']}", 0, 1)
+
+    # Подпись
+    pdf.ln(20)
+    pdf.cell(80, 10, "Подпись страховщика: _________________", 0, 1)
+    pdf.cell(80, 10, "Подпись страхователя: _________________", 0, 1)
+
+def statistics_report_data(stats, recent_policies, current_date):
+    """
+    Собирает данные отчета: статистику (см. policy_stats.py) и строки последних
+    полисов (номер, владелец, марка, модель, стоимость, дата оформления)
+    """
+    return {
+        'date': current_date.strftime('%d.%m.%Y'),
+        'stats': stats,
+        'recent': [(number, full_name, brand, model, cost, created_at.strftime('%d.%m.%Y'))
+                   for number, full_name, brand, model, cost, created_at in recent_policies]
+    }
+
+def render_statistics_report(report, file_path, font_path=FONT_PATH):
+    """Формирует PDF-отчет со статистикой по полисам и сохраняет его в file_path"""
+    stats = report['stats']
+    total_policies = stats['total']
+
+    recent_values = [value for row in report['recent'] for value in row]
+    pdf = _new_document(document_font(font_path, [report['date']] + recent_values))
+
+    # Добавляем шапку
+    pdf.set_font("CustomFont", "B", 16)
+    pdf.cell(0, 10, "СТАТИСТИЧЕСКИЙ ОТЧЕТ ПО ПОЛИСАМ ОСАГО", 0, 1, 'C')
+    pdf.cell(0, 10, f"Дата формирования: {report['date']}", 0, 1, 'C')
+    pdf.ln(10)
+
+    # Общая статистика
+    pdf.set_font("CustomFont", "B", 14)
+    pdf.cell(0, 10, "1. Общая статистика по полисам", 0, 1)
+    pdf.set_font("CustomFont", "", 12)
+    pdf.cell(0, 8, f"Всего полисов: {total_policies}", 0, 1)
+    pdf.cell(0, 8, f"Действующие полисы: {stats['active']}", 0, 1)
+    pdf.cell(0, 8, f"Отмененные полисы: {stats['cancelled']}", 0, 1)
+    pdf.cell(0, 8, f"Истекшие полисы: {stats['expired']}", 0, 1)
+    pdf.cell(0, 8, f"Общая сумма всех полисов: {round(stats['total_sum'], 2)} руб.", 0, 1)
+    pdf.cell(0, 8, f"Общая сумма действующих полисов: {round(stats['active_sum'], 2)} руб.", 0, 1)
+    pdf.ln(5)
+
+    # Распределение по периодам
+    pdf.set_font("CustomFont", "B", 14)
+    pdf.cell(0, 10, "2. Распределение полисов по срокам", 0, 1)
+    pdf.set_font("CustomFont", "", 12)
+    for period, count in stats['periods'].items():
+        percent = round(count / total_policies * 100, 2) if total_policies > 0 else 0
+        pdf.cell(0, 8, f"{period}: {count} полисов ({percent}%)", 0, 1)
+    pdf.ln(5)
+
+    # Последние оформленные полисы
+    pdf.set_font("CustomFont", "B", 14)
+    pdf.cell(0, 10, "3. Последние оформленные полисы", 0, 1)
+    pdf.set_font("CustomFont", "", 10)
+
+    if report['recent']:
+        # Заголовки таблицы
+        pdf.cell(40, 8, "Номер полиса", 1, 0, 'C')
+        pdf.cell(50, 8, "Владелец", 1, 0, 'C')
+        pdf.cell(40, 8, "ТС", 1, 0, 'C')
+        pdf.cell(30, 8, "Стоимость", 1, 0, 'C')
+        pdf.cell(30, 8, "Дата", 1, 1, 'C')
+
+        # Данные таблицы
+        for number, full_name, brand, model, cost, created_at in report['recent']:
+            pdf.cell(40, 8, number, 1, 0)
+            pdf.cell(50, 8, full_name[:25], 1, 0)  # Ограничиваем длину имени
+            pdf.cell(40, 8, f"{brand} {model}"[:20], 1, 0)
+            pdf.cell(30, 8, f"{cost} руб.", 1, 0)
+            pdf.cell(30, 8, created_at, 1, 1)
+    else:
+        pdf.cell(0, 8, "Нет данных о полисах", 0, 1)
+
+    pdf.output(file_path)
+    return file_path
@@ -0,0 +1,244 @@
+"""
+Планировщик поиска истекающих полисов.
+
+Раньше истекающие полисы искались только при открытии экрана «Уведомления
+о полисах», и каждый раз читались все истекающие и истекшие полисы вместе
+с ТС и владельцами. Теперь периодический проход поддерживает небольшую
+таблицу expiring_policy (id и дата окончания полисов, истекающих в ближайшие
+horizon_days дней или истекших не раньше lookback_days дней назад), а экран
+читает только ее строки.
+
+Проход инкрементальный: водяной знак - граница горизонта прошлого прохода,
+поэтому добавляются только полисы с датой окончания между старой и новой
+границей (диапазон по индексу ix_policy_status_end_date). Раз в
+full_scan_interval таблица перестраивается полностью - так учитываются
+полисы, оформленные задним числом.
+
+Экран показывает истекшие полисы только за последние lookback_days дней
+(настройка EXPIRED_LOOKBACK_DAYS в app.py); более старые истекшие полисы
+доступны в списке полисов с фильтром «Истекшие».
+
+Если заданы каналы (channels, настройка EXPIRY_SCAN_CHANNELS), проход
+заодно ставит уведомления в очередь (см. notification_outbox.py) и, если
+есть что отправлять, создает фоновое задание отправки. По умолчанию каналов
+нет: автоматическая отправка клиентам включается явно.
+
+Планировщик работает потоком в процессе приложения (ExpiryScanner) или
+отдельным процессом:
+    python expiry_scanner.py                        # проход каждые --interval секунд
+    python expiry_scanner.py --once                 # один проход (например, из cron)
+    python expiry_scanner.py --channels email,sms   # с постановкой уведомлений в очередь
+Задание отправки, созданное отдельным процессом, выполнит очередь фоновых
+заданий приложения.
+"""
+import json
+import threading
+import traceback
+from datetime import datetime, timedelta
+from models import db, Policy, Vehicle, Client, Job, ExpiringPolicy, ScannerState
+from notification_outbox import (DEFAULT_NOTICE_WINDOWS, count_due_notifications,
+                                 enqueue_expiry_notifications)
+
+# Имя сканера в таблице состояний
+SCANNER_NAME = 'expiry'
+
+# Период между проходами по умолчанию (сек)
+DEFAULT_SCAN_INTERVAL = 300
+
+# Горизонт истекающих полисов и глубина хранения истекших (дней)
+DEFAULT_HORIZON_DAYS = 30
+DEFAULT_LOOKBACK_DAYS = 30
+
+# Период полной перестройки таблицы
+DEFAULT_FULL_SCAN_INTERVAL = timedelta(hours=24)
+
+# Вид и автор задания отправки уведомлений из очереди
+DELIVERY_JOB_KIND = 'notification_outbox'
+SCANNER_USER = 'scanner'
+
+def scan_expiring_policies(current_date, horizon_days=DEFAULT_HORIZON_DAYS,
+                           lookback_days=DEFAULT_LOOKBACK_DAYS,
+                           full_scan_interval=DEFAULT_FULL_SCAN_INTERVAL):
+    """
+    Обновляет таблицу истекающих полисов и водяной знак. Транзакцию не
+    фиксирует. Возвращает {'full', 'added', 'removed'}.
+    """
+    state = db.session.get(ScannerState, SCANNER_NAME)
+    if state is None:
+        state = ScannerState(name=SCANNER_NAME)
+        db.session.add(state)
+
+    horizon = current_date + timedelta(days=horizon_days)
+    oldest = current_date - timedelta(days=lookback_days)
+    full = (state.watermark is None or state.full_scan_at is None
+            or current_date - state.full_scan_at >= full_scan_interval)
+
+    if full:
+        db.session.execute(db.delete(ExpiringPolicy))
+        candidates = (db.select(Policy.id, Policy.end_date)
+                      .where(Policy.status.in_(['active', 'expired']),
+                             Policy.end_date >= oldest,
+                             Policy.end_date <= horizon))
+        state.full_scan_at = current_date
+    else:
+        # Только полисы, срок которых вошел в горизонт после прошлого прохода
+        candidates = (db.select(Policy.id, Policy.end_date)
+                      .where(Policy.status == 'active',
+                             Policy.end_date > state.watermark,
+                             Policy.end_date <= horizon))
+    added = db.session.execute(db.insert(ExpiringPolicy)
+                               .from_select(['policy_id', 'end_date'], candidates)
+                               .prefix_with('OR IGNORE')).rowcount
+
+    # Убираем давно истекшие и отмененные полисы
+    inactive = db.select(Policy.id).where(Policy.status.notin_(['active', 'expired']))
+    removed = db.session.execute(db.delete(ExpiringPolicy)
+                                 .where(db.or_(ExpiringPolicy.end_date < oldest,
+                                               ExpiringPolicy.policy_id.in_(inactive)))).rowcount
+
+    state.watermark = horizon
+    state.last_run_at = current_date
+    return {'full': full, 'added': added, 'removed': removed}
+
+def schedule_outbox_delivery(created_by=SCANNER_USER):
+    """
+    Создает задание отправки уведомлений из очереди, если такое задание
+    еще не ждет и не выполняется. Возвращает id задания.
+    """
+    job_id = (db.session.query(Job.id)
+              .filter(Job.kind == DELIVERY_JOB_KIND, Job.status.in_(['queued', 'running']))
+              .scalar())
+    if job_id is None:
+        job = Job(kind=DELIVERY_JOB_KIND, params=json.dumps({}), created_by=created_by)
+        db.session.add(job)
+        db.session.flush()
+        job_id = job.id
+    return job_id
+
+def run_expiry_scan(current_date=None, channels=(), horizon_days=DEFAULT_HORIZON_DAYS,
+                    lookback_days=DEFAULT_LOOKBACK_DAYS, full_scan_interval=DEFAULT_FULL_SCAN_INTERVAL,
+                    windows=DEFAULT_NOTICE_WINDOWS):
+    """
+    Один проход планировщика: обновляет таблицу истекающих полисов, а если
+    заданы каналы channels - ставит уведомления в очередь и при необходимости
+    создает задание отправки.
+    Фиксирует транзакцию и возвращает сводку прохода.
+    """
+    if current_date is None:
+        current_date = datetime.now()
+
+    summary = scan_expiring_policies(current_date, horizon_days, lookback_days, full_scan_interval)
+    summary['queued'] = 0
+    summary['delivery_job'] = None
+    if channels:
+        summary['queued'] = enqueue_expiry_notifications(current_date, channels, windows=windows)
+        if count_due_notifications(current_date):
+            summary['delivery_job'] = schedule_outbox_delivery()
+    db.session.commit()
+    return summary
+
+def expiring_policy_rows(current_date, days=DEFAULT_HORIZON_DAYS):
+    """Действующие полисы, истекающие в ближайшие days дней: (Policy, Vehicle, Client)"""
+    return (db.session.query(Policy, Vehicle, Client)
+            .select_from(ExpiringPolicy)
+            .join(Policy, Policy.id == ExpiringPolicy.policy_id)
+            .join(Vehicle, Vehicle.id == Policy.vehicle_id)
+            .join(Client, Client.id == Vehicle.client_id)
+            .filter(ExpiringPolicy.end_date > current_date,
+                    ExpiringPolicy.end_date < current_date + timedelta(days=days),
+                    Policy.status == 'active')
+            .order_by(ExpiringPolicy.end_date)
+            .all())
+
+def expired_policy_rows(current_date):
+    """Недавно истекшие полисы (сначала последние): (Policy, Vehicle, Client)"""
+    return (db.session.query(Policy, Vehicle, Client)
+            .select_from(ExpiringPolicy)
+            .join(Policy, Policy.id == ExpiringPolicy.policy_id)
+            .join(Vehicle, Vehicle.id == Policy.vehicle_id)
+            .join(Client, Client.id == Vehicle.client_id)
+            .filter(ExpiringPolicy.end_date < current_date,
+                    Policy.status.in_(['active', 'expired']))
+            .order_by(ExpiringPolicy.end_date.desc())
+            .all())
+
+def scanner_state():
+    """Состояние планировщика (ScannerState) или None, если проходов еще не было"""
+    return db.session.get(ScannerState, SCANNER_NAME)
+
+class ExpiryScanner:
+    """
+    Поток приложения, выполняющий проход планировщика каждые interval секунд.
+    Запускается методом start() (повторные вызовы ничего не делают).
+    """
+
+    def __init__(self, app, interval=DEFAULT_SCAN_INTERVAL, **options):
+        self.app = app
+        self.interval = interval
+        self.options = options
+        self.last_summary = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='expiry-scanner', daemon=True)
+                self._thread.start()
+
+    def run_once(self, current_date=None):
+        """Выполняет проход немедленно и возвращает его сводку"""
+        with self.app.app_context():
+            try:
+                self.last_summary = run_expiry_scan(current_date, **self.options)
+            except Exception:
+                db.session.rollback()
+                raise
+        return self.last_summary
+
+    def _loop(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                traceback.print_exc()
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    from flask import Flask
+
+    parser = argparse.ArgumentParser(description='Планировщик поиска истекающих полисов')
+    parser.add_argument('--once', action='store_true', help='Выполнить один проход и завершиться')
+    parser.add_argument('--interval', type=int, default=DEFAULT_SCAN_INTERVAL,
+                        help='Период между проходами, сек')
+    parser.add_argument('--channels', default='',
+                        help='Каналы автоматических уведомлений через запятую (email, sms); '
+                             'по умолчанию уведомления в очередь не ставятся')
+    parser.add_argument('--lookback-days', type=int, default=DEFAULT_LOOKBACK_DAYS,
+                        help='За сколько дней хранить истекшие полисы для экрана уведомлений')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///osago.db'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    db.init_app(app)
+
+    channels = tuple(channel.strip() for channel in args.channels.split(',') if channel.strip())
+    scanner = ExpiryScanner(app, args.interval, channels=channels, lookback_days=args.lookback_days)
+    while True:
+        try:
+            summary = scanner.run_once()
+            print(f"{datetime.now():%d.%m.%Y %H:%M:%S} "
+                  f"{'полный' if summary['full'] else 'инкрементальный'} проход: "
+                  f"добавлено {summary['added']}, удалено {summary['removed']}, "
+                  f"уведомлений в очередь {summary['queued']}")
+        except Exception as e:
+            print(f'Ошибка при поиске истекающих полисов: {str(e)}')
+        if args.once:
+            break
+        time.sleep(args.interval)
@@ -0,0 +1,209 @@
+"""
+Модуль выгрузки полисов в файлы для внешней обработки.
+
+Полисы читаются одним запросом с соединением ТС и владельца (без запросов
+на каждую строку) и порциями через yield_per, а строки сразу пишутся в файл.
+Поэтому память, занимаемая выгрузкой, не зависит от числа полисов.
+
+Кроме CSV поддерживается выгрузка в Parquet с типизированными столбцами
+(даты - timestamp, стоимость - float64, статус и марка - категориальные),
+которую pandas читает без разбора строк.
+"""
+import csv
+import io
+import os
+from datetime import datetime
+from models import db, Client, Vehicle, Policy, policy_status_label
+
+# Размер порции строк, читаемых из базы и записываемых за один раз
+DEFAULT_CHUNK_SIZE = 1000
+
+# Число строк в группе строк (row group) файла Parquet
+DEFAULT_PARQUET_BATCH_SIZE = 50000
+
+# Заголовки столбцов выгрузки
+EXPORT_COLUMNS = ['Номер полиса', 'Статус', 'Дата создания', 'Дата начала', 'Дата окончания',
+                  'Стоимость', 'Марка ТС', 'Модель ТС', 'Гос. номер', 'Владелец']
+
+def _export_columns():
+    return (Policy.number, Policy.status, Policy.created_at, Policy.start_date, Policy.end_date,
+            Policy.cost, Vehicle.brand, Vehicle.model, Vehicle.reg_number, Client.full_name)
+
+def _export_query(*columns):
+    return (db.session.query(*columns)
+            .outerjoin(Vehicle, Vehicle.id == Policy.vehicle_id)
+            .outerjoin(Client, Client.id == Vehicle.client_id))
+
+def policy_export_query(chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Запрос строк выгрузки: (номер, статус, дата создания, начало, окончание,
+    стоимость, марка, модель, гос. номер, владелец), читаемых порциями.
+    Должен выполняться внутри контекста приложения.
+    """
+    return _export_query(*_export_columns()).order_by(Policy.id).yield_per(chunk_size)
+
+def policy_export_chunk(after_id, limit=DEFAULT_CHUNK_SIZE):
+    """Следующая порция строк выгрузки после полиса after_id: (id полиса, строка)"""
+    return (_export_query(Policy.id, *_export_columns())
+            .filter(Policy.id > after_id)
+            .order_by(Policy.id)
+            .limit(limit)
+            .all())
+
+def format_export_row(row, current_date):
+    """Значения строки выгрузки, отформатированные для CSV"""
+    (number, status, created_at, start_date, end_date, cost,
+     brand, model, reg_number, full_name) = row
+    return [
+        number,
+        policy_status_label(status, end_date, current_date),
+        created_at.strftime('%d.%m.%Y'),
+        start_date.strftime('%d.%m.%Y'),
+        end_date.strftime('%d.%m.%Y'),
+        cost,
+        brand or '',
+        model or '',
+        reg_number or '',
+        full_name or ''
+    ]
+
+def iter_policy_export_rows(current_date=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Генератор строк выгрузки со значениями, отформатированными для CSV"""
+    if current_date is None:
+        current_date = datetime.now()
+
+    for row in policy_export_query(chunk_size):
+        yield format_export_row(row, current_date)
+
+def write_policy_export_csv(file_path, current_date=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Записывает выгрузку полисов в CSV-файл (UTF-8 с BOM), возвращает число строк"""
+    rows = 0
+    with open(file_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(EXPORT_COLUMNS)
+        for row in iter_policy_export_rows(current_date, chunk_size):
+            writer.writerow(row)
+            rows += 1
+    return rows
+
+def _csv_bytes(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerows(rows)
+    return buffer.getvalue().encode('utf-8')
+
+def write_policy_export_csv_resumable(file_path, current_date, chunk_size=DEFAULT_CHUNK_SIZE,
+                                      checkpoint=None, on_chunk=None):
+    """
+    Записывает выгрузку в CSV порциями по chunk_size строк с контрольными точками.
+
+    Контрольная точка - словарь {'last_id', 'rows', 'size', 'total'}: последний
+    выгруженный полис, число строк, размер файла и общее число полисов.
+    После записи каждой порции файл сбрасывается на диск и вызывается
+    on_chunk(прогресс в процентах, контрольная точка). Если передана
+    контрольная точка прерванной выгрузки, файл обрезается до сохраненного
+    размера и выгрузка продолжается со следующего полиса. Возвращает число строк.
+    """
+    resume = checkpoint is not None and os.path.exists(file_path)
+    if not resume:
+        total = db.session.query(db.func.count(Policy.id)).scalar()
+        checkpoint = {'last_id': 0, 'rows': 0, 'size': 0, 'total': total}
+
+    with open(file_path, 'r+b' if resume else 'wb') as f:
+        if resume:
+            # Отбрасываем строки, записанные после последней контрольной точки
+            f.truncate(checkpoint['size'])
+            f.seek(checkpoint['size'])
+        else:
+            f.write('\ufeff'.encode('utf-8') + _csv_bytes([EXPORT_COLUMNS]))
+
+        while True:
+            rows = policy_export_chunk(checkpoint['last_id'], chunk_size)
+            if not rows:
+                break
+            f.write(_csv_bytes(format_export_row(row[1:], current_date) for row in rows))
+            f.flush()
+            os.fsync(f.fileno())
+
+            checkpoint = dict(checkpoint, last_id=rows[-1][0], rows=checkpoint['rows'] + len(rows),
+                              size=f.tell())
+            if on_chunk is not None:
+                total = max(checkpoint['total'], checkpoint['rows'])
+                on_chunk(checkpoint['rows'] / total * 100, checkpoint)
+
+    return checkpoint['rows']
+
+def policy_export_schema():
+    """Схема Arrow для выгрузки в Parquet (имена столбцов совпадают с CSV)"""
+    import pyarrow as pa
+
+    category = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ('Номер полиса', pa.string()),
+        ('Статус', category),
+        ('Дата создания', pa.timestamp('us')),
+        ('Дата начала', pa.timestamp('us')),
+        ('Дата окончания', pa.timestamp('us')),
+        ('Стоимость', pa.float64()),
+        ('Марка ТС', category),
+        ('Модель ТС', pa.string()),
+        ('Гос. номер', pa.string()),
+        ('Владелец', pa.string())
+    ])
+
+def _parquet_batch(schema, columns):
+    """Собирает RecordBatch из списков значений по столбцам"""
+    import pyarrow as pa
+
+    arrays = []
+    for field, values in zip(schema, columns):
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def write_policy_export_parquet(file_path, current_date=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                                batch_size=DEFAULT_PARQUET_BATCH_SIZE, on_chunk=None):
+    """
+    Записывает выгрузку полисов в файл Parquet группами по batch_size строк,
+    возвращает число строк. Требуется библиотека pyarrow.
+
+    Строки читаются порциями по chunk_size после последнего выгруженного
+    полиса; после каждой порции вызывается on_chunk(прогресс в процентах).
+    Между порциями запрос не держит курсор открытым, поэтому on_chunk может
+    фиксировать транзакцию (прогресс фонового задания). Файл Parquet нельзя
+    дописать после сбоя, поэтому прерванная выгрузка начинается заново.
+    """
+    import pyarrow.parquet as pq
+
+    if current_date is None:
+        current_date = datetime.now()
+
+    total = db.session.query(db.func.count(Policy.id)).scalar() if on_chunk is not None else 0
+    schema = policy_export_schema()
+    columns = [[] for _ in schema]
+    rows = 0
+    last_id = 0
+    with pq.ParquetWriter(file_path, schema, compression='snappy') as writer:
+        while True:
+            chunk = policy_export_chunk(last_id, chunk_size)
+            if not chunk:
+                break
+            for (policy_id, number, status, created_at, start_date, end_date, cost,
+                 brand, model, reg_number, full_name) in chunk:
+                values = (number, policy_status_label(status, end_date, current_date),
+                          created_at, start_date, end_date, cost, brand, model, reg_number, full_name)
+                for column, value in zip(columns, values):
+                    column.append(value)
+                if len(columns[0]) >= batch_size:
+                    writer.write_batch(_parquet_batch(schema, columns))
+                    columns = [[] for _ in schema]
+            last_id = chunk[-1][0]
+            rows += len(chunk)
+            if on_chunk is not None:
+                on_chunk(rows / max(total, rows) * 100)
+
+        if columns[0] or rows == 0:
+            writer.write_batch(_parquet_batch(schema, columns))
+    return rows
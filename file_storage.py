@@ -3,52 +3,76 @@
 """
 import os
 import json
+import threading
 import uuid
 from datetime import datetime
 
+REGISTRY_FILE_NAME = "file_registry.json"
+
 class FileStorage:
-    """Класс для управления хранилищем файлов"""
+    """
+    Класс для управления хранилищем файлов. Файлы регистрируют сессии
+    пользователей и фоновые задания из разных потоков, поэтому реестр
+    читается и записывается под блокировкой.
+    
+    Реестр хранит пути ко всем выгрузкам и отчетам, поэтому лежит в
+    registry_dir, а не в storage_dir: папку с файлами отдает маршрут
+    скачивания, и реестр в ней был бы доступен любому.
+    """
     
-    def __init__(self, storage_dir):
+    def __init__(self, storage_dir, registry_dir):
         """Инициализация хранилища файлов"""
         self.storage_dir = storage_dir
-        self.registry_file = os.path.join(storage_dir, "file_registry.json")
+        self.registry_file = os.path.join(registry_dir, REGISTRY_FILE_NAME)
         self.file_registry = {}
+        self._lock = threading.Lock()
         
-        # Создаем директорию, если она не существует
-        if not os.path.exists(storage_dir):
-            os.makedirs(storage_dir)
+        # Создаем директории, если они не существуют
+        for directory in (storage_dir, registry_dir):
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+        
+        # Реестр прежних версий лежал в папке с файлами - переносим его
+        legacy_registry = os.path.join(storage_dir, REGISTRY_FILE_NAME)
+        if os.path.exists(legacy_registry) and legacy_registry != self.registry_file:
+            if os.path.exists(self.registry_file):
+                os.remove(legacy_registry)
+            else:
+                os.replace(legacy_registry, self.registry_file)
         
         # Загружаем реестр файлов, если он существует
-        if os.path.exists(self.registry_file):
-            try:
-                with open(self.registry_file, 'r', encoding='utf-8') as f:
-                    self.file_registry = json.load(f)
-            except Exception:
-                self.file_registry = {}
+        with self._lock:
+            if os.path.exists(self.registry_file):
+                try:
+                    with open(self.registry_file, 'r', encoding='utf-8') as f:
+                        self.file_registry = json.load(f)
+                except Exception:
+                    self.file_registry = {}
     
     def register_file(self, file_path):
         """Регистрирует файл в хранилище и возвращает его ID"""
         file_id = str(uuid.uuid4())
         filename = os.path.basename(file_path)
         
-        # Сохраняем информацию о файле
-        self.file_registry[file_id] = {
-            'path': file_path,
-            'filename': filename,
-            'created_at': datetime.now().isoformat()
-        }
-        
-        # Сохраняем реестр в файл
-        self._save_registry()
+        with self._lock:
+            # Сохраняем информацию о файле
+            self.file_registry[file_id] = {
+                'path': file_path,
+                'filename': filename,
+                'created_at': datetime.now().isoformat()
+            }
+            
+            # Сохраняем реестр в файл
+            self._save_registry()
         
         return file_id
     
     def get_file_info(self, file_id):
         """Возвращает информацию о файле по его ID"""
-        return self.file_registry.get(file_id)
+        with self._lock:
+            return self.file_registry.get(file_id)
     
     def _save_registry(self):
-        """Сохраняет реестр файлов в JSON"""
+        """Сохраняет реестр файлов в JSON (вызывается под блокировкой)"""
         with open(self.registry_file, 'w', encoding='utf-8') as f:
             json.dump(self.file_registry, f, ensure_ascii=False)
@@ -0,0 +1,254 @@
+"""
+Модуль пакетного импорта клиентов и транспортных средств из CSV или XLSX.
+
+Строка файла - ТС вместе с владельцем (или только клиент, если поля ТС
+пустые). Владелец определяется по паспорту: если клиент с таким паспортом
+уже есть в базе или выше в файле, ТС добавляется ему.
+
+Файл читается потоком. Каждая строка проверяется теми же функциями, что и
+формы (validators.py), а повторы паспортов, VIN и гос. номеров ищутся
+в множествах, загруженных из базы перед импортом, а не отдельным запросом
+на строку. Проверенные строки записываются пакетами по batch_size: клиенты
+и ТС пакета добавляются через executemany в одной транзакции. Ошибки
+возвращаются по строкам, ошибочная строка не мешает остальным.
+"""
+import csv
+import os
+from datetime import datetime
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, Client, Vehicle
+from validators import validate_email, validate_passport, validate_phone, validate_reg_number, validate_vin
+
+# Строк в одном пакете записи по умолчанию
+DEFAULT_BATCH_SIZE = 500
+
+# Поля строки импорта и допустимые заголовки столбцов
+IMPORT_COLUMNS = {
+    'full_name': ('full_name', 'фио'),
+    'passport': ('passport', 'паспорт'),
+    'phone': ('phone', 'телефон'),
+    'email': ('email',),
+    'brand': ('brand', 'марка'),
+    'model': ('model', 'модель'),
+    'year': ('year', 'год выпуска', 'год'),
+    'vin': ('vin',),
+    'reg_number': ('reg_number', 'гос. номер', 'гос номер'),
+    'engine_power': ('engine_power', 'мощность', 'мощность двигателя')
+}
+
+CLIENT_FIELDS = ('full_name', 'passport', 'phone', 'email')
+VEHICLE_FIELDS = ('brand', 'model', 'year', 'vin', 'reg_number', 'engine_power')
+
+def _header_fields(header):
+    """Поля строки импорта по заголовку файла (None для лишних столбцов)"""
+    aliases = {alias: field for field, names in IMPORT_COLUMNS.items() for alias in names}
+    fields = [aliases.get(str(name or '').strip().lower()) for name in header]
+    missing = [field for field in ('full_name', 'passport') if field not in fields]
+    if missing:
+        raise ValueError(f"В файле нет обязательных столбцов: {', '.join(missing)}")
+    return fields
+
+def _cell_text(value):
+    """Значение ячейки в виде строки (целые числа из XLSX - без '.0')"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+def _iter_csv_rows(path):
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(f, dialect)
+        yield next(reader, [])
+        yield from reader
+
+def _iter_xlsx_rows(path):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+def _import_rows(rows, fields):
+    for line, values in enumerate(rows, start=2):
+        row = {field: '' for field in IMPORT_COLUMNS}
+        for field, value in zip(fields, values):
+            if field is not None:
+                row[field] = _cell_text(value)
+        if any(row.values()):
+            yield line, row
+
+def read_import_rows(path):
+    """
+    Строки файла импорта (CSV или XLSX) по одной: пары (номер строки в файле,
+    словарь поле -> текст). Заголовок проверяется сразу (ValueError, если нет
+    обязательных столбцов). Для XLSX требуется библиотека openpyxl.
+    """
+    if os.path.splitext(path)[1].lower() == '.xlsx':
+        rows = _iter_xlsx_rows(path)
+    else:
+        rows = _iter_csv_rows(path)
+    try:
+        fields = _header_fields(next(rows, []))
+    except ValueError:
+        rows.close()
+        raise
+    return _import_rows(rows, fields)
+
+def count_import_rows(path):
+    """Число строк данных в файле импорта (для прогресса)"""
+    if os.path.splitext(path)[1].lower() == '.xlsx':
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True)
+        try:
+            return max((workbook.active.max_row or 1) - 1, 0)
+        finally:
+            workbook.close()
+    return max(sum(1 for _ in _iter_csv_rows(path)) - 1, 0)
+
+def _positive_int(value, name, low=1, high=None):
+    try:
+        number = int(value)
+    except ValueError:
+        return None, f"{name} должен быть целым числом"
+    if number < low or (high is not None and number > high):
+        return None, f"{name}: допустимо от {low}" + (f" до {high}" if high is not None else "")
+    return number, None
+
+class FleetImporter:
+    """
+    Импорт строк с проверкой повторов по множествам, загруженным из базы.
+    Вызывается в контексте приложения.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, current_year=None):
+        self.batch_size = max(batch_size, 1)
+        self.current_year = current_year or datetime.now().year
+        # Паспорт -> id клиента (None - клиент из текущего пакета еще не записан)
+        self.clients = dict(db.session.query(Client.passport, Client.id).all())
+        self.vins = set()
+        self.reg_numbers = set()
+        for vin, reg_number in db.session.query(Vehicle.vin, Vehicle.reg_number):
+            self.vins.add(vin)
+            self.reg_numbers.add(reg_number)
+        self.summary = {'rows': 0, 'clients_added': 0, 'vehicles_added': 0, 'errors': 0}
+
+    def check_row(self, row):
+        """
+        Проверяет строку. Возвращает (клиент для добавления или None,
+        ТС для добавления или None, список ошибок)
+        """
+        errors = []
+        passport = row['passport']
+        existing = passport in self.clients
+        has_vehicle = any(row[field] for field in VEHICLE_FIELDS)
+
+        client = None
+        if not existing:
+            if not row['full_name']:
+                errors.append("Не указано ФИО")
+            for error in (validate_passport(passport), validate_phone(row['phone']),
+                          validate_email(row['email'])):
+                if error:
+                    errors.append(error)
+            client = {field: row[field] or None for field in CLIENT_FIELDS}
+        elif not has_vehicle:
+            errors.append(f"Клиент с паспортом {passport} уже существует")
+
+        vehicle = None
+        if has_vehicle:
+            for field, name in (('brand', 'марка'), ('model', 'модель')):
+                if not row[field]:
+                    errors.append(f"Не указана {name}")
+            year, year_error = _positive_int(row['year'], "Год выпуска", 1900, self.current_year)
+            engine_power, power_error = _positive_int(row['engine_power'], "Мощность двигателя")
+            for error in (year_error, power_error, validate_vin(row['vin']),
+                          validate_reg_number(row['reg_number'])):
+                if error:
+                    errors.append(error)
+            if row['vin'] in self.vins:
+                errors.append(f"Транспортное средство с VIN {row['vin']} уже существует")
+            if row['reg_number'] in self.reg_numbers:
+                errors.append(f"Транспортное средство с гос. номером {row['reg_number']} уже существует")
+            vehicle = {'passport': passport, 'brand': row['brand'], 'model': row['model'], 'year': year,
+                       'vin': row['vin'], 'reg_number': row['reg_number'], 'engine_power': engine_power}
+        return client, vehicle, errors
+
+    def _write_batch(self, batch):
+        """Записывает пакет одной транзакцией. Возвращает ошибки строк пакета."""
+        new_clients = [client for _, client, _ in batch if client is not None]
+        vehicles = [vehicle for _, _, vehicle in batch if vehicle is not None]
+        try:
+            if new_clients:
+                ids = db.session.execute(
+                    db.insert(Client).returning(Client.id, sort_by_parameter_order=True),
+                    new_clients).scalars().all()
+                for client, client_id in zip(new_clients, ids):
+                    self.clients[client['passport']] = client_id
+            if vehicles:
+                db.session.execute(db.insert(Vehicle), [
+                    dict({field: value for field, value in vehicle.items() if field != 'passport'},
+                         client_id=self.clients[vehicle['passport']])
+                    for vehicle in vehicles])
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            # Пакет не записан - его значения снова свободны
+            for client in new_clients:
+                self.clients.pop(client['passport'], None)
+            for vehicle in vehicles:
+                self.vins.discard(vehicle['vin'])
+                self.reg_numbers.discard(vehicle['reg_number'])
+            message = f"Ошибка при сохранении пакета: {str(e.orig if hasattr(e, 'orig') else e)}"
+            return [(line, message) for line, _, _ in batch]
+
+        self.summary['clients_added'] += len(new_clients)
+        self.summary['vehicles_added'] += len(vehicles)
+        return []
+
+    def import_rows(self, rows, on_batch=None):
+        """
+        Импортирует строки (пары номер строки, словарь). После записи каждого
+        пакета вызывается on_batch(номер последней строки, ошибки пакета).
+        Возвращает сводку {'rows', 'clients_added', 'vehicles_added', 'errors'}.
+        """
+        batch = []
+        errors = []
+        last_line = 0
+
+        def flush():
+            batch_errors = errors + (self._write_batch(batch) if batch else [])
+            self.summary['errors'] += len(batch_errors)
+            if on_batch is not None:
+                on_batch(last_line, batch_errors)
+            batch.clear()
+            errors.clear()
+
+        for line, row in rows:
+            last_line = line
+            self.summary['rows'] += 1
+            client, vehicle, row_errors = self.check_row(row)
+            if row_errors:
+                errors.append((line, '; '.join(row_errors)))
+            else:
+                # Значения строки заняты уже до записи пакета
+                if client is not None:
+                    self.clients[client['passport']] = None
+                if vehicle is not None:
+                    self.vins.add(vehicle['vin'])
+                    self.reg_numbers.add(vehicle['reg_number'])
+                batch.append((line, client, vehicle))
+            if len(batch) + len(errors) >= self.batch_size:
+                flush()
+        if batch or errors:
+            flush()
+        return self.summary
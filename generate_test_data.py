@@ -1,113 +1,90 @@
+"""
+Генератор тестовых данных: клиенты, транспортные средства и история полисов.
+
+Объем задается параметрами командной строки, а одинаковое начальное
+значение (--seed) дает одинаковый набор данных. Паспорта, телефоны, VIN и
+гос. номера получаются из порядкового номера строки взаимно однозначным
+перемешиванием, поэтому не повторяются без проверочных запросов к базе
+(значения, которые уже есть в базе, загружаются одним запросом и
+пропускаются). Номера полисов выдаются из последовательностей дней
+(см. policy_numbers.py), стоимость считается по действующему тарифу
+пакетным расчетом.
+
+Строки пишутся пакетами через executemany с настройками SQLite для загрузки
+(без синхронизации с диском, журнал в памяти). На время загрузки триггеры
+поискового индекса и свертки статистики, а также вторичные индексы
+удаляются, а после нее создаются заново и перестраиваются одним проходом.
+Приложение во время загрузки должно быть остановлено.
+
+Запуск:
+    python generate_test_data.py                     # 15 клиентов, как раньше
+    python generate_test_data.py --clients 1000000 --vehicles 1500000 --policies 4000000 --seed 42
+    python generate_test_data.py --database load.db --clients 100000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
 from flask import Flask
-from models import db, Client, Vehicle, Policy
 from sqlalchemy import text
-from datetime import datetime, timedelta
-import random
+from models import db, Client, Vehicle, Policy, PolicyNumberSequence, ScannerState
+from policy_numbers import MAX_DAILY_NUMBER, format_policy_number
+from pricing import batch_policy_cost
+from tariffs import tariff_registry
+from update_db import run_migrations
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///osago.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-db.init_app(app)
-
-# Тестовые данные клиентов
-test_clients = [
-    {
-        "full_name": "Иванов Иван Иванович",
-        "passport": "4512 356789",
-        "phone": "+79001234567",
-        "email": "ivanov@mail.ru"
-    },
-    {
-        "full_name": "Петров Петр Петрович",
-        "passport": "4513 567890",
-        "phone": "+79002345678",
-        "email": "petrov@gmail.com"
-    },
-    {
-        "full_name": "Сидорова Анна Ивановна",
-        "passport": "4514 678901",
-        "phone": "+79003456789",
-        "email": "sidorova@yandex.ru"
-    },
-    {
-        "full_name": "Кузнецов Алексей Сергеевич",
-        "passport": "4515 789012",
-        "phone": "+79004567890",
-        "email": "kuznetsov@mail.ru"
-    },
-    {
-        "full_name": "Смирнова Елена Павловна",
-        "passport": "4516 890123",
-        "phone": "+79005678901",
-        "email": "smirnova@gmail.com"
-    },
-    {
-        "full_name": "Соколов Дмитрий Александрович",
-        "passport": "4517 901234",
-        "phone": "+79006789012",
-        "email": "sokolov@yandex.ru"
-    },
-    {
-        "full_name": "Попова Мария Викторовна",
-        "passport": "4518 012345",
-        "phone": "+79007890123",
-        "email": "popova@mail.ru"
-    },
-    {
-        "full_name": "Лебедев Игорь Николаевич",
-        "passport": "4519 123456",
-        "phone": "+79008901234",
-        "email": "lebedev@gmail.com"
-    },
-    {
-        "full_name": "Новикова Ольга Андреевна",
-        "passport": "4520 234567",
-        "phone": "+79009012345",
-        "email": "novikova@yandex.ru"
-    },
-    {
-        "full_name": "Морозов Артём Дмитриевич",
-        "passport": "4521 345678",
-        "phone": "+79010123456",
-        "email": "morozov@mail.ru"
-    },
-    {
-        "full_name": "Волкова Светлана Игоревна",
-        "passport": "4522 456789",
-        "phone": "+79011234567",
-        "email": "volkova@gmail.com"
-    },
-    {
-        "full_name": "Зайцев Михаил Владимирович",
-        "passport": "4523 567890",
-        "phone": "+79012345678",
-        "email": "zaitsev@yandex.ru"
-    },
-    {
-        "full_name": "Семенова Наталья Алексеевна",
-        "passport": "4524 678901",
-        "phone": "+79013456789",
-        "email": "semenova@mail.ru"
-    },
-    {
-        "full_name": "Голубев Владислав Сергеевич",
-        "passport": "4525 789012",
-        "phone": "+79014567890",
-        "email": "golubev@gmail.com"
-    },
-    {
-        "full_name": "Виноградова Екатерина Михайловна",
-        "passport": "4526 890123",
-        "phone": "+79015678901",
-        "email": "vinogradova@yandex.ru"
-    }
+# Строк в одном пакете вставки по умолчанию
+DEFAULT_BATCH_SIZE = 50000
+
+# Таблицы, на время загрузки которых удаляются триггеры и вторичные индексы
+LOAD_TABLES = ('client', 'vehicle', 'policy')
+
+# Столбцы вставляемых строк (в порядке значений в кортежах генераторов)
+CLIENT_COLUMNS = ('id', 'full_name', 'passport', 'phone', 'email')
+VEHICLE_COLUMNS = ('id', 'client_id', 'brand', 'model', 'year', 'vin', 'reg_number', 'engine_power')
+POLICY_COLUMNS = ('number', 'vehicle_id', 'start_date', 'end_date', 'cost', 'created_at', 'status', 'notes',
+                  'tariff_version')
+
+# Настройки SQLite на время загрузки (действуют только для соединения загрузки)
+LOAD_PRAGMAS = (
+    "PRAGMA synchronous = OFF",
+    "PRAGMA journal_mode = MEMORY",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -262144"
+)
+
+# ФИО: фамилия в мужской форме, имена и отчества для мужчин и женщин
+last_names = [
+    "Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Васильев", "Соколов",
+    "Михайлов", "Новиков", "Федоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семенов",
+    "Егоров", "Павлов", "Козлов", "Степанов", "Николаев", "Орлов", "Андреев", "Макаров",
+    "Никитин", "Захаров", "Зайцев", "Соловьев", "Борисов", "Яковлев", "Григорьев", "Романов",
+    "Воробьев", "Сергеев", "Фролов", "Александров", "Дмитриев", "Королев", "Гусев", "Киселев",
+    "Голубев", "Виноградов", "Богданов", "Тарасов", "Белов", "Комаров", "Медведев", "Ершов"
+]
+male_first_names = [
+    "Александр", "Алексей", "Андрей", "Антон", "Артем", "Владимир", "Владислав", "Дмитрий",
+    "Евгений", "Иван", "Игорь", "Илья", "Кирилл", "Максим", "Михаил", "Никита", "Николай",
+    "Павел", "Роман", "Сергей", "Станислав", "Юрий"
+]
+female_first_names = [
+    "Анна", "Анастасия", "Валентина", "Дарья", "Екатерина", "Елена", "Ирина", "Ксения",
+    "Мария", "Наталья", "Ольга", "Полина", "Светлана", "Софья", "Татьяна", "Юлия"
 ]
+patronymic_roots = [
+    "Александров", "Алексеев", "Андреев", "Владимиров", "Дмитриев", "Иванов", "Игорев",
+    "Михайлов", "Николаев", "Павлов", "Петров", "Сергеев", "Юрьев"
+]
+email_domains = ["mail.ru", "gmail.com", "yandex.ru", "rambler.ru", "bk.ru"]
 
 # Тестовые данные транспортных средств
 car_brands = [
-    "Toyota", "Volkswagen", "Hyundai", "Kia", "Renault", 
-    "Mercedes-Benz", "BMW", "Audi", "Skoda", "Ford", 
+    "Toyota", "Volkswagen", "Hyundai", "Kia", "Renault",
+    "Mercedes-Benz", "BMW", "Audi", "Skoda", "Ford",
     "Nissan", "Honda", "Chevrolet", "Mazda", "Lexus"
 ]
 
@@ -129,190 +106,307 @@ car_models = {
     "Lexus": ["IS", "ES", "GS", "RX", "LX"]
 }
 
-def generate_random_vin():
-    chars = "0123456789ABCDEFGHJKLMNPRSTUVWXYZ"  # VIN не содержит I, O и Q
-    return ''.join(random.choice(chars) for _ in range(17))
-
-def generate_reg_number():
-    letters = "АВЕКМНОРСТУХ"  # Буквы, используемые в российских номерах
-    region_codes = ["77", "78", "50", "99", "97", "777", "197", "750"]
-    
-    letter1 = random.choice(letters)
-    digits = str(random.randint(0, 999)).zfill(3)
-    letter2 = random.choice(letters)
-    letter3 = random.choice(letters)
-    region = random.choice(region_codes)
-    
-    return f"{letter1}{digits}{letter2}{letter3} {region}"
-
-def generate_test_data():
+cancel_reasons = [
+    "По желанию клиента",
+    "Прекращение права собственности на ТС",
+    "Утилизация ТС",
+    "Продажа ТС",
+    "Полная гибель ТС в ДТП"
+]
+
+VIN_CHARS = "0123456789ABCDEFGHJKLMNPRSTUVWXYZ"  # VIN не содержит I, O и Q
+REG_LETTERS = "АВЕКМНОРСТУХ"  # Буквы, используемые в российских номерах
+REG_REGIONS = ["77", "78", "50", "99", "97", "777", "197", "750"]
+
+# Объемы пространств уникальных значений и множители перемешивания
+# (множитель взаимно прост с объемом, поэтому отображение взаимно однозначно)
+PASSPORT_SPACE, PASSPORT_FACTOR = 10 ** 10, 2654435761
+PHONE_SPACE, PHONE_FACTOR = 10 ** 9, 2246822519
+VIN_SPACE, VIN_FACTOR = len(VIN_CHARS) ** 8, 3266489917
+REG_SPACE, REG_FACTOR = len(REG_LETTERS) ** 3 * 1000 * len(REG_REGIONS), 668265263
+
+def _permute(index, space, factor, salt):
+    """Взаимно однозначное перемешивание номеров 0..space-1"""
+    return (index * factor + salt) % space
+
+def make_passport(index, salt):
+    value = _permute(index, PASSPORT_SPACE, PASSPORT_FACTOR, salt)
+    return f"{value // 10 ** 6:04d} {value % 10 ** 6:06d}"
+
+def make_phone(index, salt):
+    return f"+79{_permute(index, PHONE_SPACE, PHONE_FACTOR, salt):09d}"
+
+def make_vin(index, brand, year, salt):
+    # Код производителя и модельного года + 8 символов серийного номера
+    serial = _permute(index, VIN_SPACE, VIN_FACTOR, salt)
+    chars = []
+    for _ in range(8):
+        serial, digit = divmod(serial, len(VIN_CHARS))
+        chars.append(VIN_CHARS[digit])
+    prefix = ''.join(VIN_CHARS[ord(c) % len(VIN_CHARS)] for c in brand.upper()[:3]).ljust(3, 'X')
+    return f"{prefix}{VIN_CHARS[len(brand) % len(VIN_CHARS)] * 5}{VIN_CHARS[year % 30]}{''.join(chars)}"
+
+def make_reg_number(index, salt):
+    value = _permute(index, REG_SPACE, REG_FACTOR, salt)
+    value, region = divmod(value, len(REG_REGIONS))
+    value, digits = divmod(value, 1000)
+    value, letter3 = divmod(value, len(REG_LETTERS))
+    letter1, letter2 = divmod(value, len(REG_LETTERS))
+    return (f"{REG_LETTERS[letter1]}{digits:03d}{REG_LETTERS[letter2]}{REG_LETTERS[letter3]} "
+            f"{REG_REGIONS[region]}")
+
+def make_full_name(rng):
+    last_name = rng.choice(last_names)
+    patronymic = rng.choice(patronymic_roots)
+    if rng.random() < 0.5:
+        return f"{last_name} {rng.choice(male_first_names)} {patronymic}ич"
+    return f"{last_name}а {rng.choice(female_first_names)} {patronymic}на"
+
+class UniqueValues:
+    """
+    Источник неповторяющихся значений: номера перебираются по порядку,
+    значения, уже занятые в базе, пропускаются
+    """
+
+    def __init__(self, make, taken, space):
+        self.make = make
+        self.taken = taken
+        self.space = space
+        self.index = 0
+
+    def next(self, *args):
+        while self.index < self.space:
+            value = self.make(self.index, *args)
+            self.index += 1
+            if value not in self.taken:
+                return value
+        raise RuntimeError("Исчерпано пространство уникальных значений")
+
+def _sql_datetime(value):
+    """Дата и время в формате, в котором их хранит SQLAlchemy для SQLite"""
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+def insert_batches(conn, table, columns, rows, batch_size, label, total):
+    """
+    Вставляет строки (кортежи значений столбцов columns) пакетами через
+    executemany драйвера, фиксируя каждый пакет
+    """
+    statement = (f"INSERT INTO {table.__tablename__} ({', '.join(columns)}) "
+                 f"VALUES ({', '.join('?' * len(columns))})")
+    started = time.perf_counter()
+    batch = []
+    done = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            conn.exec_driver_sql(statement, batch)
+            conn.commit()
+            done += len(batch)
+            batch = []
+            elapsed = time.perf_counter() - started
+            print(f"{label}: {done} из {total} ({done / elapsed:.0f} строк/с)")
+    if batch:
+        conn.exec_driver_sql(statement, batch)
+        conn.commit()
+        done += len(batch)
+    print(f"{label}: {done} за {time.perf_counter() - started:.1f} с")
+    return done
+
+def _drop_load_objects(conn):
+    """Удаляет триггеры и вторичные индексы таблиц загрузки, возвращает их DDL"""
+    placeholders = ', '.join(f"'{table}'" for table in LOAD_TABLES)
+    objects = conn.execute(text(
+        f"SELECT type, name, sql FROM sqlite_master WHERE type IN ('trigger', 'index') "
+        f"AND tbl_name IN ({placeholders}) AND sql IS NOT NULL")).fetchall()
+    for object_type, name, _ in objects:
+        conn.execute(text(f"DROP {object_type.upper()} IF EXISTS {name}"))
+    conn.commit()
+    return objects
+
+def _restore_load_objects(conn, objects):
+    """Создает удаленные индексы и триггеры и перестраивает зависимые данные"""
+    from policy_stats import rebuild_rollup
+    from search_index import rebuild_search_index
+
+    for object_type in ('index', 'trigger'):
+        for current_type, name, sql in objects:
+            if current_type == object_type:
+                print(f"Восстановление {'индекса' if object_type == 'index' else 'триггера'} {name}")
+                conn.execute(text(sql))
+    trigger_names = {name for object_type, name, _ in objects if object_type == 'trigger'}
+    if any(name.endswith('_fts_ai') for name in trigger_names):
+        print("Перестройка полнотекстового индекса")
+        rebuild_search_index(conn)
+    if any(name.startswith('policy_rollup') for name in trigger_names):
+        print("Перестройка свертки статистики")
+        rebuild_rollup(conn)
+    # Истекающие полисы пересчитает полный проход планировщика
+    conn.execute(db.delete(ScannerState))
+    conn.execute(text("ANALYZE"))
+    conn.commit()
+
+def generate_test_data(clients=15, vehicles=None, policies=None, seed=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Добавляет clients клиентов, vehicles ТС (по умолчанию по одному на
+    клиента) и policies полисов (по умолчанию по два на ТС в среднем)
+    """
+    vehicles = clients if vehicles is None else vehicles
+    policies = vehicles * 2 if policies is None else policies
+    if vehicles and not clients:
+        raise ValueError("Для транспортных средств нужны клиенты")
+    if policies and not vehicles:
+        raise ValueError("Для полисов нужны транспортные средства")
+
+    rng = random.Random(seed)
+    # Сдвиги перемешивания зависят от начального значения
+    salts = [rng.randrange(10 ** 9) for _ in range(4)]
+    current_date = datetime.now()
+    current_year = current_date.year
+    tariff = tariff_registry.current()
+
     with app.app_context():
-        # Проверим, есть ли уже данные в базе
-        client_count = db.session.query(db.func.count(Client.id)).scalar()
-        if client_count > 0:
-            print(f"В базе данных уже есть {client_count} клиентов. Хотите добавить еще? (y/n)")
-            response = input().lower()
-            if response != 'y':
-                print("Создание тестовых данных отменено.")
-                return
-        
-        # Добавление клиентов
-        created_clients = []
-        for client_data in test_clients:
-            try:
-                # Проверяем, существует ли клиент с таким паспортом
-                existing_client = Client.query.filter_by(passport=client_data["passport"]).first()
-                if existing_client:
-                    print(f"Клиент с паспортом {client_data['passport']} уже существует")
-                    created_clients.append(existing_client)
-                    continue
-                    
-                client = Client(**client_data)
-                db.session.add(client)
-                db.session.commit()
-                print(f"Добавлен клиент: {client_data['full_name']}")
-                created_clients.append(client)
-            except Exception as e:
-                db.session.rollback()
-                print(f"Ошибка при добавлении клиента {client_data['full_name']}: {str(e)}")
-        
-        # Добавление транспортных средств для каждого клиента
-        for client in created_clients:
-            brand = random.choice(car_brands)
-            model = random.choice(car_models[brand])
-            current_year = datetime.now().year
-            year = random.randint(current_year - 15, current_year)
-            
-            # Генерируем уникальный VIN
-            while True:
-                vin = generate_random_vin()
-                existing_vehicle = Vehicle.query.filter_by(vin=vin).first()
-                if not existing_vehicle:
-                    break
-            
-            # Генерируем уникальный регистрационный номер
-            while True:
-                reg_number = generate_reg_number()
-                existing_vehicle = Vehicle.query.filter_by(reg_number=reg_number).first()
-                if not existing_vehicle:
-                    break
-              # Мощность двигателя
-            engine_power = random.randint(75, 350)
-            
+        db.create_all()
+        run_migrations(db.engine)
+
+        # Занятые значения - одним запросом на таблицу
+        passports = {row[0] for row in db.session.query(Client.passport)}
+        phones = {row[0] for row in db.session.query(Client.phone) if row[0]}
+        vins, reg_numbers = set(), set()
+        for vin, reg_number in db.session.query(Vehicle.vin, Vehicle.reg_number):
+            vins.add(vin)
+            reg_numbers.add(reg_number)
+        next_numbers = dict(db.session.query(PolicyNumberSequence.day, PolicyNumberSequence.next_value))
+        first_client_id = (db.session.query(db.func.max(Client.id)).scalar() or 0) + 1
+        first_vehicle_id = (db.session.query(db.func.max(Vehicle.id)).scalar() or 0) + 1
+        db.session.remove()
+
+        passport_values = UniqueValues(make_passport, passports, PASSPORT_SPACE)
+        phone_values = UniqueValues(make_phone, phones, PHONE_SPACE)
+        vin_values = UniqueValues(make_vin, vins, VIN_SPACE)
+        reg_values = UniqueValues(make_reg_number, reg_numbers, REG_SPACE)
+
+        def client_rows():
+            for number in range(clients):
+                client_id = first_client_id + number
+                phone = phone_values.next(salts[1]) if rng.random() < 0.95 else None
+                email = f"client{client_id}@{rng.choice(email_domains)}" if rng.random() < 0.8 else None
+                yield (client_id, make_full_name(rng), passport_values.next(salts[0]), phone, email)
+
+        # Мощность и год выпуска ТС нужны для расчета стоимости полисов
+        vehicle_power = []
+        vehicle_year = []
+
+        def vehicle_rows():
+            for number in range(vehicles):
+                brand = rng.choice(car_brands)
+                year = rng.randint(current_year - 20, current_year)
+                engine_power = int(min(max(rng.lognormvariate(4.8, 0.35), 50), 450))
+                vehicle_power.append(engine_power)
+                vehicle_year.append(year)
+                # Сначала у каждого клиента по одному ТС, остальные - случайным клиентам
+                owner = number if number < clients else rng.randrange(clients)
+                yield (first_vehicle_id + number, first_client_id + owner, brand,
+                       rng.choice(car_models[brand]), year, vin_values.next(brand, year, salts[2]),
+                       reg_values.next(salts[3]), engine_power)
+
+        def policy_history(vehicle_number, count):
+            """Полисы одного ТС подряд во времени, последний - около текущей даты"""
+            history = []
+            start_date = current_date - timedelta(days=rng.randint(0, 360), minutes=rng.randint(0, 1439))
+            for position in range(count):
+                period_months = rng.choice((3, 6, 12, 12, 12))
+                if position:
+                    start_date -= timedelta(days=30 * period_months + rng.randint(0, 60))
+                end_date = start_date + timedelta(days=30 * period_months)
+                if end_date > current_date:
+                    status, notes = 'active', None
+                else:
+                    status, notes = 'expired', None
+                if rng.random() < (0.05 if position == 0 else 0.15):
+                    status, notes = 'cancelled', rng.choice(cancel_reasons)
+                history.append((vehicle_number, start_date, end_date, period_months, status, notes))
+            return reversed(history)
+
+        def policy_rows():
+            per_vehicle, extra = divmod(policies, vehicles)
+            with_extra = set(rng.sample(range(vehicles), extra))
+            batch = []
+            for vehicle_number in range(vehicles):
+                batch.extend(policy_history(vehicle_number, per_vehicle + (vehicle_number in with_extra)))
+                if len(batch) >= batch_size or vehicle_number == vehicles - 1:
+                    yield from priced_policies(batch)
+                    batch = []
+
+        def priced_policies(batch):
+            # Стоимость всего пакета - одним пакетным расчетом по тарифу
+            bonus_malus_classes = [value for value, _ in tariff.bonus_malus]
+            driver_ages = [rng.randint(18, 75) for _ in batch]
+            costs = batch_policy_cost(
+                [vehicle_power[item[0]] for item in batch],
+                [vehicle_year[item[0]] for item in batch],
+                driver_ages,
+                [rng.randint(0, age - 18) for age in driver_ages],
+                [rng.choice(bonus_malus_classes) for _ in batch],
+                [item[3] for item in batch],
+                current_year=current_year, tariff=tariff).tolist()
+            for (vehicle_number, start_date, end_date, _, status, notes), cost in zip(batch, costs):
+                day = start_date.strftime('%Y%m%d')
+                value = next_numbers.get(day, 1)
+                if value > MAX_DAILY_NUMBER:
+                    raise RuntimeError(f"Исчерпаны номера полисов за {day}")
+                next_numbers[day] = value + 1
+                start = _sql_datetime(start_date)
+                yield (format_policy_number(day, value), first_vehicle_id + vehicle_number, start,
+                       _sql_datetime(end_date), cost, start, status, notes, tariff.version)
+
+        started = time.perf_counter()
+        with db.engine.connect() as conn:
+            for pragma in LOAD_PRAGMAS:
+                conn.exec_driver_sql(pragma)
+            dropped = _drop_load_objects(conn)
             try:
-                vehicle = Vehicle(
-                    client_id=client.id,
-                    brand=brand,
-                    model=model,
-                    year=year,
-                    vin=vin,
-                    reg_number=reg_number,
-                    engine_power=engine_power
-                )
-                db.session.add(vehicle)
-                db.session.commit()
-                print(f"Добавлено ТС: {brand} {model}, {year}, {reg_number} для клиента {client.full_name}")
-                  
-                # История полисов для этого ТС (1-3 полиса, но только один активный)
-                policy_count = random.randint(1, 3)
-                
-                # Создаем историю полисов
-                for i in range(policy_count):
-                    # Определяем период полиса
-                    period_months = random.choice([3, 6, 12])
-                    
-                    # Определяем даты в зависимости от номера полиса в истории
-                    if i == 0 and policy_count > 1:  # Самый старый полис (если есть несколько)
-                        # Полис, который был давно (больше года назад)
-                        start_date = datetime.now() - timedelta(days=random.randint(400, 700))
-                        end_date = start_date + timedelta(days=30*period_months)
-                        # Всегда истекший или отмененный
-                        status = 'cancelled' if random.random() > 0.5 else 'active'  # активный но с истекшим сроком
-                    elif i == policy_count - 1:  # Самый новый полис
-                        # Текущий полис (в пределах 3 месяцев)
-                        start_date = datetime.now() - timedelta(days=random.randint(0, 30))
-                        end_date = start_date + timedelta(days=30*period_months)
-                        # С большей вероятностью активный
-                        status = 'active' if random.random() > 0.3 else 'cancelled'
-                    else:  # Средний полис в истории
-                        # Между старым и новым полисом
-                        start_date = datetime.now() - timedelta(days=random.randint(150, 350))
-                        end_date = start_date + timedelta(days=30*period_months)
-                        # Истекший или отмененный
-                        status = 'cancelled' if random.random() > 0.5 else 'active'  # активный но с истекшим сроком
-                    
-                    # Проверяем действительность полиса (полис не может быть активен, если срок истек)
-                    if status == 'active' and end_date < datetime.now():
-                        # Это "бывший активный", но истекший полис
-                        pass  # оставляем статус 'active', но при отображении он будет показываться как истекший
-                    
-                    # Стоимость полиса
-                    base_cost = 5000
-                    # Коэффициенты для расчета стоимости
-                    power_factor = 1.0 + (vehicle.engine_power - 100) / 200  # От 0.6 до 2.0 в зависимости от мощности
-                    age_factor = 1.0 + (current_year - vehicle.year) / 20  # Старше - дороже
-                    
-                    cost = base_cost * power_factor * age_factor * (period_months / 12)
-                    cost = round(cost, 2)
-                    
-                    # Генерируем номер полиса
-                    prefix = "OSG"
-                    date_part = start_date.strftime('%Y%m%d')
-                    random_part = ''.join([str(random.randint(0, 9)) for _ in range(4)])
-                    policy_number = f"{prefix}-{date_part}-{random_part}"
-                    
-                    # Примечания для отмененных полисов
-                    notes = None
-                    if status == 'cancelled':
-                        cancel_reasons = [
-                            "По желанию клиента",
-                            "Прекращение права собственности на ТС",
-                            "Утилизация ТС",
-                            "Продажа ТС",
-                            "Полная гибель ТС в ДТП"
-                        ]
-                        notes = random.choice(cancel_reasons)
-                    
-                    policy = Policy(
-                        number=policy_number,
-                        vehicle_id=vehicle.id,
-                        start_date=start_date,
-                        end_date=end_date,
-                        cost=cost,
-                        created_at=start_date,
-                        status=status,
-                        notes=notes
-                    )
-                    db.session.add(policy)
-                    db.session.commit()
-                    
-                    policy_status = "активный"
-                    if status == 'cancelled':
-                        policy_status = "отмененный"
-                    elif end_date < datetime.now():
-                        policy_status = "истекший"
-                    
-                    print(f"Добавлен {policy_status} полис: {policy_number}, период: {period_months} мес., стоимость: {cost} руб.")
-                
-            except Exception as e:
-                db.session.rollback()
-                print(f"Ошибка при добавлении ТС для клиента {client.full_name}: {str(e)}")
-        
-        print("\nСоздание тестовых данных завершено!")
-        
+                insert_batches(conn, Client, CLIENT_COLUMNS, client_rows(), batch_size, "Клиенты", clients)
+                insert_batches(conn, Vehicle, VEHICLE_COLUMNS, vehicle_rows(), batch_size,
+                               "Транспортные средства", vehicles)
+                if policies:
+                    insert_batches(conn, Policy, POLICY_COLUMNS, policy_rows(), batch_size, "Полисы", policies)
+                    # Последовательности номеров продолжаются после выданных здесь номеров
+                    conn.execute(text(
+                        "INSERT INTO policy_number_sequence (day, next_value) VALUES (:day, :next_value) "
+                        "ON CONFLICT(day) DO UPDATE SET next_value = MAX(next_value, excluded.next_value)"),
+                        [{'day': day, 'next_value': value} for day, value in next_numbers.items()])
+                    conn.commit()
+            finally:
+                conn.rollback()
+                _restore_load_objects(conn, dropped)
+        print(f"\nСоздание тестовых данных завершено за {time.perf_counter() - started:.1f} с")
+
         # Вывод статистики
         client_count = db.session.query(db.func.count(Client.id)).scalar()
         vehicle_count = db.session.query(db.func.count(Vehicle.id)).scalar()
-        policy_count = db.session.query(db.func.count(Policy.id)).scalar()
-        active_policies = db.session.query(db.func.count(Policy.id)).filter_by(status='active').scalar()
-        cancelled_policies = db.session.query(db.func.count(Policy.id)).filter_by(status='cancelled').scalar()
-        
-        print(f"\nВсего в базе данных:")
+        status_counts = dict(db.session.query(Policy.status, db.func.count(Policy.id))
+                             .group_by(Policy.status).all())
+
+        print("\nВсего в базе данных:")
         print(f"Клиентов: {client_count}")
         print(f"Транспортных средств: {vehicle_count}")
-        print(f"Полисов: {policy_count}")
-        print(f"  - Активных полисов: {active_policies}")
-        print(f"  - Отмененных полисов: {cancelled_policies}")
+        print(f"Полисов: {sum(status_counts.values())}")
+        print(f"  - Активных полисов: {status_counts.get('active', 0)}")
+        print(f"  - Истекших полисов: {status_counts.get('expired', 0)}")
+        print(f"  - Отмененных полисов: {status_counts.get('cancelled', 0)}")
 
 if __name__ == "__main__":
-    generate_test_data()
+    parser = argparse.ArgumentParser(description='Генерация тестовых данных')
+    parser.add_argument('--clients', type=int, default=15, help='Число клиентов')
+    parser.add_argument('--vehicles', type=int, help='Число ТС (по умолчанию - по одному на клиента)')
+    parser.add_argument('--policies', type=int, help='Число полисов (по умолчанию - по два на ТС)')
+    parser.add_argument('--seed', type=int, help='Начальное значение генератора (одинаковое - одинаковые данные)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Строк в пакете вставки')
+    parser.add_argument('--database', help='Файл базы SQLite (по умолчанию - база приложения osago.db)')
+    args = parser.parse_args()
+
+    if args.database:
+        app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{args.database}'
+    db.init_app(app)
+
+    generate_test_data(args.clients, args.vehicles, args.policies, args.seed, args.batch_size)
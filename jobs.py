@@ -0,0 +1,228 @@
+"""
+Модуль фоновых заданий: выгрузки, отчеты и массовые рассылки.
+
+Задания хранятся в таблице job и выполняются рабочими потоками приложения,
+поэтому не зависят от сессии PyWebIO: закрытие вкладки не прерывает работу,
+а экран может в любой момент снова открыть задание и показать прогресс.
+
+Обработчик задания регистрируется декоратором @job_handler и получает
+JobContext: параметры, сохраненную контрольную точку и метод report(),
+который в одной транзакции записывает прогресс и новую контрольную точку.
+Если процесс упал, при следующем запуске очереди незавершенные задания
+возвращаются в очередь и продолжаются с последней контрольной точки.
+"""
+import json
+import threading
+import traceback
+from datetime import datetime
+from models import db, Job
+
+# Зарегистрированные виды заданий: вид -> (название, функция)
+JOB_HANDLERS = {}
+
+# Названия статусов заданий для экранов
+JOB_STATUS_LABELS = {
+    'queued': 'В очереди',
+    'running': 'Выполняется',
+    'completed': 'Завершено',
+    'failed': 'Ошибка',
+    'cancelled': 'Отменено'
+}
+
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+def job_handler(kind, title):
+    """Декоратор для регистрации обработчика заданий указанного вида"""
+    def decorator(func):
+        JOB_HANDLERS[kind] = (title, func)
+        return func
+    return decorator
+
+class JobCancelled(Exception):
+    """Задание отменено пользователем"""
+
+class JobContext:
+    """Параметры выполняемого задания и средства сообщить о его прогрессе"""
+
+    def __init__(self, job_id, params, checkpoint):
+        self.job_id = job_id
+        self.params = params
+        self.checkpoint = checkpoint
+
+    def report(self, progress, checkpoint=None):
+        """
+        Сохраняет прогресс (0-100) и контрольную точку. Вызывается после того,
+        как результат очередной порции надежно записан. Если пользователь
+        отменил задание, выбрасывает JobCancelled.
+        """
+        values = {'progress': min(max(progress, 0), 100), 'updated_at': datetime.now()}
+        if checkpoint is not None:
+            self.checkpoint = checkpoint
+            values['checkpoint'] = json.dumps(checkpoint, ensure_ascii=False)
+        Job.query.filter_by(id=self.job_id).update(values)
+        db.session.commit()
+
+        if self.cancelled:
+            raise JobCancelled()
+
+    @property
+    def cancelled(self):
+        cancel_requested = (db.session.query(Job.cancel_requested)
+                            .filter(Job.id == self.job_id).scalar())
+        return bool(cancel_requested)
+
+def job_to_dict(job):
+    """Представление задания для экранов"""
+    title = JOB_HANDLERS.get(job.kind, (job.kind, None))[0]
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'title': title,
+        'status': job.status,
+        'status_label': JOB_STATUS_LABELS.get(job.status, job.status),
+        'progress': job.progress,
+        'params': json.loads(job.params) if job.params else {},
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'cancel_requested': job.cancel_requested,
+        'created_by': job.created_by,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at
+    }
+
+class JobQueue:
+    """
+    Очередь фоновых заданий на таблице job с пулом рабочих потоков.
+
+    Рабочие потоки запускаются методом start() (повторные вызовы ничего
+    не делают), а не при импорте приложения: процессы пула отрисовки
+    импортируют app.py и не должны забирать задания.
+    """
+
+    def __init__(self, app, workers=2, poll_interval=1.0):
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Возвращает в очередь прерванные задания и запускает рабочие потоки"""
+        with self._lock:
+            if self._threads:
+                return
+            with self.app.app_context():
+                # Задания, выполнявшиеся при аварийной остановке, продолжатся с контрольной точки
+                Job.query.filter_by(status='running').update({'status': 'queued'})
+                db.session.commit()
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'job-worker-{number + 1}',
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, kind, params=None, created_by=None):
+        """Ставит задание в очередь и возвращает его идентификатор"""
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Неизвестный вид задания: {kind}")
+        self.start()
+        with self.app.app_context():
+            job = Job(kind=kind, params=json.dumps(params or {}, ensure_ascii=False),
+                      created_by=created_by)
+            db.session.add(job)
+            db.session.commit()
+            job_id = job.id
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        """Возвращает задание в виде словаря или None"""
+        with self.app.app_context():
+            job = db.session.get(Job, job_id)
+            return job_to_dict(job) if job else None
+
+    def list_jobs(self, created_by=None, limit=20):
+        """Последние задания (все или созданные указанным пользователем)"""
+        with self.app.app_context():
+            query = Job.query
+            if created_by is not None:
+                query = query.filter(Job.created_by == created_by)
+            return [job_to_dict(job) for job in query.order_by(Job.id.desc()).limit(limit).all()]
+
+    def cancel(self, job_id):
+        """
+        Отменяет задание: ожидающее - сразу, выполняющееся - на ближайшей
+        контрольной точке. Возвращает False, если задание уже завершено.
+        """
+        with self.app.app_context():
+            now = datetime.now()
+            cancelled = (Job.query.filter_by(id=job_id, status='queued')
+                         .update({'status': 'cancelled', 'cancel_requested': True,
+                                  'updated_at': now, 'finished_at': now}))
+            if not cancelled:
+                cancelled = (Job.query.filter_by(id=job_id, status='running')
+                             .update({'cancel_requested': True, 'updated_at': now}))
+            db.session.commit()
+            return bool(cancelled)
+
+    def _claim(self):
+        """Забирает самое старое ожидающее задание, возвращает (id, вид, параметры, точка)"""
+        while True:
+            job = (Job.query.filter_by(status='queued')
+                   .order_by(Job.id)
+                   .with_entities(Job.id, Job.kind, Job.params, Job.checkpoint)
+                   .first())
+            if job is None:
+                return None
+            # Условное обновление: задание достается только одному потоку
+            claimed = (Job.query.filter_by(id=job.id, status='queued')
+                       .update({'status': 'running', 'updated_at': datetime.now()}))
+            db.session.commit()
+            if claimed:
+                return job
+
+    def _finish(self, job_id, status, result=None, error=None):
+        now = datetime.now()
+        values = {'status': status, 'updated_at': now, 'finished_at': now}
+        if status == 'completed':
+            values['progress'] = 100
+        if result is not None:
+            values['result'] = json.dumps(result, ensure_ascii=False)
+        if error is not None:
+            values['error'] = error
+        Job.query.filter_by(id=job_id).update(values)
+        db.session.commit()
+
+    def _run(self, job):
+        title, handler = JOB_HANDLERS.get(job.kind, (None, None))
+        if handler is None:
+            self._finish(job.id, 'failed', error=f"Неизвестный вид задания: {job.kind}")
+            return
+
+        context = JobContext(job.id, json.loads(job.params) if job.params else {},
+                             json.loads(job.checkpoint) if job.checkpoint else None)
+        try:
+            result = handler(context)
+        except JobCancelled:
+            db.session.rollback()
+            self._finish(job.id, 'cancelled')
+        except Exception as e:
+            db.session.rollback()
+            traceback.print_exc()
+            self._finish(job.id, 'failed', error=str(e))
+        else:
+            self._finish(job.id, 'completed', result=result)
+
+    def _worker(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    job = self._claim()
+                    if job is not None:
+                        self._run(job)
+                        continue
+            except Exception:
+                traceback.print_exc()
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
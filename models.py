@@ -27,6 +27,10 @@ class Vehicle(db.Model):
     reg_number = db.Column(db.String(20), unique=True, nullable=False)
     engine_power = db.Column(db.Integer)  # в лошадиных силах
 
+    __table_args__ = (
+        db.Index('ix_vehicle_client_id', 'client_id'),
+    )
+
 class Policy(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     number = db.Column(db.String(20), unique=True, nullable=False)
@@ -37,4 +41,128 @@ class Policy(db.Model):
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     status = db.Column(db.String(20), nullable=False, default='active')
     notes = db.Column(db.Text)  # Для причины отмены и других примечаний
+    tariff_version = db.Column(db.Integer)  # Версия тарифа, по которой рассчитана стоимость (см. tariffs.py)
     vehicle = db.relationship('Vehicle', backref='policies')
+
+    # Индексы для фильтрации по статусу/сроку, сортировки по дате создания
+    # и соединения с ТС (см. миграцию 2 в update_db.py)
+    __table_args__ = (
+        db.Index('ix_policy_status_end_date', 'status', 'end_date'),
+        db.Index('ix_policy_created_at', 'created_at'),
+        db.Index('ix_policy_vehicle_id_start_date', 'vehicle_id', 'start_date'),
+    )
+
+# Подписи текущего статуса полиса (см. policy_actual_status)
+POLICY_STATUS_LABELS = {
+    'active': 'Активен',
+    'expired': 'Истек',
+    'cancelled': 'Отменен'
+}
+
+def policy_actual_status(status, end_date, current_date):
+    """
+    Текущий статус полиса: 'cancelled' - отменен, 'expired' - срок действия
+    истек (в том числе еще не переведен в статус expired ночным заданием),
+    иначе 'active'
+    """
+    if status == 'cancelled':
+        return 'cancelled'
+    if status == 'expired' or end_date < current_date:
+        return 'expired'
+    return 'active'
+
+def policy_status_label(status, end_date, current_date):
+    """Подпись текущего статуса полиса для экранов и выгрузок"""
+    return POLICY_STATUS_LABELS[policy_actual_status(status, end_date, current_date)]
+
+# Последовательности номеров полисов по дням: next_value - первое еще не
+# зарезервированное значение (см. policy_numbers.py)
+class PolicyNumberSequence(db.Model):
+    day = db.Column(db.String(8), primary_key=True)  # ГГГГММДД
+    next_value = db.Column(db.Integer, nullable=False, default=1)
+
+# Свертка полисов по статусу, периоду и месяцу оформления для экранов статистики.
+# Таблица поддерживается триггерами SQLite (см. policy_stats.py)
+class PolicyStatsRollup(db.Model):
+    status = db.Column(db.String(20), primary_key=True)
+    period = db.Column(db.Integer, primary_key=True)  # 3, 6 или 12 месяцев
+    issue_month = db.Column(db.String(7), primary_key=True)  # ГГГГ-ММ
+    policy_count = db.Column(db.Integer, nullable=False, default=0)
+    cost_sum = db.Column(db.Float, nullable=False, default=0)
+
+# Фоновые задания (выгрузки, отчеты, рассылки). Параметры, контрольная точка
+# и результат хранятся в JSON, чтобы задание можно было продолжить после сбоя
+# (см. jobs.py)
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed, cancelled
+    progress = db.Column(db.Float, nullable=False, default=0)  # в процентах
+    params = db.Column(db.Text)
+    checkpoint = db.Column(db.Text)
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    created_by = db.Column(db.String(80))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_job_status_id', 'status', 'id'),
+    )
+
+# Журнал отправленных уведомлений: статус доставки каждого сообщения
+# (см. notification_dispatch.py)
+class NotificationLog(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    policy_id = db.Column(db.Integer, db.ForeignKey('policy.id'), nullable=False)
+    channel = db.Column(db.String(10), nullable=False)  # email, sms
+    recipient = db.Column(db.String(120), nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # sent, failed
+    error = db.Column(db.Text)
+    job_id = db.Column(db.Integer)  # Фоновое задание рассылки, если отправлено им
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (
+        db.Index('ix_notification_log_policy_id', 'policy_id', 'created_at'),
+    )
+
+# Очередь уведомлений об окончании срока действия полисов. Уникальный ключ
+# (полис, канал, окно) не дает повторно уведомить клиента о том же сроке,
+# неудачные отправки повторяются с растущей задержкой (см. notification_outbox.py)
+class NotificationOutbox(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    policy_id = db.Column(db.Integer, db.ForeignKey('policy.id'), nullable=False)
+    channel = db.Column(db.String(10), nullable=False)  # email, sms
+    notice_window = db.Column(db.Integer, nullable=False)  # за сколько дней до окончания (30, 7, 1)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sent, failed
+    scheduled_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    sent_at = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+
+    __table_args__ = (
+        db.UniqueConstraint('policy_id', 'channel', 'notice_window', name='uq_notification_outbox_key'),
+        db.Index('ix_notification_outbox_status_next', 'status', 'next_attempt_at'),
+    )
+
+# Полисы, истекающие в ближайшие дни или недавно истекшие. Таблица
+# поддерживается планировщиком (см. expiry_scanner.py), экран уведомлений
+# читает из нее небольшое число строк вместо полного просмотра полисов
+class ExpiringPolicy(db.Model):
+    policy_id = db.Column(db.Integer, db.ForeignKey('policy.id'), primary_key=True)
+    end_date = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_expiring_policy_end_date', 'end_date'),
+    )
+
+# Состояние периодических сканеров: водяной знак (до какого значения данные
+# уже обработаны) и время последнего полного и очередного прохода
+class ScannerState(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    watermark = db.Column(db.DateTime)
+    full_scan_at = db.Column(db.DateTime)
+    last_run_at = db.Column(db.DateTime)
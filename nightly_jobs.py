@@ -0,0 +1,50 @@
+"""
+Ночные задания по обслуживанию базы данных.
+
+Запускается по расписанию, например из cron раз в сутки:
+    5 0 * * *  cd /path/to/app && python nightly_jobs.py
+"""
+from flask import Flask
+from models import db, Policy
+from datetime import datetime
+
+# Количество полисов, обновляемых в одной транзакции
+EXPIRE_BATCH_SIZE = 10000
+
+def expire_policies(current_date=None, batch_size=EXPIRE_BATCH_SIZE):
+    """
+    Переводит активные полисы с истекшим сроком действия в статус 'expired'.
+    Обновление идет пачками, чтобы не блокировать запись в базу надолго;
+    свертка статистики обновляется триггерами. Возвращает количество полисов.
+    """
+    if current_date is None:
+        current_date = datetime.now()
+
+    total = 0
+    while True:
+        batch = (db.session.query(Policy.id)
+                 .filter(Policy.status == 'active', Policy.end_date < current_date)
+                 .limit(batch_size)
+                 .subquery())
+        result = (Policy.query
+                  .filter(Policy.id.in_(db.select(batch.c.id)))
+                  .update({Policy.status: 'expired'}, synchronize_session=False))
+        db.session.commit()
+        total += result
+        if result < batch_size:
+            return total
+
+if __name__ == '__main__':
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///osago.db'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    db.init_app(app)
+
+    with app.app_context():
+        try:
+            expired_count = expire_policies()
+            print(f'Переведено в статус "истек": {expired_count} полисов')
+        except Exception as e:
+            db.session.rollback()
+            print(f'Ошибка при выполнении ночного задания: {str(e)}')
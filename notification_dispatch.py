@@ -0,0 +1,173 @@
+"""
+Модуль асинхронной отправки уведомлений клиентам.
+
+Сообщения отправляются на asyncio: несколько обработчиков (не больше
+concurrency) забирают сообщения из общей очереди, и каждый держит одно
+открытое соединение со своим транспортом. Поэтому SMTP-сессия
+устанавливается один раз на обработчик, а не на каждое письмо, а пока один
+обработчик ждет ответа сервера, остальные продолжают отправку.
+
+Сообщение - словарь {'policy_id', 'channel', 'recipient', 'subject', 'body'}.
+Канал ('email', 'sms') определяет транспорт: транспорты передаются
+диспетчеру фабриками, поэтому реальный SMTP-сервер можно заменить локальным
+(например, aiosmtpd в benchmarks/notification_dispatch.py) или имитацией
+отправки (LogTransport), если почтовый сервер не настроен.
+
+Результат по каждому сообщению - копия словаря со статусом ('sent' или
+'failed') и текстом ошибки; диспетчер отдает их порциями в on_batch, где
+приложение записывает статусы в журнал уведомлений.
+"""
+import asyncio
+
+# Число одновременно работающих обработчиков по умолчанию
+DEFAULT_CONCURRENCY = 20
+
+class LogTransport:
+    """Имитация отправки: сообщение считается доставленным (используется без почтового сервера)"""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def open(self):
+        pass
+
+    async def send(self, message):
+        self.sent += 1
+
+    async def close(self):
+        pass
+
+class SmtpTransport:
+    """
+    Отправка email через SMTP-сервер с одним соединением на транспорт.
+    Требуется библиотека aiosmtplib. Если сервер закрыл соединение,
+    оно открывается заново и письмо отправляется еще раз.
+    """
+
+    def __init__(self, host, port=25, sender=None, username=None, password=None,
+                 use_tls=False, timeout=30):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self._client = None
+
+    async def open(self):
+        import aiosmtplib
+
+        self._client = aiosmtplib.SMTP(hostname=self.host, port=self.port,
+                                       username=self.username, password=self.password,
+                                       start_tls=self.use_tls, timeout=self.timeout)
+        await self._client.connect()
+
+    def _email(self, message):
+        from email.message import EmailMessage
+
+        email = EmailMessage()
+        email['From'] = self.sender
+        email['To'] = message['recipient']
+        email['Subject'] = message['subject']
+        email.set_content(message['body'], subtype='html')
+        return email
+
+    async def send(self, message):
+        import aiosmtplib
+
+        if self._client is None or not self._client.is_connected:
+            await self.open()
+        email = self._email(message)
+        try:
+            await self._client.send_message(email)
+        except aiosmtplib.SMTPServerDisconnected:
+            await self.open()
+            await self._client.send_message(email)
+
+    async def close(self):
+        if self._client is not None and self._client.is_connected:
+            try:
+                await self._client.quit()
+            except Exception:
+                self._client.close()
+        self._client = None
+
+class NotificationDispatcher:
+    """
+    Асинхронная отправка сообщений с ограничением числа одновременных отправок.
+
+    transports - словарь канал -> фабрика транспорта (вызывается один раз на
+    обработчик). Сообщения канала без транспорта получают статус 'failed'.
+    """
+
+    def __init__(self, transports, concurrency=DEFAULT_CONCURRENCY):
+        self.transports = transports
+        self.concurrency = max(concurrency, 1)
+
+    def run(self, batches, on_batch=None):
+        """
+        Отправляет порции сообщений (итератор списков) и возвращает счетчики
+        {'sent', 'failed'}. После доставки каждой порции вызывается
+        on_batch(результаты порции); исключение из on_batch прерывает отправку.
+        Выполняется в вызывающем потоке (например, в потоке фонового задания).
+        """
+        return asyncio.run(self._run(batches, on_batch))
+
+    async def _run(self, batches, on_batch):
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        totals = {'sent': 0, 'failed': 0}
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency)]
+        try:
+            for batch in batches:
+                # Результаты складываются в порядке сообщений порции
+                results = [None] * len(batch)
+                for number, message in enumerate(batch):
+                    await queue.put((message, results, number))
+                await queue.join()
+
+                for result in results:
+                    totals[result['status']] += 1
+                if on_batch is not None:
+                    on_batch(results)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        return totals
+
+    async def _worker(self, queue):
+        # У каждого обработчика свои транспорты (и свои соединения)
+        transports = {}
+        try:
+            while True:
+                message, results, number = await queue.get()
+                try:
+                    channel = message['channel']
+                    if channel not in transports:
+                        if channel not in self.transports:
+                            raise ValueError(f"Нет транспорта для канала {channel}")
+                        transports[channel] = self.transports[channel]()
+                        await transports[channel].open()
+                    await transports[channel].send(message)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    results[number] = dict(message, status='failed', error=str(e) or type(e).__name__)
+                    # Транспорт с ошибкой пересоздается при следующем сообщении
+                    transport = transports.pop(message.get('channel'), None)
+                    if transport is not None:
+                        await _close_quietly(transport)
+                else:
+                    results[number] = dict(message, status='sent', error=None)
+                finally:
+                    queue.task_done()
+        finally:
+            for transport in transports.values():
+                await _close_quietly(transport)
+
+async def _close_quietly(transport):
+    try:
+        await transport.close()
+    except Exception:
+        pass
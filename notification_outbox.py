@@ -0,0 +1,150 @@
+"""
+Модуль очереди (outbox) уведомлений об окончании срока действия полисов.
+
+Уведомление сначала записывается в таблицу notification_outbox, а затем
+отправляется обработчиком очереди. Ключ (полис, канал, окно) уникален:
+окно - этап напоминания (за 30, 7 и 1 день до окончания), поэтому о каждом
+сроке клиент получает по одному напоминанию на этап. Постановка в очередь -
+один INSERT OR IGNORE ... SELECT на канал, так что повторный запуск рассылки
+ничего не добавляет и почти ничего не стоит.
+
+Обработчик забирает готовые к отправке записи порциями по id. Доставленные
+помечаются отправленными, неудачные откладываются с экспоненциально растущей
+задержкой, после max_attempts попыток запись получает статус 'failed'.
+Функции не фиксируют транзакцию - это делает вызывающий код (вместе с
+контрольной точкой задания).
+"""
+from datetime import timedelta
+from models import db, Client, Vehicle, Policy, NotificationOutbox
+
+# Этапы напоминаний: за сколько дней до окончания полиса
+DEFAULT_NOTICE_WINDOWS = (30, 7, 1)
+
+# Число попыток отправки, после которого уведомление считается недоставленным
+DEFAULT_MAX_ATTEMPTS = 5
+
+# Задержка перед первой повторной попыткой (сек), далее удваивается
+DEFAULT_RETRY_DELAY = 60
+
+# Максимальная задержка между попытками (сек)
+MAX_RETRY_DELAY = 6 * 60 * 60
+
+# Поле контакта клиента для каждого канала
+CHANNEL_CONTACTS = {
+    'email': Client.email,
+    'sms': Client.phone
+}
+
+def retry_delay(attempts, base=DEFAULT_RETRY_DELAY, limit=MAX_RETRY_DELAY):
+    """Задержка перед следующей попыткой после attempts неудачных попыток"""
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), limit))
+
+def _days_left(current_date):
+    return db.cast(db.func.julianday(Policy.end_date)
+                   - db.func.julianday(db.literal(current_date, db.DateTime)), db.Integer)
+
+def enqueue_expiry_notifications(current_date, channels, min_days=0, max_days=None,
+                                 windows=DEFAULT_NOTICE_WINDOWS):
+    """
+    Ставит в очередь уведомления по действующим полисам, до окончания которых
+    осталось от min_days до max_days дней (не больше самого раннего этапа).
+    Уже поставленные ранее уведомления того же этапа пропускаются.
+    Возвращает число новых записей.
+    """
+    windows = sorted(windows)
+    if max_days is None or max_days > windows[-1]:
+        max_days = windows[-1]
+
+    days_left = _days_left(current_date)
+    notice_window = db.case(*[(days_left <= window, window) for window in windows[:-1]],
+                            else_=windows[-1])
+
+    added = 0
+    for channel in channels:
+        contact = CHANNEL_CONTACTS[channel]
+        candidates = (db.select(Policy.id, db.literal(channel), notice_window,
+                                db.literal('pending'), db.literal(current_date, db.DateTime),
+                                db.literal(current_date, db.DateTime), db.literal(0))
+                      .join(Vehicle, Vehicle.id == Policy.vehicle_id)
+                      .join(Client, Client.id == Vehicle.client_id)
+                      .where(Policy.status == 'active',
+                             Policy.end_date > current_date,
+                             days_left >= min_days,
+                             days_left <= max_days,
+                             contact.isnot(None),
+                             contact != ''))
+        statement = (db.insert(NotificationOutbox)
+                     .from_select(['policy_id', 'channel', 'notice_window', 'status', 'scheduled_at',
+                                   'next_attempt_at', 'attempts'], candidates)
+                     .prefix_with('OR IGNORE'))
+        added += db.session.execute(statement).rowcount
+    return added
+
+def drop_stale_notifications(current_date):
+    """
+    Снимает с отправки уведомления по полисам, которые отменены или истекли,
+    в том числе по истекшим, которым ночное задание еще не сменило статус
+    """
+    inactive = db.select(Policy.id).where(db.or_(Policy.status != 'active', Policy.end_date < current_date))
+    return (NotificationOutbox.query
+            .filter(NotificationOutbox.status == 'pending',
+                    NotificationOutbox.policy_id.in_(inactive))
+            .update({'status': 'failed', 'last_error': 'Полис больше не действует'},
+                    synchronize_session=False))
+
+def count_due_notifications(now):
+    """Число уведомлений, готовых к отправке"""
+    return (db.session.query(db.func.count(NotificationOutbox.id))
+            .filter(NotificationOutbox.status == 'pending', NotificationOutbox.next_attempt_at <= now)
+            .scalar())
+
+def due_notifications(now, after_id=0, limit=1000):
+    """
+    Порция готовых к отправке уведомлений после записи after_id:
+    список (запись очереди, полис, ТС, клиент) по возрастанию id
+    """
+    return (db.session.query(NotificationOutbox, Policy, Vehicle, Client)
+            .join(Policy, Policy.id == NotificationOutbox.policy_id)
+            .join(Vehicle, Vehicle.id == Policy.vehicle_id)
+            .join(Client, Client.id == Vehicle.client_id)
+            .filter(NotificationOutbox.status == 'pending',
+                    NotificationOutbox.next_attempt_at <= now,
+                    NotificationOutbox.id > after_id)
+            .order_by(NotificationOutbox.id)
+            .limit(limit)
+            .all())
+
+def record_delivery(results, now, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_RETRY_DELAY):
+    """
+    Обновляет записи очереди по результатам отправки. Каждый результат должен
+    содержать 'outbox_id', 'attempts' (попыток до этой отправки), 'status' и 'error'.
+    """
+    sent_ids = [result['outbox_id'] for result in results if result['status'] == 'sent']
+    if sent_ids:
+        (NotificationOutbox.query
+         .filter(NotificationOutbox.id.in_(sent_ids))
+         .update({'status': 'sent', 'sent_at': now, 'last_error': None,
+                  'attempts': NotificationOutbox.attempts + 1},
+                 synchronize_session=False))
+
+    failed = []
+    for result in results:
+        if result['status'] == 'sent':
+            continue
+        attempts = result['attempts'] + 1
+        failed.append({
+            'id': result['outbox_id'],
+            'attempts': attempts,
+            'status': 'failed' if attempts >= max_attempts else 'pending',
+            'next_attempt_at': now + retry_delay(attempts, base_delay),
+            'last_error': result['error']
+        })
+    if failed:
+        db.session.execute(db.update(NotificationOutbox), failed)
+
+def outbox_summary():
+    """Число уведомлений в очереди по статусам"""
+    counts = dict(db.session.query(NotificationOutbox.status, db.func.count(NotificationOutbox.id))
+                  .group_by(NotificationOutbox.status)
+                  .all())
+    return {status: counts.get(status, 0) for status in ('pending', 'sent', 'failed')}
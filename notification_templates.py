@@ -0,0 +1,74 @@
+"""
+Модуль шаблонов уведомлений клиентам.
+
+Шаблоны (каталог templates/) разбираются и компилируются Jinja2 один раз:
+скомпилированный шаблон хранится в памяти окружения, а байт-код - в
+каталоге временных файлов, чтобы после перезапуска приложения не
+разбирать шаблоны заново. При изменении файла шаблона (проверяется время
+изменения) он перекомпилируется при следующем обращении, перезапуск не нужен.
+
+Значения подставляются из словаря (см. notification_context) с
+экранированием HTML, поэтому данные клиента не могут испортить разметку.
+"""
+import os
+import tempfile
+import threading
+
+# Каталог шаблонов уведомлений
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+# Шаблоны уведомления об окончании срока действия полиса (письмо и SMS)
+EXPIRY_EMAIL_TEMPLATE = 'notification_template.html'
+EXPIRY_SMS_TEMPLATE = 'notification_sms.txt'
+
+def notification_context(policy, vehicle, client, current_date):
+    """Значения для шаблона уведомления об окончании срока действия полиса"""
+    return {
+        'client_name': client.full_name,
+        'policy_number': policy.number,
+        'expiry_date': policy.end_date.strftime('%d.%m.%Y'),
+        'days_left': (policy.end_date - current_date).days,
+        'vehicle_name': f"{vehicle.brand} {vehicle.model}",
+        'reg_number': vehicle.reg_number,
+        'start_date': policy.start_date.strftime('%d.%m.%Y'),
+        'end_date': policy.end_date.strftime('%d.%m.%Y')
+    }
+
+class NotificationTemplates:
+    """Скомпилированные шаблоны уведомлений с отслеживанием изменений файлов"""
+
+    def __init__(self, templates_dir=TEMPLATES_DIR, cache_dir=None, auto_reload=True):
+        self.templates_dir = templates_dir
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), 'osago_templates')
+        self.auto_reload = auto_reload
+        self._environment = None
+        self._lock = threading.Lock()
+
+    @property
+    def environment(self):
+        """Окружение Jinja2 (создается при первом обращении)"""
+        with self._lock:
+            if self._environment is None:
+                from jinja2 import (Environment, FileSystemBytecodeCache, FileSystemLoader,
+                                    StrictUndefined, select_autoescape)
+
+                os.makedirs(self.cache_dir, exist_ok=True)
+                self._environment = Environment(
+                    loader=FileSystemLoader(self.templates_dir),
+                    bytecode_cache=FileSystemBytecodeCache(self.cache_dir),
+                    auto_reload=self.auto_reload,
+                    autoescape=select_autoescape(['html']),
+                    undefined=StrictUndefined
+                )
+            return self._environment
+
+    def get(self, name):
+        """
+        Скомпилированный шаблон. Для рассылок шаблон стоит получить один раз
+        и вызывать у него render(), а не искать его для каждого письма.
+        """
+        return self.environment.get_template(name)
+
+    def render(self, name, context):
+        """Заполняет шаблон значениями из словаря и возвращает текст"""
+        return self.get(name).render(context)
@@ -0,0 +1,98 @@
+"""
+Модуль кэша PDF-документов полисов.
+
+Документ полиса сохраняется по пути <каталог кэша>/<id полиса>/<отпечаток>/
+policy_<номер>.pdf, где отпечаток - хэш полей документа и статуса полиса.
+Пока данные полиса, ТС и владельца не менялись, повторное скачивание или
+отправка по email отдают готовый файл без повторной отрисовки. Изменение
+любого поля дает новый отпечаток, а экраны редактирования клиента, ТС и
+отмены полиса дополнительно удаляют устаревшие документы (invalidate).
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+# Версия оформления документа: при изменении макета полиса кэш становится недействительным
+POLICY_DOCUMENT_VERSION = 1
+
+def policy_fingerprint(fields, status):
+    """Отпечаток документа: одинаковые поля и статус дают одинаковый отпечаток"""
+    payload = json.dumps({'fields': fields, 'status': status, 'version': POLICY_DOCUMENT_VERSION},
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+class PolicyPdfCache:
+    """Кэш PDF полисов на диске, адресуемый отпечатком содержимого"""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _policy_dir(self, policy_id):
+        return os.path.join(self.cache_dir, str(int(policy_id)))
+
+    def path_for(self, policy_id, fields, status):
+        """Путь к документу полиса с указанными полями и статусом"""
+        return os.path.join(self._policy_dir(policy_id), policy_fingerprint(fields, status),
+                            f"policy_{fields['number']}.pdf")
+
+    def get(self, policy_id, fields, status):
+        """Путь к готовому документу или None (учитывается как попадание или промах)"""
+        path = self.path_for(policy_id, fields, status)
+        found = os.path.exists(path)
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return path if found else None
+
+    def get_or_render(self, policy_id, fields, status, render):
+        """
+        Возвращает путь к документу, при промахе вызывает render(путь к файлу)
+        и удаляет устаревшие версии документа этого полиса.
+        """
+        path = self.get(policy_id, fields, status)
+        if path is not None:
+            return path
+
+        path = self.path_for(policy_id, fields, status)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Отрисовываем во временный файл: читатели не увидят недописанный PDF
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            render(temp_path)
+            return self.store(policy_id, fields, status, temp_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def store(self, policy_id, fields, status, file_path):
+        """
+        Переносит уже сформированный документ в кэш (файл перемещается),
+        удаляет устаревшие версии документа полиса и возвращает путь в кэше.
+        """
+        path = self.path_for(policy_id, fields, status)
+        version_dir = os.path.dirname(path)
+        os.makedirs(version_dir, exist_ok=True)
+        os.replace(file_path, path)
+        self._remove_stale(policy_id, keep=os.path.basename(version_dir))
+        return path
+
+    def _remove_stale(self, policy_id, keep):
+        policy_dir = self._policy_dir(policy_id)
+        for name in os.listdir(policy_dir):
+            if name != keep:
+                shutil.rmtree(os.path.join(policy_dir, name), ignore_errors=True)
+
+    def invalidate(self, policy_ids):
+        """Удаляет закэшированные документы указанных полисов"""
+        for policy_id in policy_ids:
+            shutil.rmtree(self._policy_dir(policy_id), ignore_errors=True)
@@ -0,0 +1,86 @@
+"""
+Модуль выдачи номеров полисов.
+
+Раньше номер состоял из даты и четырех случайных цифр, и при нескольких
+тысячах полисов в день номера совпадали (ошибка уникальности терялась
+вместе с оформлением). Теперь номер - OSG-ГГГГММДД-NNNNNN, где NNNNNN -
+значение последовательности дня из таблицы policy_number_sequence, поэтому
+номера не повторяются. Старые номера (4 цифры) с новыми не пересекаются.
+
+Чтобы процессы не обращались к таблице за каждым номером, процесс
+резервирует сразу блок номеров одним оператором INSERT ... ON CONFLICT DO
+UPDATE ... RETURNING (атомарно в SQLite) в отдельной короткой транзакции и
+выдает их из памяти. Номера блока, не выданные до смены дня или
+перезапуска, пропускаются - последовательность может иметь пропуски, но
+не повторы.
+"""
+import threading
+from datetime import datetime
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, PolicyNumberSequence
+
+# Префикс номера полиса
+POLICY_NUMBER_PREFIX = 'OSG'
+
+# Номеров в резервируемом блоке по умолчанию
+DEFAULT_BLOCK_SIZE = 20
+
+# Наибольший номер за день (6 цифр)
+MAX_DAILY_NUMBER = 999999
+
+def format_policy_number(day, value, prefix=POLICY_NUMBER_PREFIX):
+    """Номер полиса по дню (ГГГГММДД) и значению последовательности"""
+    return f"{prefix}-{day}-{value:06d}"
+
+def reserve_number_block(engine, day, size):
+    """
+    Резервирует size номеров дня day (ГГГГММДД) в отдельной транзакции.
+    Возвращает полуинтервал (начало, конец) значений последовательности.
+    """
+    statement = (sqlite_insert(PolicyNumberSequence)
+                 .values(day=day, next_value=1 + size)
+                 .on_conflict_do_update(index_elements=['day'],
+                                        set_={'next_value': PolicyNumberSequence.next_value + size})
+                 .returning(PolicyNumberSequence.next_value))
+    with engine.begin() as conn:
+        end = conn.execute(statement).scalar()
+    start = end - size
+    if end - 1 > MAX_DAILY_NUMBER:
+        raise RuntimeError(f"Исчерпаны номера полисов за {day}")
+    return start, end
+
+class PolicyNumberAllocator:
+    """
+    Потокобезопасная выдача номеров полисов из зарезервированных блоков.
+    Методы вызываются в контексте приложения (используется db.engine).
+    """
+
+    def __init__(self, block_size=DEFAULT_BLOCK_SIZE, prefix=POLICY_NUMBER_PREFIX):
+        self.block_size = block_size
+        self.prefix = prefix
+        self.blocks_reserved = 0
+        self._day = None
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def allocate(self, current_date=None):
+        """Следующий номер полиса за день current_date (по умолчанию - сегодня)"""
+        day = (current_date or datetime.now()).strftime('%Y%m%d')
+        with self._lock:
+            if day != self._day or self._next >= self._end:
+                self._next, self._end = reserve_number_block(db.engine, day, self.block_size)
+                self._day = day
+                self.blocks_reserved += 1
+            value = self._next
+            self._next += 1
+        return format_policy_number(day, value, self.prefix)
+
+    def allocate_many(self, count, current_date=None):
+        """
+        count номеров за один день одним блоком (для пакетной загрузки).
+        Не затрагивает текущий блок выдачи по одному номеру.
+        """
+        day = (current_date or datetime.now()).strftime('%Y%m%d')
+        start, end = reserve_number_block(db.engine, day, count)
+        return [format_policy_number(day, value, self.prefix) for value in range(start, end)]
@@ -0,0 +1,139 @@
+"""
+Модуль статистики по полисам для экранов статистики, графиков и PDF-отчета.
+
+Показатели читаются из таблицы-свертки policy_stats_rollup (статус × период ×
+месяц оформления), которую триггеры SQLite обновляют при каждой вставке,
+изменении или удалении полиса. Поэтому чтение статистики стоит O(число групп),
+а не O(число полисов). Состояния, зависящие от текущей даты (активные полисы
+с уже истекшим сроком и истекающие в ближайшие 30 дней), уточняются двумя
+запросами по индексу ix_policy_status_end_date. Ночное задание (nightly_jobs.py)
+переводит истекшие полисы в статус 'expired', так что эта поправка остается малой.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from models import db, Policy, PolicyStatsRollup
+
+# Названия периодов в порядке отображения
+PERIOD_LABELS = {3: "3 месяца", 6: "6 месяцев", 12: "12 месяцев"}
+
+def _period_sql(ref):
+    """SQL-выражение периода полиса в месяцах (3, 6 или 12) по длительности в днях"""
+    days = f"CAST(julianday({ref}.end_date) - julianday({ref}.start_date) AS INTEGER)"
+    return f"CASE WHEN {days} <= 100 THEN 3 WHEN {days} <= 190 THEN 6 ELSE 12 END"
+
+def _month_sql(ref):
+    return f"strftime('%Y-%m', {ref}.created_at)"
+
+def _add_to_rollup_sql(ref):
+    return f"""INSERT INTO policy_stats_rollup(status, period, issue_month, policy_count, cost_sum)
+        VALUES ({ref}.status, {_period_sql(ref)}, {_month_sql(ref)}, 1, {ref}.cost)
+        ON CONFLICT(status, period, issue_month) DO UPDATE SET
+            policy_count = policy_count + 1,
+            cost_sum = cost_sum + excluded.cost_sum;"""
+
+def _remove_from_rollup_sql(ref):
+    return f"""UPDATE policy_stats_rollup SET
+            policy_count = policy_count - 1,
+            cost_sum = cost_sum - {ref}.cost
+        WHERE status = {ref}.status AND period = {_period_sql(ref)}
+            AND issue_month = {_month_sql(ref)};"""
+
+ROLLUP_TRIGGERS_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS policy_rollup_ai AFTER INSERT ON policy BEGIN
+        {_add_to_rollup_sql('new')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS policy_rollup_ad AFTER DELETE ON policy BEGIN
+        {_remove_from_rollup_sql('old')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS policy_rollup_au
+        AFTER UPDATE OF status, cost, start_date, end_date, created_at ON policy BEGIN
+        {_remove_from_rollup_sql('old')}
+        {_add_to_rollup_sql('new')}
+    END""",
+]
+
+def create_rollup_triggers(conn):
+    """Создает триггеры, поддерживающие свертку в актуальном состоянии"""
+    for statement in ROLLUP_TRIGGERS_DDL:
+        conn.execute(text(statement))
+
+def rebuild_rollup(conn):
+    """Полностью пересчитывает свертку по таблице policy"""
+    conn.execute(text("DELETE FROM policy_stats_rollup"))
+    conn.execute(text(f"""INSERT INTO policy_stats_rollup(status, period, issue_month, policy_count, cost_sum)
+        SELECT status, {_period_sql('policy')}, {_month_sql('policy')}, COUNT(*), SUM(cost)
+        FROM policy GROUP BY 1, 2, 3"""))
+
+def collect_policy_statistics(current_date=None):
+    """
+    Возвращает словарь со статистикой по полисам:
+    - total, active, cancelled, expired, expiring_soon - количество полисов
+      (active - действующие, включая истекающие в ближайшие 30 дней);
+    - active_status - полисы, не отмененные и не закрытые иным статусом
+      (действующие и истекшие);
+    - total_sum, active_sum, active_status_sum - суммы стоимости;
+    - periods - {название периода: количество} в порядке 3, 6, 12 месяцев;
+    - monthly - {'ГГГГ-ММ': количество оформленных полисов} по возрастанию месяца.
+    Должен вызываться внутри контекста приложения.
+    """
+    if current_date is None:
+        current_date = datetime.now()
+
+    rows = (db.session.query(PolicyStatsRollup.status, PolicyStatsRollup.period,
+                             PolicyStatsRollup.issue_month, PolicyStatsRollup.policy_count,
+                             PolicyStatsRollup.cost_sum)
+            .filter(PolicyStatsRollup.policy_count > 0)
+            .all())
+
+    # Активные по статусу, но с истекшим сроком (еще не обработаны ночным заданием)
+    lapsed = (db.session.query(db.func.count(Policy.id), db.func.sum(Policy.cost))
+              .filter(Policy.status == 'active', Policy.end_date < current_date)
+              .one())
+    # Истекающие в ближайшие 30 дней
+    expiring = (db.session.query(db.func.count(Policy.id), db.func.sum(Policy.cost))
+                .filter(Policy.status == 'active',
+                        Policy.end_date > current_date,
+                        Policy.end_date < current_date + timedelta(days=30))
+                .one())
+
+    return summarize_groups(rows, [('active', 'expired') + tuple(lapsed),
+                                   ('active', 'expiring_soon') + tuple(expiring)])
+
+def summarize_groups(rows, moves=()):
+    """
+    Сводит строки свертки (статус, период, месяц, количество, сумма) в словарь
+    статистики. moves - поправки (из состояния, в состояние, количество, сумма)
+    для полисов, чье фактическое состояние зависит от текущей даты.
+    """
+    counts = {}
+    sums = {}
+    periods = {}
+    monthly = {}
+    for status, period, month, count, cost_sum in rows:
+        counts[status] = counts.get(status, 0) + count
+        sums[status] = sums.get(status, 0) + (cost_sum or 0)
+        periods[period] = periods.get(period, 0) + count
+        monthly[month] = monthly.get(month, 0) + count
+
+    for source, target, count, cost_sum in moves:
+        counts[source] = counts.get(source, 0) - count
+        counts[target] = counts.get(target, 0) + count
+        sums[source] = sums.get(source, 0) - (cost_sum or 0)
+        sums[target] = sums.get(target, 0) + (cost_sum or 0)
+
+    active = counts.get('active', 0) + counts.get('expiring_soon', 0)
+    active_sum = sums.get('active', 0) + sums.get('expiring_soon', 0)
+
+    return {
+        'total': sum(counts.values()),
+        'active': active,
+        'cancelled': counts.get('cancelled', 0),
+        'expired': counts.get('expired', 0),
+        'expiring_soon': counts.get('expiring_soon', 0),
+        'active_status': active + counts.get('expired', 0),
+        'total_sum': sum(sums.values()),
+        'active_sum': active_sum,
+        'active_status_sum': active_sum + sums.get('expired', 0),
+        'periods': {PERIOD_LABELS[p]: periods[p] for p in sorted(periods) if periods[p]},
+        'monthly': {m: monthly[m] for m in sorted(monthly) if monthly[m]}
+    }
@@ -0,0 +1,79 @@
+"""
+Модуль расчета стоимости полисов ОСАГО по тарифу (см. tariffs.py).
+
+calculate_policy_cost считает стоимость одного полиса. batch_policy_cost
+считает стоимость сразу для массивов факторов (например, при пересчете всего
+парка после изменения тарифа) средствами NumPy и дает тот же результат
+бит в бит: коэффициенты берутся из тех же шкал, произведение вычисляется
+в том же порядке, а округление до копеек совпадает с round().
+Проверка совпадения и замер - benchmarks/premium_batch.py.
+"""
+from tariffs import tariff_registry
+
+def policy_cost(tariff, ratios, bonus_malus, period_months):
+    """Стоимость полиса по коэффициентам шкал тарифа (см. Tariff.ratios)"""
+    power_ratio, age_ratio, experience_ratio, driver_age_ratio = ratios
+    total_cost = (tariff.base_rate * power_ratio * age_ratio * experience_ratio
+                * driver_age_ratio * bonus_malus * (period_months / 12))
+    return round(total_cost, 2)
+
+def calculate_policy_cost(vehicle, period_months=12, driver_experience=0, driver_age=30, bonus_malus=1.0,
+                          tariff=None):
+    """
+    Расчет стоимости полиса ОСАГО с учетом дополнительных факторов:
+    - Мощность двигателя
+    - Возраст транспортного средства
+    - Стаж вождения водителя
+    - Возраст водителя
+    - Коэффициент бонус-малус (скидка за безаварийную езду)
+    - Срок действия полиса
+    По умолчанию используется действующий тариф.
+    """
+    if tariff is None:
+        tariff = tariff_registry.current()
+    indices = tariff.bracket_indices(vehicle.engine_power, vehicle.year, driver_experience, driver_age)
+    return policy_cost(tariff, tariff.ratios(indices), bonus_malus, period_months)
+
+def _round_cents(values):
+    """
+    Округление до копеек, совпадающее с round(value, 2) для каждого элемента.
+    np.round округляет уже округленное произведение value * 100, поэтому
+    значения, близкие к середине между копейками, округляются через round().
+    """
+    import numpy as np
+
+    scaled = values * 100
+    result = np.rint(scaled) / 100
+    magnitude = np.abs(scaled)
+    ambiguous = (np.abs(magnitude - np.floor(magnitude) - 0.5) <= magnitude * 1e-15) | (magnitude >= 2.0 ** 52)
+    for index in np.flatnonzero(ambiguous):
+        result.flat[index] = round(float(values.flat[index]), 2)
+    return result
+
+def batch_policy_cost(engine_power, vehicle_year, driver_age, driver_experience, bonus_malus=1.0,
+                      period_months=12, current_year=None, tariff=None):
+    """
+    Стоимость полисов для массивов факторов (скаляры растягиваются до общей
+    формы). Возвращает массив float64, каждый элемент которого равен
+    calculate_policy_cost с теми же факторами. Требуется библиотека numpy.
+    """
+    import numpy as np
+
+    if tariff is None:
+        tariff = tariff_registry.current()
+
+    engine_power, vehicle_year, driver_age, driver_experience, bonus_malus, period_months = (
+        np.broadcast_arrays(*[np.asarray(values, dtype=np.float64) for values in
+                              (engine_power, vehicle_year, driver_age, driver_experience,
+                               bonus_malus, period_months)]))
+    if np.isnan(engine_power).any():
+        raise ValueError("Не указана мощность двигателя")
+
+    # Коэффициенты по тем же шкалам, что и в calculate_policy_cost
+    power_ratio, age_ratio, experience_ratio, driver_age_ratio = tariff.batch_ratios(
+        engine_power, vehicle_year, driver_experience, driver_age, current_year)
+
+    # Порядок умножения тот же, что и в policy_cost
+    total_cost = (tariff.base_rate * power_ratio * age_ratio * experience_ratio
+                  * driver_age_ratio * bonus_malus * (period_months / 12))
+    return _round_cents(total_cost)
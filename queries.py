@@ -0,0 +1,251 @@
+"""
+Модуль запросов для экранов со списками: фильтры поиска и постраничная выборка
+клиентов, ТС и полисов.
+
+Текстовый поиск выполняется по индексу FTS5 (см. search_index.py) с ранжированием
+по релевантности; если SQLite собран без FTS5, используются условия instr().
+Индекс FTS5 ищет слова по префиксу, поэтому фрагменты из середины паспорта,
+VIN, гос. номера или номера полиса дополнительно ищутся по индексу trigram
+(или instr(), если его нет): клиенты и ТС, найденные только по фрагменту,
+идут после ранжированных результатов. В списке полисов строка поиска с
+цифрами считается фрагментом номера полиса или гос. номера: такие результаты
+показываются от новых к старым, а не по релевантности.
+"""
+import sqlite3
+from datetime import timedelta
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from models import db, Client, Vehicle, Policy
+from search_index import (client_fts, vehicle_fts, policy_fts, client_id_fts, vehicle_id_fts, policy_id_fts,
+                          build_fragment_query, build_match_query, has_identifier_index)
+
+DEFAULT_PAGE_SIZE = 50
+DEFAULT_SEARCH_LIMIT = 200
+
+@event.listens_for(Engine, "connect")
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    """Регистрирует py_lower: встроенная lower() в SQLite не понимает кириллицу"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function(
+            'py_lower', 1, lambda value: value.lower() if value is not None else None,
+            deterministic=True
+        )
+
+def contains_ignore_case(column, term):
+    """Условие «подстрока без учета регистра», как `term.lower() in value.lower()`"""
+    return db.func.instr(db.func.py_lower(column), term.lower()) > 0
+
+def contains(column, term):
+    """Условие «подстрока с учетом регистра», как `term in value`"""
+    return db.func.instr(column, term) > 0
+
+def client_search_criteria(search_term):
+    """Условия WHERE для поиска клиентов по ФИО (без учета регистра) или паспорту"""
+    if not search_term:
+        return []
+    return [db.or_(
+        contains_ignore_case(Client.full_name, search_term),
+        contains(Client.passport, search_term)
+    )]
+
+def vehicle_search_criteria(search_term):
+    """Условия WHERE для поиска ТС по марке, модели, VIN или гос. номеру"""
+    if not search_term:
+        return []
+    return [db.or_(
+        contains_ignore_case(Vehicle.brand, search_term),
+        contains_ignore_case(Vehicle.model, search_term),
+        contains_ignore_case(Vehicle.vin, search_term),
+        contains_ignore_case(Vehicle.reg_number, search_term)
+    )]
+
+def has_search_index():
+    """Проверяет, создан ли индекс FTS5 (SQLite может быть собран без FTS5)"""
+    return db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'policy_fts'")
+    ).first() is not None
+
+def search_match(search_term):
+    """Запрос FTS5 для строки поиска или None, если полнотекстовый поиск неприменим"""
+    if not search_term or not has_search_index():
+        return None
+    return build_match_query(search_term)
+
+def identifier_fragment_criteria(search_term, fts_table, id_column, columns):
+    """
+    Условие WHERE «строка поиска - фрагмент одного из идентификаторов columns»
+    (без учета регистра): по индексу trigram fts_table, если он есть и строка
+    не короче трех символов, иначе через instr()
+    """
+    fragment = build_fragment_query(search_term) if has_identifier_index(db.session) else None
+    if fragment is not None:
+        return id_column.in_(db.select(fts_table.c.rowid)
+                             .where(fts_table.c[fts_table.name].op('MATCH')(fragment)))
+    return db.or_(*[contains_ignore_case(column, search_term.strip()) for column in columns])
+
+def search_clients(search_term, limit=DEFAULT_SEARCH_LIMIT):
+    """
+    Клиенты по строке поиска (ФИО или паспорт): наиболее релевантные первыми,
+    затем найденные по фрагменту номера паспорта
+    """
+    match = search_match(search_term)
+    if match is None:
+        return Client.query.filter(*client_search_criteria(search_term)).limit(limit).all()
+    clients = (Client.query
+               .join(client_fts, client_fts.c.rowid == Client.id)
+               .filter(client_fts.c.client_fts.op('MATCH')(match))
+               .order_by(client_fts.c.rank)
+               .limit(limit)
+               .all())
+    if len(clients) < limit:
+        found = [client.id for client in clients]
+        clients += (Client.query
+                    .filter(identifier_fragment_criteria(search_term, client_id_fts, Client.id,
+                                                         [Client.passport]),
+                            Client.id.notin_(found))
+                    .order_by(Client.id)
+                    .limit(limit - len(clients))
+                    .all())
+    return clients
+
+def search_vehicles(search_term, limit=DEFAULT_SEARCH_LIMIT):
+    """
+    Пары (ТС, владелец) по строке поиска: наиболее релевантные первыми,
+    затем найденные по фрагменту VIN или гос. номера
+    """
+    query = Vehicle.query.join(Vehicle.client).add_entity(Client)
+    match = search_match(search_term)
+    if match is None:
+        return query.filter(*vehicle_search_criteria(search_term)).limit(limit).all()
+    vehicles = (query
+                .join(vehicle_fts, vehicle_fts.c.rowid == Vehicle.id)
+                .filter(vehicle_fts.c.vehicle_fts.op('MATCH')(match))
+                .order_by(vehicle_fts.c.rank)
+                .limit(limit)
+                .all())
+    if len(vehicles) < limit:
+        found = [vehicle.id for vehicle, _ in vehicles]
+        vehicles += (query
+                     .filter(identifier_fragment_criteria(search_term, vehicle_id_fts, Vehicle.id,
+                                                          [Vehicle.vin, Vehicle.reg_number]),
+                             Vehicle.id.notin_(found))
+                     .order_by(Vehicle.id)
+                     .limit(limit - len(vehicles))
+                     .all())
+    return vehicles
+
+def policy_status_criteria(status_filter, current_date):
+    """Условия WHERE для фильтра по статусу полиса"""
+    if status_filter == 'active':
+        return [Policy.status == 'active', Policy.end_date >= current_date]
+    if status_filter == 'cancelled':
+        return [Policy.status == 'cancelled']
+    if status_filter == 'expired':
+        # Истекшие полисы ночное задание переводит в статус 'expired'
+        return [db.or_(Policy.status == 'expired',
+                       db.and_(Policy.status == 'active', Policy.end_date < current_date))]
+    if status_filter == 'expiring_soon':
+        return [Policy.status == 'active',
+                Policy.end_date > current_date,
+                Policy.end_date < (current_date + timedelta(days=30))]
+    return []
+
+def policy_search_criteria(search_term):
+    """Условия WHERE для поиска по номеру полиса, владельцу или ТС"""
+    if not search_term:
+        return []
+    return [db.or_(
+        contains_ignore_case(Policy.number, search_term),
+        contains_ignore_case(Client.full_name, search_term),
+        contains_ignore_case(Vehicle.brand, search_term),
+        contains_ignore_case(Vehicle.model, search_term),
+        contains_ignore_case(Vehicle.reg_number, search_term)
+    )]
+
+def _keyset_page(query, key_columns, descending, cursor, direction, page_size):
+    """
+    Одна страница запроса query, упорядоченного по ключу key_columns, без OFFSET.
+    Возвращает (строки, есть ли предыдущая страница, есть ли следующая).
+    """
+    backwards = cursor is not None and direction == 'prev'
+    ascending = descending == backwards
+    if cursor is not None:
+        sort_key = db.tuple_(*key_columns)
+        query = query.filter(sort_key > db.tuple_(*cursor) if ascending else sort_key < db.tuple_(*cursor))
+    query = query.order_by(*[col.asc() if ascending else col.desc() for col in key_columns])
+
+    # Запрашиваем на одну строку больше, чтобы узнать, есть ли следующая страница
+    rows = query.limit(page_size + 1).all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    if backwards:
+        rows.reverse()
+        return rows, has_more, True
+    return rows, cursor is not None, has_more
+
+def _page(rows, cursors, has_prev, has_next):
+    return {
+        'rows': rows,
+        'has_prev': has_prev,
+        'has_next': has_next,
+        'first_cursor': cursors[0] if cursors else None,
+        'last_cursor': cursors[-1] if cursors else None
+    }
+
+def fetch_client_page(cursor=None, direction='next', page_size=DEFAULT_PAGE_SIZE):
+    """Одна страница списка клиентов по возрастанию id (cursor - кортеж (id,))"""
+    rows, has_prev, has_next = _keyset_page(Client.query, (Client.id,), False, cursor, direction, page_size)
+    return _page(rows, [(client.id,) for client in rows], has_prev, has_next)
+
+def fetch_vehicle_page(cursor=None, direction='next', page_size=DEFAULT_PAGE_SIZE):
+    """Одна страница списка пар (ТС, владелец) по возрастанию id ТС (cursor - кортеж (id,))"""
+    query = Vehicle.query.join(Vehicle.client).add_entity(Client)
+    rows, has_prev, has_next = _keyset_page(query, (Vehicle.id,), False, cursor, direction, page_size)
+    return _page(rows, [(vehicle.id,) for vehicle, _ in rows], has_prev, has_next)
+
+def fetch_policy_page(criteria, cursor=None, direction='next', page_size=DEFAULT_PAGE_SIZE,
+                      search_term=None):
+    """
+    Возвращает одну страницу полисов (Policy, Vehicle, Client).
+
+    Без строки поиска полисы упорядочены от новых к старым по ключу
+    (created_at, id), со строкой поиска - по релевантности, ключ (rank, id).
+    Строка поиска с цифрами ищется и как фрагмент номера полиса или
+    гос. номера; такие результаты упорядочены от новых к старым.
+    cursor - ключ последней строки предыдущей страницы (direction='next')
+    или первой строки следующей (direction='prev'). Каждая страница - один
+    запрос с LIMIT, без OFFSET.
+    """
+    query = (db.session.query(Policy, Vehicle, Client)
+             .join(Policy.vehicle)
+             .join(Vehicle.client)
+             .filter(*criteria))
+
+    match = search_match(search_term)
+    ranked = match is not None and not any(char.isdigit() for char in search_term)
+    if ranked:
+        query = (query.join(policy_fts, policy_fts.c.rowid == Policy.id)
+                 .filter(policy_fts.c.policy_fts.op('MATCH')(match))
+                 .add_columns(policy_fts.c.rank))
+        key_columns = (policy_fts.c.rank, Policy.id)
+        descending = False
+    else:
+        if match is not None:
+            query = query.filter(db.or_(
+                Policy.id.in_(db.select(policy_fts.c.rowid).where(policy_fts.c.policy_fts.op('MATCH')(match))),
+                identifier_fragment_criteria(search_term, policy_id_fts, Policy.id,
+                                             [Policy.number, Vehicle.reg_number])))
+        else:
+            query = query.filter(*policy_search_criteria(search_term))
+        key_columns = (Policy.created_at, Policy.id)
+        descending = True
+
+    rows, has_prev, has_next = _keyset_page(query, key_columns, descending, cursor, direction, page_size)
+
+    if ranked:
+        cursors = [(row[3], row[0].id) for row in rows]
+        rows = [tuple(row[:3]) for row in rows]
+    else:
+        cursors = [(row[0].created_at, row[0].id) for row in rows]
+    return _page(rows, cursors, has_prev, has_next)
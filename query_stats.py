@@ -0,0 +1,247 @@
+"""
+Модуль учета SQL-запросов по экранам приложения.
+
+Обработчики событий SQLAlchemy before_cursor_execute / after_cursor_execute
+считают запросы и время их выполнения в базе и относят их к экрану,
+который сейчас выполняется в этом потоке. Экран - функция, отмеченная
+декоратором QueryStats.track_screen; при вложенном вызове экранов запросы
+относятся к самому внутреннему. Обработчики фоновых заданий отмечаются
+декоратором QueryStats.track_job и учитываются отдельно от экранов, чтобы
+тяжелые выгрузки не искажали сводку по экранам. Запросы вне экранов и
+заданий (планировщик, пул отрисовки) не учитываются.
+
+По каждому посещению экрана в журнал (с ротацией по размеру) пишется
+строка с числом запросов и временем в базе, а медленные запросы - отдельными
+строками с текстом (без параметров: в них персональные данные). Сводка по
+экранам с самыми затратными запросами хранится в памяти для экрана
+диагностики. Один и тот же запрос, выполненный много раз за посещение,
+обычно означает выборку N+1.
+
+assert_query_budget - помощник для проверок: блок кода, выполнивший больше
+запросов, чем разрешено, завершается ошибкой QueryBudgetExceeded.
+"""
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Порог медленного запроса по умолчанию (мс)
+DEFAULT_SLOW_QUERY_MS = 100
+
+# Размер журнала до ротации (байт) и число хранимых архивов
+DEFAULT_LOG_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_LOG_BACKUPS = 5
+
+# Различных запросов, хранимых в сводке по экрану
+DEFAULT_TOP_STATEMENTS = 10
+
+# Длина текста запроса в журнале и сводке
+MAX_STATEMENT_LENGTH = 500
+
+_local = threading.local()
+
+def _normalize_statement(statement):
+    """Текст запроса в одну строку, обрезанный до MAX_STATEMENT_LENGTH"""
+    text = ' '.join(statement.split())
+    if len(text) > MAX_STATEMENT_LENGTH:
+        text = text[:MAX_STATEMENT_LENGTH - 3] + '...'
+    return text
+
+def _add_statement(statements, statement, elapsed):
+    """Учитывает выполнение запроса в словаре текст -> [число, суммарное время, максимум]"""
+    entry = statements.get(statement)
+    if entry is None:
+        statements[statement] = [1, elapsed, elapsed]
+    else:
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] = max(entry[2], elapsed)
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_local, 'visits', None) or getattr(_local, 'budgets', None):
+        _local.started = time.perf_counter()
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(_local, 'started', None)
+    if started is None:
+        return
+    _local.started = None
+    elapsed = time.perf_counter() - started
+    statement = _normalize_statement(statement)
+
+    visits = getattr(_local, 'visits', None)
+    if visits:
+        visit = visits[-1]
+        visit['queries'] += 1
+        visit['db_time'] += elapsed
+        _add_statement(visit['statements'], statement, elapsed)
+        visit['owner'].record_query(visit, statement, elapsed)
+    for budget in getattr(_local, 'budgets', None) or ():
+        budget['queries'] += 1
+        _add_statement(budget['statements'], statement, elapsed)
+
+class QueryBudgetExceeded(AssertionError):
+    """Блок кода выполнил больше запросов, чем разрешено"""
+
+def _statements_report(statements, limit=DEFAULT_TOP_STATEMENTS):
+    """Строки с самыми частыми запросами для сообщения об ошибке"""
+    top = sorted(statements.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+    return '\n'.join(f"  {count} x {statement}" for statement, (count, _, _) in top)
+
+@contextmanager
+def assert_query_budget(max_queries, label=None):
+    """
+    Проверяет, что блок выполнил не больше max_queries запросов в этом потоке
+    (включая запросы вложенных экранов), иначе - QueryBudgetExceeded со
+    списком самых частых запросов. Пример:
+
+        with assert_query_budget(3, 'list_policies'):
+            with app.app_context():
+                fetch_policy_page([])
+    """
+    budget = {'queries': 0, 'statements': {}}
+    budgets = getattr(_local, 'budgets', None)
+    if budgets is None:
+        budgets = _local.budgets = []
+    budgets.append(budget)
+    try:
+        yield budget
+    finally:
+        budgets.remove(budget)
+    if budget['queries'] > max_queries:
+        raise QueryBudgetExceeded(
+            f"{label or 'Блок'}: выполнено запросов {budget['queries']} при бюджете {max_queries}\n"
+            f"{_statements_report(budget['statements'])}")
+
+class QueryStats:
+    """
+    Сводка запросов по экранам и журнал посещений экранов.
+    user_getter - функция, возвращающая имя текущего пользователя (для журнала).
+    """
+
+    def __init__(self, log_path=None, slow_query_ms=DEFAULT_SLOW_QUERY_MS, max_bytes=DEFAULT_LOG_MAX_BYTES,
+                 backups=DEFAULT_LOG_BACKUPS, top_statements=DEFAULT_TOP_STATEMENTS, user_getter=None):
+        self.slow_query_ms = slow_query_ms
+        self.top_statements = top_statements
+        self.user_getter = user_getter
+        self._screens = {}
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(f"{__name__}.{id(self)}")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        if log_path:
+            log_dir = os.path.dirname(log_path)
+            if log_dir and not os.path.exists(log_dir):
+                os.makedirs(log_dir)
+            handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+            self.logger.addHandler(handler)
+
+    def track_screen(self, func):
+        """Декоратор экрана: запросы, выполненные во время вызова, относятся к нему"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.screen(func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def track_job(self, func):
+        """Декоратор обработчика фонового задания: запросы учитываются отдельно от экранов"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.screen(func.__name__, category='job'):
+                return func(*args, **kwargs)
+        return wrapper
+
+    @contextmanager
+    def screen(self, name, category='screen'):
+        """Относит запросы блока к экрану (category='job' - к фоновому заданию) name"""
+        visits = getattr(_local, 'visits', None)
+        if visits is None:
+            visits = _local.visits = []
+        visit = {'owner': self, 'screen': name, 'category': category, 'queries': 0, 'db_time': 0.0,
+                 'statements': {}, 'started': time.perf_counter()}
+        visits.append(visit)
+        try:
+            yield visit
+        finally:
+            visits.remove(visit)
+            self.record_visit(visit)
+
+    def _user(self):
+        if self.user_getter is None:
+            return None
+        try:
+            return self.user_getter()
+        except Exception:
+            return None
+
+    def record_query(self, visit, statement, elapsed):
+        """Пишет в журнал запрос, выполнявшийся дольше порога"""
+        if elapsed * 1000 >= self.slow_query_ms:
+            self.logger.warning("slow_query %s=%s user=%s ms=%.1f sql=%s",
+                                visit['category'], visit['screen'], self._user(), elapsed * 1000, statement)
+
+    def record_visit(self, visit):
+        """Добавляет посещение экрана (выполнение задания) в сводку и журнал"""
+        wall_time = time.perf_counter() - visit['started']
+        key = (visit['category'], visit['screen'])
+        with self._lock:
+            summary = self._screens.get(key)
+            if summary is None:
+                summary = self._screens[key] = {
+                    'screen': visit['screen'], 'category': visit['category'], 'visits': 0, 'queries': 0,
+                    'max_queries': 0, 'db_time': 0.0, 'max_db_time': 0.0, 'statements': {}}
+            summary['visits'] += 1
+            summary['queries'] += visit['queries']
+            summary['max_queries'] = max(summary['max_queries'], visit['queries'])
+            summary['db_time'] += visit['db_time']
+            summary['max_db_time'] = max(summary['max_db_time'], visit['db_time'])
+            statements = summary['statements']
+            for statement, (count, total, longest) in visit['statements'].items():
+                entry = statements.setdefault(statement, [0, 0.0, 0.0, 0])
+                entry[0] += count
+                entry[1] += total
+                entry[2] = max(entry[2], longest)
+                entry[3] = max(entry[3], count)  # Наибольшее число выполнений за посещение
+            if len(statements) > self.top_statements * 2:
+                # Оставляем самые затратные запросы
+                kept = sorted(statements.items(), key=lambda item: item[1][1], reverse=True)
+                summary['statements'] = dict(kept[:self.top_statements])
+
+        self.logger.info("%s=%s user=%s queries=%d db_ms=%.1f wall_ms=%.1f",
+                         visit['category'], visit['screen'], self._user(), visit['queries'],
+                         visit['db_time'] * 1000, wall_time * 1000)
+
+    def snapshot(self, category='screen'):
+        """
+        Сводка по экранам (category='job' - по фоновым заданиям), от наибольшего
+        суммарного времени в базе: список словарей {'screen', 'category',
+        'visits', 'queries', 'max_queries', 'db_time', 'max_db_time',
+        'statements'}, где statements - самые затратные запросы
+        [{'statement', 'count', 'db_time', 'max_time', 'max_per_visit'}]
+        (время в секундах)
+        """
+        with self._lock:
+            screens = []
+            for (summary_category, _), summary in self._screens.items():
+                if summary_category != category:
+                    continue
+                statements = sorted(summary['statements'].items(), key=lambda item: item[1][1], reverse=True)
+                screens.append(dict(summary, statements=[
+                    {'statement': statement, 'count': count, 'db_time': total, 'max_time': longest,
+                     'max_per_visit': per_visit}
+                    for statement, (count, total, longest, per_visit) in statements[:self.top_statements]]))
+        return sorted(screens, key=lambda summary: summary['db_time'], reverse=True)
+
+    def reset(self):
+        """Очищает сводку (журнал не затрагивается)"""
+        with self._lock:
+            self._screens.clear()
@@ -0,0 +1,102 @@
+"""
+Модуль расчета предложений (котировок) по полисам ОСАГО.
+
+Агент часто пересчитывает один и тот же автомобиль с другим классом
+бонус-малус или сроком. QuoteService хранит рассчитанные стоимости в
+ограниченном LRU-кэше. Ключ - версия тарифа и нормализованные факторы:
+вместо мощности, возраста ТС, стажа и возраста водителя берутся номера
+интервалов шкал тарифа, поэтому один расчет подходит всем автомобилям
+и водителям из тех же интервалов. С новой версией тарифа меняется и ключ,
+так что старые значения просто вытесняются.
+
+compare() считает таблицу «все сроки × все классы бонус-малус» одним
+пакетным вызовом batch_policy_cost и заодно заполняет кэш.
+"""
+import threading
+from collections import OrderedDict
+from pricing import batch_policy_cost, policy_cost
+from tariffs import tariff_registry
+
+# Число расчетов в кэше по умолчанию
+DEFAULT_QUOTE_CACHE_SIZE = 4096
+
+class QuoteService:
+    """Расчет стоимости полисов с потокобезопасным LRU-кэшем"""
+
+    def __init__(self, registry=tariff_registry, maxsize=DEFAULT_QUOTE_CACHE_SIZE):
+        self.registry = registry
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key):
+        with self._lock:
+            cost = self._items.get(key)
+            if cost is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._items.move_to_end(key)
+            return cost
+
+    def _put(self, key, cost):
+        with self._lock:
+            self._items[key] = cost
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def quote(self, vehicle, period_months, driver_experience, driver_age, bonus_malus, tariff=None):
+        """
+        Стоимость полиса для ТС и водителя. Возвращает словарь {'cost',
+        'tariff_version'}. Если передан tariff, расчет ведется по нему
+        (например, по версии, показанной агенту в форме).
+        """
+        if tariff is None:
+            tariff = self.registry.current()
+        indices = tariff.bracket_indices(vehicle.engine_power, vehicle.year, driver_experience, driver_age)
+        key = (tariff.version, indices, float(bonus_malus), int(period_months))
+
+        cost = self._get(key)
+        if cost is None:
+            cost = policy_cost(tariff, tariff.ratios(indices), float(bonus_malus), int(period_months))
+            self._put(key, cost)
+        return {'cost': cost, 'tariff_version': tariff.version}
+
+    def compare(self, vehicle, driver_experience, driver_age, tariff=None):
+        """
+        Стоимость полиса для всех сроков и классов бонус-малус тарифа.
+        Возвращает словарь {'tariff_version', 'periods', 'bonus_malus', 'costs'},
+        где costs[i][j] - стоимость для класса bonus_malus[i] и срока periods[j].
+        """
+        import numpy as np
+
+        if tariff is None:
+            tariff = self.registry.current()
+        months = [period for period, _ in tariff.periods]
+        classes = [value for value, _ in tariff.bonus_malus]
+
+        costs = batch_policy_cost(vehicle.engine_power, vehicle.year, driver_age, driver_experience,
+                                  bonus_malus=np.array(classes)[:, None],
+                                  period_months=np.array(months)[None, :],
+                                  tariff=tariff).tolist()
+
+        indices = tariff.bracket_indices(vehicle.engine_power, vehicle.year, driver_experience, driver_age)
+        for bonus_malus, row in zip(classes, costs):
+            for period, cost in zip(months, row):
+                self._put((tariff.version, indices, bonus_malus, period), cost)
+
+        return {
+            'tariff_version': tariff.version,
+            'periods': list(tariff.periods),
+            'bonus_malus': list(tariff.bonus_malus),
+            'costs': costs
+        }
+
+    def stats(self):
+        """Счетчики кэша: {'hits', 'misses', 'size', 'maxsize'}"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._items), 'maxsize': self.maxsize}
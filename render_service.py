@@ -0,0 +1,184 @@
+"""
+Модуль фоновой отрисовки графиков и PDF-документов в пуле процессов.
+
+Отрисовка matplotlib и формирование PDF занимают процессор на сотни
+миллисекунд и дольше. Если выполнять их в потоке сессии PyWebIO, из-за GIL
+один пользователь, формирующий отчет, тормозит всех остальных. Сервис
+передает такие задания в ProcessPoolExecutor: сессия отправляет задание
+и ждет результат, а интерпретатор приложения остается свободным.
+
+Рабочие процессы «прогреваются» при запуске: заранее импортируют matplotlib
+и fpdf и разбирают кириллический шрифт, чтобы первое задание не платило
+за это. По умолчанию процессы запускаются через forkserver: сервер запуска
+один раз импортирует модули отрисовки (FORKSERVER_PRELOAD), а рабочие
+процессы порождаются от него копированием. Функции заданий должны быть
+объявлены на уровне модуля и принимать только простые данные (словари,
+строки, числа) - они передаются в процесс через pickle.
+
+При запуске способами spawn и forkserver рабочий процесс заново выполняет
+главный модуль родителя под именем __mp_main__, поэтому главный модуль
+не должен выполнять при импорте ничего, кроме объявлений (см. app.py).
+"""
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from documents import FONT_PATH
+from render_worker import noop, timed_call, warm_up_worker
+
+# forkserver доступен не на всех платформах (нет в Windows)
+DEFAULT_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# Модули, которые сервер запуска forkserver импортирует один раз для всех рабочих процессов
+FORKSERVER_PRELOAD = ['render_worker', 'documents', 'matplotlib.figure', 'matplotlib.backends.backend_agg']
+
+class RenderService:
+    """
+    Пул процессов для тяжелой отрисовки с учетом заданий и времени их выполнения.
+
+    max_workers=0 отключает пул: задания выполняются в вызывающем потоке
+    (удобно для отладки и окружений, где нельзя запускать процессы).
+    Пул создается при первом задании, а не при импорте модуля.
+    """
+
+    def __init__(self, max_workers=2, start_method=DEFAULT_START_METHOD, font_path=FONT_PATH):
+        self.max_workers = max_workers
+        self.start_method = start_method
+        self.font_path = font_path
+        self._executor = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        # Имя задания -> [количество, суммарное время, максимальное время]
+        self._timings = {}
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                context = multiprocessing.get_context(self.start_method)
+                if self.start_method == 'forkserver':
+                    context.set_forkserver_preload(FORKSERVER_PRELOAD)
+                executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=context,
+                    initializer=warm_up_worker,
+                    initargs=(self.font_path,)
+                )
+                try:
+                    # Запускаем все рабочие процессы сразу, чтобы они прогрелись
+                    for _ in range(self.max_workers):
+                        executor.submit(noop)
+                except Exception:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
+                self._executor = executor
+            return self._executor
+
+    def _reset_executor(self, executor):
+        """Отбрасывает пул, рабочий процесс которого аварийно завершился"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _record(self, name, elapsed=None, error=False):
+        with self._lock:
+            self.in_flight -= 1
+            if error:
+                self.failed += 1
+                return
+            self.completed += 1
+            timing = self._timings.setdefault(name, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += elapsed
+            timing[2] = max(timing[2], elapsed)
+
+    def submit(self, func, *args, **kwargs):
+        """Отправляет задание в пул и возвращает Future с результатом функции"""
+        name = getattr(func, '__name__', repr(func))
+        with self._lock:
+            self.submitted += 1
+            self.in_flight += 1
+
+        result_future = Future()
+        if self.max_workers == 0:
+            try:
+                result, elapsed = timed_call(func, args, kwargs)
+            except Exception as e:
+                self._record(name, error=True)
+                result_future.set_exception(e)
+            else:
+                self._record(name, elapsed)
+                result_future.set_result(result)
+            return result_future
+
+        executor = None
+        try:
+            executor = self._get_executor()
+            job = executor.submit(timed_call, func, args, kwargs)
+        except Exception as e:
+            # Пул не удалось запустить или он сломан - при следующем задании создадим новый
+            if executor is not None:
+                self._reset_executor(executor)
+            self._record(name, error=True)
+            result_future.set_exception(e)
+            return result_future
+
+        def on_done(job):
+            try:
+                result, elapsed = job.result()
+            except BrokenProcessPool as e:
+                self._reset_executor(executor)
+                self._record(name, error=True)
+                result_future.set_exception(e)
+            except Exception as e:
+                self._record(name, error=True)
+                result_future.set_exception(e)
+            else:
+                self._record(name, elapsed)
+                result_future.set_result(result)
+
+        job.add_done_callback(on_done)
+        return result_future
+
+    def run(self, func, *args, timeout=None, **kwargs):
+        """Выполняет задание в пуле и ждет результат (исключения пробрасываются)"""
+        return self.submit(func, *args, **kwargs).result(timeout=timeout)
+
+    def stats(self):
+        """
+        Возвращает словарь с состоянием сервиса: число рабочих процессов,
+        счетчики заданий, глубину очереди (queued - задания, ожидающие
+        свободного процесса) и время выполнения по видам заданий (секунды).
+        """
+        with self._lock:
+            workers = 0
+            if self._executor is not None:
+                workers = len(getattr(self._executor, '_processes', None) or {})
+            return {
+                'max_workers': self.max_workers,
+                'workers': workers,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'in_flight': self.in_flight,
+                'queued': max(self.in_flight - self.max_workers, 0),
+                'timings': {
+                    name: {
+                        'count': count,
+                        'avg': round(total / count, 4),
+                        'max': round(longest, 4)
+                    }
+                    for name, (count, total, longest) in sorted(self._timings.items())
+                }
+            }
+
+    def shutdown(self, wait=True):
+        """Останавливает рабочие процессы"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
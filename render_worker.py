@@ -0,0 +1,35 @@
+"""
+Модуль рабочего процесса пула отрисовки (см. render_service.py):
+инициализатор рабочего процесса и обертка заданий, без зависимостей
+от приложения. При запуске через forkserver модуль импортируется сервером
+запуска заранее (render_service.FORKSERVER_PRELOAD).
+"""
+import time
+
+def warm_up_worker(font_path):
+    """Инициализатор рабочего процесса: загружает matplotlib, шрифты и fpdf"""
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.figure
+        import matplotlib.backends.backend_agg
+        from matplotlib import font_manager
+        font_manager.findfont(font_manager.FontProperties())
+    except ImportError:
+        pass
+
+    try:
+        from documents import warm_up
+        warm_up(font_path)
+    except ImportError:
+        pass
+
+def noop():
+    """Пустое задание: заставляет пул запустить рабочий процесс заранее"""
+    return None
+
+def timed_call(func, args, kwargs):
+    """Выполняет задание в рабочем процессе и возвращает (результат, время выполнения)"""
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
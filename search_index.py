@@ -0,0 +1,214 @@
+"""
+Модуль полнотекстового поиска (SQLite FTS5) по клиентам, ТС и полисам.
+
+Индексы client_fts, vehicle_fts и policy_fts хранят копию искомых полей
+(rowid совпадает с id записи) и поддерживаются в актуальном состоянии
+триггерами SQLite, поэтому учитывают любые изменения, в том числе сделанные
+скриптами в обход приложения. Токенизатор unicode61 приводит к нижнему
+регистру в том числе кириллицу, «ё» при индексации и поиске заменяется на «е».
+Каждое слово запроса ищется как префикс токена.
+
+Префиксы слов не находят фрагменты из середины идентификаторов (хвост VIN,
+цифры паспорта, «123» в «А123ВС77»), поэтому паспорта, VIN, гос. номера и
+номера полисов дополнительно индексируются токенизатором trigram
+(client_id_fts, vehicle_id_fts, policy_id_fts) - он находит любую подстроку
+от трех символов.
+"""
+import re
+from sqlalchemy import text, table, column
+
+# Параметры FTS5: регистронезависимый unicode61 и префиксные индексы на 2-3 символа
+FTS_OPTIONS = "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'"
+
+# Облегченные описания виртуальных таблиц для построения запросов SQLAlchemy
+# (не входят в metadata, чтобы create_all не пытался создать их как обычные)
+client_fts = table('client_fts', column('rowid'), column('rank'), column('client_fts'))
+vehicle_fts = table('vehicle_fts', column('rowid'), column('rank'), column('vehicle_fts'))
+policy_fts = table('policy_fts', column('rowid'), column('rank'), column('policy_fts'))
+
+def _fold(expr):
+    """SQL-выражение, заменяющее «ё» на «е» (регистр приводит сам токенизатор)"""
+    return f"replace(replace({expr}, 'ё', 'е'), 'Ё', 'Е')"
+
+def _client_values(ref):
+    return f"{ref}.id, {_fold(f'{ref}.full_name')}, {ref}.passport"
+
+def _vehicle_values(ref):
+    return (f"{ref}.id, {_fold(f'{ref}.brand')}, {_fold(f'{ref}.model')}, "
+            f"{ref}.vin, {_fold(f'{ref}.reg_number')}")
+
+_POLICY_SELECT = (f"SELECT p.id, p.number, {_fold('c.full_name')}, {_fold('v.brand')}, "
+                  f"{_fold('v.model')}, {_fold('v.reg_number')} "
+                  "FROM policy p JOIN vehicle v ON v.id = p.vehicle_id "
+                  "JOIN client c ON c.id = v.client_id")
+
+SEARCH_INDEX_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS client_fts USING fts5(full_name, passport, {FTS_OPTIONS})",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS vehicle_fts USING fts5(brand, model, vin, reg_number, {FTS_OPTIONS})",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS policy_fts USING fts5(number, full_name, brand, model, reg_number, {FTS_OPTIONS})",
+
+    # Клиенты
+    f"""CREATE TRIGGER IF NOT EXISTS client_fts_ai AFTER INSERT ON client BEGIN
+        INSERT INTO client_fts(rowid, full_name, passport) VALUES ({_client_values('new')});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS client_fts_ad AFTER DELETE ON client BEGIN
+        DELETE FROM client_fts WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS client_fts_au AFTER UPDATE OF full_name, passport ON client BEGIN
+        DELETE FROM client_fts WHERE rowid = old.id;
+        INSERT INTO client_fts(rowid, full_name, passport) VALUES ({_client_values('new')});
+        UPDATE policy_fts SET full_name = {_fold('new.full_name')}
+        WHERE rowid IN (SELECT p.id FROM policy p JOIN vehicle v ON v.id = p.vehicle_id
+                        WHERE v.client_id = new.id);
+    END""",
+
+    # Транспортные средства
+    f"""CREATE TRIGGER IF NOT EXISTS vehicle_fts_ai AFTER INSERT ON vehicle BEGIN
+        INSERT INTO vehicle_fts(rowid, brand, model, vin, reg_number) VALUES ({_vehicle_values('new')});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS vehicle_fts_ad AFTER DELETE ON vehicle BEGIN
+        DELETE FROM vehicle_fts WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS vehicle_fts_au AFTER UPDATE OF brand, model, vin, reg_number, client_id ON vehicle BEGIN
+        DELETE FROM vehicle_fts WHERE rowid = old.id;
+        INSERT INTO vehicle_fts(rowid, brand, model, vin, reg_number) VALUES ({_vehicle_values('new')});
+        UPDATE policy_fts SET brand = {_fold('new.brand')}, model = {_fold('new.model')},
+            reg_number = {_fold('new.reg_number')},
+            full_name = (SELECT {_fold('full_name')} FROM client WHERE id = new.client_id)
+        WHERE rowid IN (SELECT id FROM policy WHERE vehicle_id = new.id);
+    END""",
+
+    # Полисы (в индекс полиса входят также владелец и ТС)
+    f"""CREATE TRIGGER IF NOT EXISTS policy_fts_ai AFTER INSERT ON policy BEGIN
+        INSERT INTO policy_fts(rowid, number, full_name, brand, model, reg_number)
+        {_POLICY_SELECT} WHERE p.id = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS policy_fts_ad AFTER DELETE ON policy BEGIN
+        DELETE FROM policy_fts WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS policy_fts_au AFTER UPDATE OF number, vehicle_id ON policy BEGIN
+        DELETE FROM policy_fts WHERE rowid = old.id;
+        INSERT INTO policy_fts(rowid, number, full_name, brand, model, reg_number)
+        {_POLICY_SELECT} WHERE p.id = new.id;
+    END""",
+]
+
+# Индекс подстрок идентификаторов (паспорт, VIN, гос. номер, номер полиса):
+# токенизатор trigram находит любой фрагмент от 3 символов, в том числе
+# середину или хвост (хвост VIN, «123» в «А123ВС77», цифры паспорта),
+# которые поиск по префиксам слов не находит
+IDENTIFIER_OPTIONS = "tokenize = 'trigram'"
+
+client_id_fts = table('client_id_fts', column('rowid'), column('client_id_fts'))
+vehicle_id_fts = table('vehicle_id_fts', column('rowid'), column('vehicle_id_fts'))
+policy_id_fts = table('policy_id_fts', column('rowid'), column('policy_id_fts'))
+
+# Фрагмент короче 3 символов индекс trigram не находит
+MIN_IDENTIFIER_FRAGMENT = 3
+
+_POLICY_ID_SELECT = "SELECT p.id, p.number, v.reg_number FROM policy p JOIN vehicle v ON v.id = p.vehicle_id"
+
+IDENTIFIER_INDEX_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS client_id_fts USING fts5(passport, {IDENTIFIER_OPTIONS})",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS vehicle_id_fts USING fts5(vin, reg_number, {IDENTIFIER_OPTIONS})",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS policy_id_fts USING fts5(number, reg_number, {IDENTIFIER_OPTIONS})",
+
+    """CREATE TRIGGER IF NOT EXISTS client_id_fts_ai AFTER INSERT ON client BEGIN
+        INSERT INTO client_id_fts(rowid, passport) VALUES (new.id, new.passport);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS client_id_fts_ad AFTER DELETE ON client BEGIN
+        DELETE FROM client_id_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS client_id_fts_au AFTER UPDATE OF passport ON client BEGIN
+        DELETE FROM client_id_fts WHERE rowid = old.id;
+        INSERT INTO client_id_fts(rowid, passport) VALUES (new.id, new.passport);
+    END""",
+
+    """CREATE TRIGGER IF NOT EXISTS vehicle_id_fts_ai AFTER INSERT ON vehicle BEGIN
+        INSERT INTO vehicle_id_fts(rowid, vin, reg_number) VALUES (new.id, new.vin, new.reg_number);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS vehicle_id_fts_ad AFTER DELETE ON vehicle BEGIN
+        DELETE FROM vehicle_id_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS vehicle_id_fts_au AFTER UPDATE OF vin, reg_number ON vehicle BEGIN
+        DELETE FROM vehicle_id_fts WHERE rowid = old.id;
+        INSERT INTO vehicle_id_fts(rowid, vin, reg_number) VALUES (new.id, new.vin, new.reg_number);
+        UPDATE policy_id_fts SET reg_number = new.reg_number
+        WHERE rowid IN (SELECT id FROM policy WHERE vehicle_id = new.id);
+    END""",
+
+    f"""CREATE TRIGGER IF NOT EXISTS policy_id_fts_ai AFTER INSERT ON policy BEGIN
+        INSERT INTO policy_id_fts(rowid, number, reg_number) {_POLICY_ID_SELECT} WHERE p.id = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS policy_id_fts_ad AFTER DELETE ON policy BEGIN
+        DELETE FROM policy_id_fts WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS policy_id_fts_au AFTER UPDATE OF number, vehicle_id ON policy BEGIN
+        DELETE FROM policy_id_fts WHERE rowid = old.id;
+        INSERT INTO policy_id_fts(rowid, number, reg_number) {_POLICY_ID_SELECT} WHERE p.id = new.id;
+    END""",
+]
+
+def create_search_index(conn):
+    """Создает таблицы FTS5 и триггеры синхронизации"""
+    for statement in SEARCH_INDEX_DDL:
+        conn.execute(text(statement))
+
+def rebuild_search_index(conn):
+    """Полностью перестраивает содержимое поисковых индексов по данным таблиц"""
+    conn.execute(text("DELETE FROM client_fts"))
+    conn.execute(text("DELETE FROM vehicle_fts"))
+    conn.execute(text("DELETE FROM policy_fts"))
+    conn.execute(text(f"INSERT INTO client_fts(rowid, full_name, passport) "
+                      f"SELECT {_client_values('client')} FROM client"))
+    conn.execute(text(f"INSERT INTO vehicle_fts(rowid, brand, model, vin, reg_number) "
+                      f"SELECT {_vehicle_values('vehicle')} FROM vehicle"))
+    conn.execute(text(f"INSERT INTO policy_fts(rowid, number, full_name, brand, model, reg_number) "
+                      f"{_POLICY_SELECT}"))
+    # Объединяем сегменты индексов после массовой вставки
+    for name in ('client_fts', 'vehicle_fts', 'policy_fts'):
+        conn.execute(text(f"INSERT INTO {name}({name}) VALUES ('optimize')"))
+    if has_identifier_index(conn):
+        rebuild_identifier_index(conn)
+
+def create_identifier_index(conn):
+    """Создает таблицы FTS5 (trigram) для поиска фрагментов идентификаторов и их триггеры"""
+    for statement in IDENTIFIER_INDEX_DDL:
+        conn.execute(text(statement))
+
+def has_identifier_index(conn):
+    """Проверяет, создан ли индекс фрагментов идентификаторов"""
+    return conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'policy_id_fts'")
+    ).first() is not None
+
+def rebuild_identifier_index(conn):
+    """Полностью перестраивает индекс фрагментов идентификаторов по данным таблиц"""
+    conn.execute(text("DELETE FROM client_id_fts"))
+    conn.execute(text("DELETE FROM vehicle_id_fts"))
+    conn.execute(text("DELETE FROM policy_id_fts"))
+    conn.execute(text("INSERT INTO client_id_fts(rowid, passport) SELECT id, passport FROM client"))
+    conn.execute(text("INSERT INTO vehicle_id_fts(rowid, vin, reg_number) SELECT id, vin, reg_number FROM vehicle"))
+    conn.execute(text(f"INSERT INTO policy_id_fts(rowid, number, reg_number) {_POLICY_ID_SELECT}"))
+    for name in ('client_id_fts', 'vehicle_id_fts', 'policy_id_fts'):
+        conn.execute(text(f"INSERT INTO {name}({name}) VALUES ('optimize')"))
+
+def build_fragment_query(search_term):
+    """
+    Запрос FTS5 (trigram) для поиска строки как фрагмента идентификатора или
+    None, если строка короче MIN_IDENTIFIER_FRAGMENT символов
+    """
+    fragment = search_term.strip()
+    if len(fragment) < MIN_IDENTIFIER_FRAGMENT:
+        return None
+    return '"' + fragment.replace('"', '""') + '"'
+
+def build_match_query(search_term):
+    """
+    Преобразует строку поиска в запрос FTS5: каждое слово - префикс токена,
+    все слова должны встретиться. Возвращает None, если слов в строке нет.
+    """
+    words = re.findall(r'\w+', search_term.replace('ё', 'е').replace('Ё', 'Е'))
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
@@ -0,0 +1,196 @@
+"""
+Модуль версионированных тарифов ОСАГО.
+
+Тариф - JSON-файл tariffs/tariff_<версия>.json: базовая ставка, шкалы
+коэффициентов (мощность двигателя, возраст ТС, стаж и возраст водителя),
+классы бонус-малус и сроки действия полиса. Шкала задается возрастающими
+границами и коэффициентами (на один больше, чем границ); upper_bound
+указывает, входит ли граница в нижний интервал ('inclusive' - значение <=
+границы, 'exclusive' - значение < границы).
+
+При загрузке тариф компилируется один раз: границы хранятся отсортированным
+кортежем и массивом NumPy, поэтому коэффициент находится двоичным поиском
+(bisect для одного полиса, np.searchsorted для пакета), а не цепочкой
+условий. Опубликованная версия не меняется - новые коэффициенты оформляются
+новым файлом с большей версией. Действующей считается последняя версия.
+
+TariffRegistry проверяет каталог не чаще раза в check_interval секунд и
+подхватывает новую версию без перезапуска. Новая версия компилируется одним
+потоком, остальные в это время продолжают считать по прежней, а начатые
+расчеты сохраняют ссылку на свою версию тарифа.
+"""
+import json
+import os
+import re
+import threading
+import time
+import traceback
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+# Каталог файлов тарифов
+TARIFFS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tariffs')
+
+# Имя файла тарифа: tariff_<версия>.json
+TARIFF_FILE_PATTERN = re.compile(r'^tariff_(\d+)\.json$')
+
+# Период проверки каталога на новые версии (сек)
+DEFAULT_CHECK_INTERVAL = 5
+
+# Шкалы коэффициентов в порядке умножения
+BRACKET_NAMES = ('engine_power', 'vehicle_age', 'driver_experience', 'driver_age')
+
+class Brackets:
+    """Скомпилированная шкала коэффициента"""
+
+    def __init__(self, name, bounds, ratios, upper_bound='inclusive'):
+        if upper_bound not in ('inclusive', 'exclusive'):
+            raise ValueError(f"Шкала {name}: upper_bound должен быть 'inclusive' или 'exclusive'")
+        if len(ratios) != len(bounds) + 1:
+            raise ValueError(f"Шкала {name}: коэффициентов должно быть на один больше, чем границ")
+        if any(lower >= upper for lower, upper in zip(bounds, bounds[1:])):
+            raise ValueError(f"Шкала {name}: границы должны строго возрастать")
+        self.name = name
+        self.bounds = tuple(bounds)
+        self.ratios = tuple(float(ratio) for ratio in ratios)
+        self.inclusive = upper_bound == 'inclusive'
+        self._bounds_array = None
+        self._ratios_array = None
+
+    def index(self, value):
+        """Номер интервала шкалы для значения"""
+        if self.inclusive:
+            return bisect_left(self.bounds, value)
+        return bisect_right(self.bounds, value)
+
+    def batch_index(self, values):
+        """Номера интервалов для массива значений"""
+        import numpy as np
+
+        if self._bounds_array is None:
+            self._ratios_array = np.array(self.ratios, dtype=np.float64)
+            self._bounds_array = np.array(self.bounds, dtype=np.float64)
+        return np.searchsorted(self._bounds_array, values, side='left' if self.inclusive else 'right')
+
+    def batch_ratios(self, values):
+        """Коэффициенты для массива значений"""
+        indices = self.batch_index(values)
+        return self._ratios_array[indices]
+
+class Tariff:
+    """Скомпилированная версия тарифа (после создания не изменяется)"""
+
+    def __init__(self, data):
+        try:
+            self.version = int(data['version'])
+            self.name = data.get('name', f'Тариф {self.version}')
+            self.base_rate = data['base_rate']
+            self.brackets = tuple(Brackets(name, **data['brackets'][name]) for name in BRACKET_NAMES)
+            self.bonus_malus = tuple((float(item['value']), item['label']) for item in data['bonus_malus'])
+            self.periods = tuple((int(item['months']), item['label']) for item in data['periods'])
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Некорректное описание тарифа: {str(e)}")
+        if not self.bonus_malus or not self.periods:
+            raise ValueError("В тарифе должны быть классы бонус-малус и сроки действия")
+
+    def bracket_indices(self, engine_power, vehicle_year, driver_experience, driver_age, current_year=None):
+        """Номера интервалов по шкалам (мощность, возраст ТС, стаж, возраст водителя)"""
+        if current_year is None:
+            current_year = datetime.now().year
+        values = (engine_power, current_year - vehicle_year, driver_experience, driver_age)
+        return tuple(brackets.index(value) for brackets, value in zip(self.brackets, values))
+
+    def ratios(self, indices):
+        """Коэффициенты по номерам интервалов шкал"""
+        return tuple(brackets.ratios[index] for brackets, index in zip(self.brackets, indices))
+
+    def batch_ratios(self, engine_power, vehicle_year, driver_experience, driver_age, current_year=None):
+        """Массивы коэффициентов по шкалам для массивов факторов"""
+        if current_year is None:
+            current_year = datetime.now().year
+        values = (engine_power, current_year - vehicle_year, driver_experience, driver_age)
+        return tuple(brackets.batch_ratios(value) for brackets, value in zip(self.brackets, values))
+
+def load_tariff(path):
+    """Загружает и компилирует тариф из JSON-файла"""
+    with open(path, encoding='utf-8') as f:
+        tariff = Tariff(json.load(f))
+    match = TARIFF_FILE_PATTERN.match(os.path.basename(path))
+    if match and int(match.group(1)) != tariff.version:
+        raise ValueError(f"Версия в файле {os.path.basename(path)} не совпадает с его именем")
+    return tariff
+
+class TariffRegistry:
+    """Версии тарифов из каталога с подхватом новых версий без перезапуска"""
+
+    def __init__(self, tariffs_dir=TARIFFS_DIR, check_interval=DEFAULT_CHECK_INTERVAL):
+        self.tariffs_dir = tariffs_dir
+        self.check_interval = check_interval
+        self.last_error = None
+        self._tariffs = {}
+        self._failed = {}
+        self._current = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def _path(self, version):
+        return os.path.join(self.tariffs_dir, f'tariff_{version}.json')
+
+    def versions(self):
+        """Версии тарифов, имеющиеся в каталоге, по возрастанию"""
+        versions = []
+        for name in os.listdir(self.tariffs_dir):
+            match = TARIFF_FILE_PATTERN.match(name)
+            if match:
+                versions.append(int(match.group(1)))
+        return sorted(versions)
+
+    def get(self, version):
+        """Тариф указанной версии (например, для пересчета старого полиса)"""
+        tariff = self._tariffs.get(version)
+        if tariff is None:
+            tariff = load_tariff(self._path(version))
+            self._tariffs.setdefault(version, tariff)
+        return tariff
+
+    def current(self):
+        """Действующий (последний) тариф"""
+        if self._current is None or time.monotonic() - self._checked_at >= self.check_interval:
+            self.reload()
+        return self._current
+
+    def reload(self):
+        """
+        Переходит на последнюю версию из каталога. Если перезагрузку уже
+        выполняет другой поток, сразу возвращает действующий тариф. Если новая
+        версия не загружается, остается прежняя, а ошибка сохраняется в last_error.
+        """
+        if not self._lock.acquire(blocking=self._current is None):
+            return self._current
+        try:
+            self._checked_at = time.monotonic()
+            for version in reversed(self.versions()):
+                if self._current is not None and version <= self._current.version:
+                    break
+                path = self._path(version)
+                modified = os.path.getmtime(path)
+                if self._failed.get(version) == modified:
+                    continue
+                try:
+                    tariff = self.get(version)
+                except (OSError, ValueError) as e:
+                    self._failed[version] = modified
+                    self.last_error = f"Тариф {version}: {str(e)}"
+                    traceback.print_exc()
+                    continue
+                # Ссылка заменяется целиком: начатые расчеты продолжают по старой версии
+                self._current = tariff
+                break
+            if self._current is None:
+                raise RuntimeError(f"В каталоге {self.tariffs_dir} нет действующего тарифа")
+            return self._current
+        finally:
+            self._lock.release()
+
+# Тарифы приложения (каталог tariffs/)
+tariff_registry = TariffRegistry()
@@ -0,0 +1,87 @@
+"""
+Общие фикстуры тестов: приложение Flask с временной базой SQLite,
+доведенной до актуальной схемы (create_all и миграции, как при запуске app.py),
+и та же база с клиентами, ТС и полисами на границах фильтров (seeded).
+
+Запуск из корня проекта:
+    python -m pytest tests
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Client, Vehicle, Policy
+from update_db import run_migrations
+
+@pytest.fixture
+def app(tmp_path):
+    """Приложение с пустой временной базой; тест выполняется в контексте приложения"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'test.db'}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        run_migrations(db.engine)
+        yield app
+        db.session.remove()
+
+CURRENT_DATE = datetime(2025, 5, 14, 12, 0, 0)
+
+CLIENTS = [
+    ('Иванов Иван Иванович', '4510 123456'),
+    ('ИВАНОВА Мария Петровна', '4511 654321'),
+    ('Ёлкин Пётр Сергеевич', '4512 000123'),
+    ('елкина Анна', '4513 777777'),
+    ('Smith John', '4514 123000')
+]
+
+VEHICLES = [
+    # (клиент, марка, модель, VIN, гос. номер)
+    (0, 'Лада', 'Веста', 'XTA210990Y2766389', 'А123ВС77'),
+    (0, 'Toyota', 'Camry', 'JTNB11HK003456789', 'В456ОР99'),
+    (1, 'ЛАДА', 'Гранта', 'XTA219010K0123456', 'Е789КХ50'),
+    (2, 'Kia', 'Rio', 'Z94CB41AAGR323020', 'М001ММ77'),
+    (3, 'toyota', 'RAV4', 'JTMBFREV30D123123', 'Н123АА197'),
+    (4, 'BMW', 'X5', 'WBAKS410X00C12345', 'О777ОО777')
+]
+
+# Сдвиг даты окончания относительно CURRENT_DATE и статус: границы фильтров
+# «действующие» (end_date >= текущей даты) и «истекают в течение 30 дней»
+POLICIES = [
+    (timedelta(days=-1), 'active'),
+    (timedelta(0), 'active'),
+    (timedelta(seconds=1), 'active'),
+    (timedelta(days=10), 'active'),
+    (timedelta(days=29, hours=23), 'active'),
+    (timedelta(days=30), 'active'),
+    (timedelta(days=100), 'active'),
+    (timedelta(days=10), 'cancelled'),
+    (timedelta(days=-200), 'cancelled')
+]
+
+@pytest.fixture
+def seeded(app):
+    clients = [Client(full_name=name, passport=passport) for name, passport in CLIENTS]
+    db.session.add_all(clients)
+    db.session.flush()
+    vehicles = [Vehicle(client_id=clients[owner].id, brand=brand, model=model, year=2020, vin=vin,
+                        reg_number=reg_number, engine_power=100)
+                for owner, brand, model, vin, reg_number in VEHICLES]
+    db.session.add_all(vehicles)
+    db.session.flush()
+    number = 0
+    for vehicle in vehicles:
+        for shift, status in POLICIES:
+            number += 1
+            end_date = CURRENT_DATE + shift
+            db.session.add(Policy(number=f'OSG-20250514-{number:04d}', vehicle_id=vehicle.id,
+                                  start_date=end_date - timedelta(days=365), end_date=end_date, cost=5000,
+                                  created_at=end_date - timedelta(days=365), status=status))
+    db.session.commit()
+    return app
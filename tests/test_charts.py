@@ -0,0 +1,61 @@
+"""
+Кэш графиков (charts.ChartCache): счетчики попаданий под блокировкой и
+повторная отрисовка вытесненного изображения по отпечатку.
+"""
+import threading
+
+from charts import ChartCache, chart_fingerprint
+
+def fake_render(calls):
+    def render(chart_data):
+        calls.append(chart_data)
+        return f"png:{chart_data['status']}".encode().ljust(100, b'.')
+    return render
+
+def chart_data(n):
+    return {'status': [n, 0, 0], 'periods': {}, 'monthly': {}}
+
+def test_evicted_chart_is_rendered_again():
+    calls = []
+    cache = ChartCache(max_bytes=150)
+    first = cache.get_or_render(chart_data(1), fake_render(calls))
+    cache.get_or_render(chart_data(2), fake_render(calls))
+    assert cache.get(first) is None  # Вытеснен вторым графиком
+
+    png = cache.get_or_rerender(first, fake_render(calls))
+    assert png.startswith(b'png:[1, 0, 0]')
+    assert calls == [chart_data(1), chart_data(2), chart_data(1)]
+    assert cache.get(first) == png
+
+def test_cached_chart_is_not_rendered_again():
+    calls = []
+    cache = ChartCache()
+    fingerprint = cache.get_or_render(chart_data(1), fake_render(calls))
+    assert fingerprint == chart_fingerprint(chart_data(1))
+    assert cache.get_or_rerender(fingerprint, fake_render(calls)) is not None
+    assert cache.get_or_render(chart_data(1), fake_render(calls)) == fingerprint
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (2, 1)
+
+def test_unknown_fingerprint():
+    calls = []
+    cache = ChartCache(max_bytes=150, max_sources=1)
+    old = cache.get_or_render(chart_data(1), fake_render(calls))
+    cache.get_or_render(chart_data(2), fake_render(calls))
+    # Изображение и данные первого графика вытеснены - построить его нечем
+    assert cache.get_or_rerender(old, fake_render(calls)) is None
+    assert cache.get_or_rerender('0' * 64, fake_render(calls)) is None
+    assert len(calls) == 2
+
+def test_counters_are_consistent_across_threads():
+    cache = ChartCache()
+    cache.get_or_render(chart_data(1), fake_render([]))
+    threads = [threading.Thread(target=lambda: [cache.get_or_render(chart_data(1), fake_render([]))
+                                                for _ in range(2000)])
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.misses == 1
+    assert cache.hits == 8 * 2000
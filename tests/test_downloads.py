@@ -0,0 +1,34 @@
+"""
+Маршрут скачивания сгенерированных файлов (/download/files/...) отдает
+только файлы из папки для загрузок и никогда - реестр файлов.
+"""
+import pytest
+
+import app as application
+from file_storage import REGISTRY_FILE_NAME
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setitem(application.app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    return application.app.test_client()
+
+def test_registry_is_not_in_served_folder():
+    assert not application.file_storage.registry_file.startswith(application.app.config['UPLOAD_FOLDER'])
+
+def test_registry_is_not_served(client, tmp_path):
+    (tmp_path / REGISTRY_FILE_NAME).write_text('{}', encoding='utf-8')
+    (tmp_path / 'imports').mkdir()
+    (tmp_path / 'imports' / REGISTRY_FILE_NAME).write_text('{}', encoding='utf-8')
+    assert client.get(f'/download/files/{REGISTRY_FILE_NAME}').status_code == 404
+    assert client.get(f'/download/files/imports/{REGISTRY_FILE_NAME}').status_code == 404
+
+def test_generated_file_is_served(client, tmp_path):
+    (tmp_path / 'policies_export.csv').write_text('Номер полиса\n', encoding='utf-8')
+    response = client.get('/download/files/policies_export.csv')
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'].startswith('attachment')
+
+def test_paths_outside_upload_folder_are_not_served(client, tmp_path):
+    (tmp_path.parent / 'outside.txt').write_text('secret', encoding='utf-8')
+    assert client.get('/download/files/../outside.txt').status_code == 404
+    assert client.get('/download/files/%2e%2e/outside.txt').status_code == 404
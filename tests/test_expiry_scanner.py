@@ -0,0 +1,57 @@
+"""
+Проход планировщика истекающих полисов (expiry_scanner.run_expiry_scan):
+уведомления ставятся в очередь только для явно заданных каналов, истекшие
+полисы хранятся за lookback_days дней, уведомления по истекшим полисам
+снимаются с отправки.
+"""
+from datetime import timedelta
+
+from expiry_scanner import expired_policy_rows, run_expiry_scan
+from models import db, Client, NotificationOutbox, Policy
+from notification_outbox import drop_stale_notifications
+from tests.conftest import CURRENT_DATE
+
+def add_contacts():
+    for client in Client.query.all():
+        client.email = f"client{client.id}@example.com"
+        client.phone = f"+7900000000{client.id}"
+    db.session.commit()
+
+def test_no_notifications_by_default(seeded):
+    add_contacts()
+    summary = run_expiry_scan(CURRENT_DATE)
+    assert summary['queued'] == 0
+    assert summary['delivery_job'] is None
+    assert db.session.query(NotificationOutbox).count() == 0
+
+def test_notifications_for_configured_channels(seeded):
+    add_contacts()
+    summary = run_expiry_scan(CURRENT_DATE, channels=('sms',))
+    assert summary['queued'] > 0
+    assert {row.channel for row in NotificationOutbox.query.all()} == {'sms'}
+
+def test_expired_policies_within_lookback(seeded):
+    run_expiry_scan(CURRENT_DATE, lookback_days=30)
+    end_dates = {policy.end_date for policy, _, _ in expired_policy_rows(CURRENT_DATE)}
+    assert end_dates == {CURRENT_DATE - timedelta(days=1)}
+
+    # Через день истекший вчера полис выходит за глубину в один день
+    next_day = CURRENT_DATE + timedelta(days=1)
+    run_expiry_scan(next_day, lookback_days=1, full_scan_interval=timedelta(0))
+    end_dates = {policy.end_date for policy, _, _ in expired_policy_rows(next_day)}
+    assert end_dates == {CURRENT_DATE, CURRENT_DATE + timedelta(seconds=1)}
+
+def test_stale_notifications_are_dropped_by_end_date(seeded):
+    add_contacts()
+    run_expiry_scan(CURRENT_DATE, channels=('sms',))
+    # Через два дня истекли полисы, статус которых ночное задание еще не сменило
+    later = CURRENT_DATE + timedelta(days=2)
+    dropped = drop_stale_notifications(later)
+    db.session.commit()
+
+    stale = (NotificationOutbox.query.join(Policy, Policy.id == NotificationOutbox.policy_id)
+             .filter(Policy.end_date < later).all())
+    assert stale and dropped == len(stale)
+    assert {row.status for row in stale} == {'failed'}
+    pending = NotificationOutbox.query.filter_by(status='pending').all()
+    assert pending and all(db.session.get(Policy, row.policy_id).end_date >= later for row in pending)
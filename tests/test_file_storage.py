@@ -0,0 +1,39 @@
+"""
+Реестр файлов (file_storage.FileStorage) при одновременной регистрации
+файлов из нескольких потоков и его хранение вне папки с файлами.
+"""
+import json
+import threading
+
+from file_storage import REGISTRY_FILE_NAME, FileStorage
+
+def test_concurrent_registrations_are_all_saved(tmp_path):
+    storage = FileStorage(str(tmp_path / 'files'), str(tmp_path / 'registry'))
+    file_ids = []
+
+    def register(thread_number):
+        for i in range(50):
+            file_ids.append(storage.register_file(str(tmp_path / 'files' / f"file_{thread_number}_{i}.csv")))
+
+    threads = [threading.Thread(target=register, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with open(storage.registry_file, encoding='utf-8') as f:
+        saved = json.load(f)
+    assert len(file_ids) == len(saved) == 8 * 50
+    assert set(saved) == set(file_ids)
+    reloaded = FileStorage(str(tmp_path / 'files'), str(tmp_path / 'registry'))
+    assert reloaded.get_file_info(file_ids[0]) == storage.get_file_info(file_ids[0])
+
+def test_legacy_registry_moves_out_of_storage_dir(tmp_path):
+    storage_dir = tmp_path / 'files'
+    storage_dir.mkdir()
+    (storage_dir / REGISTRY_FILE_NAME).write_text(
+        json.dumps({'old': {'path': 'x.csv', 'filename': 'x.csv', 'created_at': ''}}), encoding='utf-8')
+
+    storage = FileStorage(str(storage_dir), str(tmp_path / 'registry'))
+    assert not (storage_dir / REGISTRY_FILE_NAME).exists()
+    assert storage.get_file_info('old')['filename'] == 'x.csv'
@@ -0,0 +1,182 @@
+"""
+Пакетный импорт клиентов и ТС (fleet_import.FleetImporter и задание
+импорта в app.py): повторы паспортов, VIN и гос. номеров в файле и в базе,
+откат неудачного пакета, список ошибок и продолжение с контрольной точки.
+"""
+import csv
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import app as application
+from fleet_import import IMPORT_COLUMNS, FleetImporter
+from models import db, Client, Vehicle
+
+HEADER = ['ФИО', 'Паспорт', 'Телефон', 'Email', 'Марка', 'Модель', 'Год выпуска', 'VIN', 'Гос. номер',
+          'Мощность']
+
+def row(full_name='', passport='', vin='', reg_number='', brand='Лада', model='Веста', year='2020',
+        engine_power='106'):
+    values = {field: '' for field in IMPORT_COLUMNS}
+    values.update(full_name=full_name, passport=passport)
+    if vin or reg_number:
+        values.update(brand=brand, model=model, year=year, vin=vin, reg_number=reg_number,
+                      engine_power=engine_power)
+    return values
+
+def run_import(rows, batch_size=100):
+    """Импортирует строки, возвращает (сводка, ошибки по номерам строк)"""
+    errors = {}
+
+    def on_batch(last_line, batch_errors):
+        errors.update(batch_errors)
+
+    summary = FleetImporter(batch_size).import_rows(enumerate(rows, start=2), on_batch)
+    return summary, errors
+
+def add_existing():
+    client = Client(full_name='Иванов Иван', passport='4510 123456')
+    db.session.add(client)
+    db.session.flush()
+    db.session.add(Vehicle(client_id=client.id, brand='Kia', model='Rio', year=2019, vin='Z94CB41AAGR323020',
+                           reg_number='М001ММ77', engine_power=123))
+    db.session.commit()
+    return client
+
+def test_duplicates_inside_one_file(app):
+    summary, errors = run_import([
+        row('Петров Петр', '4600 111111', 'XTA210990Y2766389', 'А123ВС77'),
+        # Тот же паспорт с другим ТС - ТС добавляется тому же клиенту
+        row('Петров Петр', '4600 111111', 'XTA219010K0123456', 'Е789КХ50'),
+        # Тот же паспорт без ТС - повтор клиента
+        row('Петров Петр', '4600 111111'),
+        row('Сидоров Сидор', '4600 222222', 'XTA210990Y2766389', 'В456ОР99'),
+        row('Сидоров Сидор', '4600 222222', 'JTNB11HK003456789', 'А123ВС77')
+    ])
+    assert summary == {'rows': 5, 'clients_added': 1, 'vehicles_added': 2, 'errors': 3}
+    assert set(errors) == {4, 5, 6}
+    assert 'Клиент с паспортом 4600 111111 уже существует' in errors[4]
+    assert 'VIN XTA210990Y2766389 уже существует' in errors[5]
+    assert 'гос. номером А123ВС77 уже существует' in errors[6]
+
+    petrov = Client.query.filter_by(passport='4600 111111').one()
+    assert {vehicle.vin for vehicle in petrov.vehicles} == {'XTA210990Y2766389', 'XTA219010K0123456'}
+    # Строки с повторами не добавляют и клиента
+    assert Client.query.count() == 1
+
+def test_duplicates_against_database(app):
+    existing = add_existing()
+    summary, errors = run_import([
+        # ТС клиента, который уже есть в базе, добавляется ему
+        row('Иванов Иван', '4510 123456', 'XTA210990Y2766389', 'А123ВС77'),
+        row('Иванов Иван', '4510 123456'),
+        row('Петров Петр', '4600 111111', 'Z94CB41AAGR323020', 'В456ОР99'),
+        row('Петров Петр', '4600 111111', 'JTNB11HK003456789', 'М001ММ77')
+    ])
+    assert summary == {'rows': 4, 'clients_added': 0, 'vehicles_added': 1, 'errors': 3}
+    assert set(errors) == {3, 4, 5}
+    assert 'VIN Z94CB41AAGR323020 уже существует' in errors[4]
+    assert 'гос. номером М001ММ77 уже существует' in errors[5]
+    assert Vehicle.query.filter_by(vin='XTA210990Y2766389').one().client_id == existing.id
+    assert Client.query.count() == 1
+
+def test_failed_batch_rolls_back_and_frees_values(app):
+    importer = FleetImporter(batch_size=2)
+    # Клиент появился в базе после загрузки множеств - вставка пакета нарушит уникальность паспорта
+    db.session.add(Client(full_name='Сидоров Сидор', passport='4600 222222'))
+    db.session.commit()
+
+    errors = []
+    summary = importer.import_rows(enumerate([
+        row('Петров Петр', '4600 111111', 'XTA210990Y2766389', 'А123ВС77'),
+        row('Сидоров Сидор', '4600 222222', 'XTA219010K0123456', 'Е789КХ50'),
+        row('Козлов Козьма', '4600 333333', 'JTNB11HK003456789', 'В456ОР99')
+    ], start=2), lambda last_line, batch_errors: errors.extend(batch_errors))
+
+    assert [line for line, _ in errors] == [2, 3]
+    assert all(message.startswith('Ошибка при сохранении пакета') for _, message in errors)
+    assert summary == {'rows': 3, 'clients_added': 1, 'vehicles_added': 1, 'errors': 2}
+    # Из неудачного пакета ничего не записано, его значения снова свободны
+    assert '4600 111111' not in importer.clients and '4600 222222' not in importer.clients
+    assert importer.clients['4600 333333'] is not None
+    assert 'XTA210990Y2766389' not in importer.vins and 'А123ВС77' not in importer.reg_numbers
+    assert Client.query.filter_by(passport='4600 111111').first() is None
+    assert {vehicle.vin for vehicle in Vehicle.query.all()} == {'JTNB11HK003456789'}
+
+@pytest.fixture
+def folders(tmp_path, monkeypatch):
+    monkeypatch.setitem(application.app.config, 'UPLOAD_FOLDER', str(tmp_path / 'files'))
+    monkeypatch.setitem(application.app.config, 'IMPORT_FOLDER', str(tmp_path / 'imports'))
+    (tmp_path / 'files').mkdir()
+    (tmp_path / 'imports').mkdir()
+    return tmp_path
+
+def write_import_file(path, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(HEADER)
+        writer.writerows(rows)
+
+IMPORT_FILE_ROWS = [
+    ['Петров Петр', '4600 111111', '+79001234567', '', 'Лада', 'Веста', '2020', 'XTA210990Y2766389',
+     'А123ВС77', '106'],
+    ['Без паспорта', '12', '', '', '', '', '', '', '', ''],
+    ['Сидоров Сидор', '4600 222222', '', 'sidorov@example.com', '', '', '', '', '', ''],
+    ['Козлов Козьма', '4600 333333', '', '', 'Kia', 'Rio', '1800', 'JTNB11HK003456789', 'В456ОР99', '90'],
+    ['Петров Петр', '4600 111111', '', '', '', '', '', '', '', '']
+]
+
+def fleet_job(params, checkpoint=None, report=None):
+    return SimpleNamespace(job_id=1, params=params, checkpoint=checkpoint,
+                           report=report or (lambda progress, checkpoint=None: None))
+
+def read_errors(path):
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        return list(csv.reader(f, delimiter=';'))
+
+def test_error_report_contents(app, folders):
+    write_import_file(folders / 'imports' / 'import_test.csv', IMPORT_FILE_ROWS)
+    params = {'file_name': 'import_test.csv', 'errors_name': 'import_errors_test.csv', 'batch_size': 2}
+
+    result = application.fleet_import_job(fleet_job(params))
+
+    assert result['details'] == ["Добавлено клиентов: 2", "Добавлено транспортных средств: 1",
+                                 "Строк с ошибками: 3"]
+    assert result['download_url'] == '/download/files/import_errors_test.csv'
+    errors = read_errors(folders / 'files' / 'import_errors_test.csv')
+    assert errors[0] == ['Строка', 'Ошибка']
+    assert [line for line, _ in errors[1:]] == ['3', '5', '6']
+    assert errors[1][1] == 'Паспорт должен содержать 10 цифр'
+    assert errors[2][1] == f"Год выпуска: допустимо от 1900 до {datetime.now().year}"
+    assert errors[3][1] == 'Клиент с паспортом 4600 111111 уже существует'
+    # Загруженный файл удаляется после обработки
+    assert not (folders / 'imports' / 'import_test.csv').exists()
+
+class Crash(BaseException):
+    """Аварийная остановка процесса посреди задания"""
+
+def test_resume_from_checkpoint(app, folders):
+    file_path = folders / 'imports' / 'import_test.csv'
+    errors_path = folders / 'files' / 'import_errors_test.csv'
+    write_import_file(file_path, IMPORT_FILE_ROWS)
+    params = {'file_name': 'import_test.csv', 'errors_name': 'import_errors_test.csv', 'batch_size': 2}
+    saved = {}
+
+    def crash_after_first_batch(progress, checkpoint=None):
+        saved.update(checkpoint)
+        raise Crash()
+
+    with pytest.raises(Crash):
+        application.import_fleet_file(fleet_job(params, report=crash_after_first_batch), str(file_path),
+                                      str(errors_path))
+    assert saved['line'] == 3
+    assert Client.query.count() == 1
+
+    # Перезапуск: строки до контрольной точки не импортируются повторно
+    result = application.fleet_import_job(fleet_job(params, checkpoint=saved))
+    assert result['message'] == "Импорт завершен (строк: 5)"
+    assert result['details'] == ["Добавлено клиентов: 2", "Добавлено транспортных средств: 1",
+                                 "Строк с ошибками: 3"]
+    assert Client.query.count() == 2
+    assert [line for line, _ in read_errors(errors_path)[1:]] == ['3', '5', '6']
@@ -0,0 +1,112 @@
+"""
+Выдача номеров полисов (policy_numbers.PolicyNumberAllocator) из
+нескольких потоков и процессов с одной базой SQLite: номера не
+повторяются, идут без пропусков и проходят уникальный индекс по номеру.
+"""
+import multiprocessing
+import threading
+from datetime import datetime
+
+import pytest
+from flask import Flask
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Client, Vehicle, Policy, PolicyNumberSequence
+from policy_numbers import PolicyNumberAllocator, format_policy_number
+
+CURRENT_DATE = datetime(2025, 5, 14, 12, 0, 0)
+DAY = CURRENT_DATE.strftime('%Y%m%d')
+BLOCK_SIZE = 5
+THREADS = 4
+# Кратно размеру блока: каждый выдающий выбирает свои блоки полностью, поэтому пропусков нет
+NUMBERS_PER_THREAD = 10
+
+def issue_numbers(app, allocator):
+    """Номера, выданные allocator одновременно из THREADS потоков"""
+    issued = []
+    issued_lock = threading.Lock()
+    start = threading.Barrier(THREADS)
+
+    def worker():
+        start.wait()
+        with app.app_context():
+            local = [allocator.allocate(CURRENT_DATE) for _ in range(NUMBERS_PER_THREAD)]
+        with issued_lock:
+            issued.extend(local)
+
+    workers = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return issued
+
+def issue_numbers_in_process(database_uri, start, results):
+    """Рабочий процесс: свое приложение и свой PolicyNumberAllocator с той же базой"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    start.wait()
+    results.put(issue_numbers(app, PolicyNumberAllocator(BLOCK_SIZE)))
+
+def store_policies(numbers):
+    """Записывает полисы с выданными номерами (повтор отвергнет уникальный индекс)"""
+    client = Client(full_name='Тестовый клиент', passport='0000 000000')
+    db.session.add(client)
+    db.session.flush()
+    vehicle = Vehicle(client_id=client.id, brand='Лада', model='Веста', year=2020,
+                      vin='XTA00000000000000', reg_number='А000АА00', engine_power=106)
+    db.session.add(vehicle)
+    db.session.flush()
+    db.session.execute(db.insert(Policy), [
+        {'number': number, 'vehicle_id': vehicle.id, 'start_date': CURRENT_DATE, 'end_date': CURRENT_DATE,
+         'cost': 0, 'created_at': CURRENT_DATE, 'status': 'active'}
+        for number in numbers])
+    db.session.commit()
+    return vehicle.id
+
+def assert_unique_and_gap_free(issued, total):
+    assert len(issued) == total
+    assert sorted(issued) == [format_policy_number(DAY, value) for value in range(1, total + 1)]
+    assert db.session.get(PolicyNumberSequence, DAY).next_value == total + 1
+
+    vehicle_id = store_policies(issued)
+    assert db.session.query(db.func.count(Policy.id)).scalar() == total
+    # Уникальный индекс по номеру действует: повтор номера не записывается
+    db.session.add(Policy(number=issued[0], vehicle_id=vehicle_id, start_date=CURRENT_DATE,
+                          end_date=CURRENT_DATE, cost=0, created_at=CURRENT_DATE, status='active'))
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+    db.session.rollback()
+
+def test_threads_of_several_allocators(app):
+    # Несколько экземпляров выдающего в одном процессе - как несколько процессов приложения
+    allocators = [PolicyNumberAllocator(BLOCK_SIZE) for _ in range(3)]
+    issued = []
+    threads = [threading.Thread(target=lambda allocator=allocator: issued.extend(issue_numbers(app, allocator)))
+               for allocator in allocators]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert_unique_and_gap_free(issued, len(allocators) * THREADS * NUMBERS_PER_THREAD)
+    assert sum(allocator.blocks_reserved for allocator in allocators) == len(issued) // BLOCK_SIZE
+
+def test_several_processes(app):
+    context = multiprocessing.get_context('spawn')
+    start = context.Event()
+    results = context.Queue()
+    processes = [context.Process(target=issue_numbers_in_process,
+                                 args=(app.config['SQLALCHEMY_DATABASE_URI'], start, results))
+                 for _ in range(2)]
+    for process in processes:
+        process.start()
+    start.set()
+    issued = [number for _ in processes for number in results.get(timeout=60)]
+    for process in processes:
+        process.join(timeout=60)
+    assert [process.exitcode for process in processes] == [0, 0]
+
+    assert_unique_and_gap_free(issued, len(processes) * THREADS * NUMBERS_PER_THREAD)
@@ -0,0 +1,28 @@
+"""
+Текущий статус полиса (models.policy_actual_status) одинаков для списка
+полисов, карточки, удаления ТС и выгрузок.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import policy_actual_status, policy_status_label
+
+NOW = datetime(2025, 5, 14, 12, 0, 0)
+
+@pytest.mark.parametrize('status, end_date, expected', [
+    ('active', NOW + timedelta(days=10), 'active'),
+    ('active', NOW, 'active'),
+    ('active', NOW - timedelta(seconds=1), 'expired'),
+    ('expired', NOW - timedelta(days=1), 'expired'),
+    ('expired', NOW + timedelta(days=1), 'expired'),
+    ('cancelled', NOW + timedelta(days=10), 'cancelled'),
+    ('cancelled', NOW - timedelta(days=10), 'cancelled'),
+])
+def test_policy_actual_status(status, end_date, expected):
+    assert policy_actual_status(status, end_date, NOW) == expected
+
+def test_expired_policy_is_not_labelled_active():
+    assert policy_status_label('active', NOW - timedelta(days=1), NOW) == 'Истек'
+    assert policy_status_label('active', NOW + timedelta(days=1), NOW) == 'Активен'
+    assert policy_status_label('cancelled', NOW - timedelta(days=1), NOW) == 'Отменен'
@@ -0,0 +1,182 @@
+"""
+Пакетный расчет стоимости (pricing.batch_policy_cost) совпадает с расчетом
+одного полиса (pricing.calculate_policy_cost) поэлементно, в том числе на
+границах шкал тарифа, для всех классов КБМ и сроков действия. Реестр
+тарифов (tariffs.TariffRegistry) подхватывает новые версии, кэш котировок
+(quotes.QuoteService) учитывает попадания, вытесняет старые расчеты и
+разделяет версии тарифа.
+"""
+import itertools
+import json
+import os
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from pricing import batch_policy_cost, calculate_policy_cost
+from quotes import QuoteService
+from tariffs import TARIFFS_DIR, TariffRegistry, tariff_registry
+
+np = pytest.importorskip('numpy')
+
+# Тариф версии 1 (tariffs/tariff_1.json): проверки не зависят от новых версий
+TARIFF = tariff_registry.get(1)
+
+# Значения на границах шкал и рядом с ними
+POWER_EDGES = [0, 49, 50, 50.5, 51, 99, 100, 101, 149, 150, 151, 199, 200, 201, 1000]
+VEHICLE_AGE_EDGES = [0, 2, 3, 4, 6, 7, 8, 9, 10, 11, 40]
+EXPERIENCE_EDGES = [0, 2, 3, 4, 5, 6, 9, 10, 11, 50]
+DRIVER_AGE_EDGES = [18, 21, 21.5, 22, 23, 24, 25, 26, 59, 60, 61, 90]
+BONUS_MALUS_CLASSES = [value for value, _ in TARIFF.bonus_malus]
+PERIODS = [months for months, _ in TARIFF.periods]
+
+def scalar_costs(engine_power, vehicle_year, driver_age, driver_experience, bonus_malus, period_months):
+    """Стоимость каждого полиса отдельным вызовом calculate_policy_cost"""
+    return [calculate_policy_cost(SimpleNamespace(engine_power=power, year=year), period, experience, age,
+                                  kbm, tariff=TARIFF)
+            for power, year, age, experience, kbm, period in zip(
+                engine_power, vehicle_year, driver_age, driver_experience, bonus_malus, period_months)]
+
+def assert_same_costs(current_year, engine_power, vehicle_age, driver_age, driver_experience, bonus_malus,
+                      period_months):
+    vehicle_year = [current_year - age for age in vehicle_age]
+    expected = scalar_costs(engine_power, vehicle_year, driver_age, driver_experience, bonus_malus,
+                            period_months)
+    actual = batch_policy_cost(engine_power, vehicle_year, driver_age, driver_experience, bonus_malus,
+                               period_months, current_year=current_year, tariff=TARIFF)
+    assert actual.shape == (len(expected),)
+    mismatches = [(index, expected[index], actual[index]) for index in range(len(expected))
+                  if actual[index] != expected[index]]
+    assert not mismatches, f"Расхождения (номер, поэлементно, пакетно): {mismatches[:10]}"
+
+def test_all_bracket_edge_combinations():
+    current_year = datetime.now().year
+    combinations = list(itertools.product(POWER_EDGES, VEHICLE_AGE_EDGES, DRIVER_AGE_EDGES, EXPERIENCE_EDGES))
+    count = len(combinations)
+    engine_power, vehicle_age, driver_age, driver_experience = (list(column) for column in zip(*combinations))
+    # Классы КБМ и сроки чередуются так, чтобы встретиться с каждой границей
+    bonus_malus = [BONUS_MALUS_CLASSES[i % len(BONUS_MALUS_CLASSES)] for i in range(count)]
+    period_months = [PERIODS[i % len(PERIODS)] for i in range(count)]
+    assert_same_costs(current_year, engine_power, vehicle_age, driver_age, driver_experience, bonus_malus,
+                      period_months)
+
+@pytest.mark.parametrize('period_months', PERIODS + [1, 5, 7, 11])
+def test_all_bonus_malus_classes_and_periods(period_months):
+    current_year = datetime.now().year
+    cases = list(itertools.product(BONUS_MALUS_CLASSES + [0.55, 1.05, 2.449999], [50, 150, 201], [3, 10]))
+    bonus_malus, engine_power, vehicle_age = (list(column) for column in zip(*cases))
+    count = len(cases)
+    assert_same_costs(current_year, engine_power, vehicle_age, [22] * count, [3] * count, bonus_malus,
+                      [period_months] * count)
+
+def test_random_factors_match():
+    rng = np.random.default_rng(1)
+    count = 5000
+    assert_same_costs(datetime.now().year,
+                      rng.integers(30, 400, count).tolist(), rng.integers(0, 30, count).tolist(),
+                      rng.integers(18, 90, count).tolist(), rng.integers(0, 60, count).tolist(),
+                      rng.uniform(0.5, 2.45, count).tolist(), rng.integers(1, 13, count).tolist())
+
+@pytest.mark.parametrize('engine_power, vehicle_age, driver_age, driver_experience, expected', [
+    # Мощность: граница входит в нижний интервал
+    (100, 0, 30, 20, 5000 * 1.0 * 1.0 * 0.8 * 1.0),
+    (101, 0, 30, 20, 5000 * 1.4 * 1.0 * 0.8 * 1.0),
+    # Возраст ТС: 3 года - коэффициент 1.0, 4 года - 1.1
+    (120, 3, 30, 20, 5000 * 1.4 * 1.0 * 0.8 * 1.0),
+    (120, 4, 30, 20, 5000 * 1.4 * 1.1 * 0.8 * 1.0),
+    # Стаж: 10 лет - 0.9, 11 лет - 0.8
+    (120, 0, 30, 10, 5000 * 1.4 * 1.0 * 0.9 * 1.0),
+    (120, 0, 30, 11, 5000 * 1.4 * 1.0 * 0.8 * 1.0),
+    # Возраст водителя: граница входит в верхний интервал
+    (120, 0, 21, 2, 5000 * 1.4 * 1.0 * 1.3 * 1.7),
+    (120, 0, 22, 2, 5000 * 1.4 * 1.0 * 1.3 * 1.3),
+    (120, 0, 60, 20, 5000 * 1.4 * 1.0 * 0.8 * 1.2),
+])
+def test_bracket_edges_use_tariff_ratios(engine_power, vehicle_age, driver_age, driver_experience, expected):
+    current_year = datetime.now().year
+    vehicle = SimpleNamespace(engine_power=engine_power, year=current_year - vehicle_age)
+    cost = calculate_policy_cost(vehicle, 12, driver_experience, driver_age, 1.0, tariff=TARIFF)
+    assert cost == round(expected, 2)
+    batch = batch_policy_cost([engine_power], [current_year - vehicle_age], [driver_age], [driver_experience],
+                              current_year=current_year, tariff=TARIFF)
+    assert batch[0] == round(expected, 2)
+
+def test_scalars_broadcast():
+    current_year = datetime.now().year
+    costs = batch_policy_cost([50, 51, 150], current_year - 5, 30, 4, bonus_malus=0.8, period_months=6,
+                              current_year=current_year, tariff=TARIFF)
+    assert costs.tolist() == [calculate_policy_cost(SimpleNamespace(engine_power=power, year=current_year - 5),
+                                                    6, 4, 30, 0.8, tariff=TARIFF)
+                              for power in (50, 51, 150)]
+
+def test_missing_engine_power_is_rejected():
+    with pytest.raises(ValueError):
+        batch_policy_cost([100, None], 2020, 30, 5, tariff=TARIFF)
+
+def write_tariff(tariffs_dir, version, base_rate):
+    with open(os.path.join(TARIFFS_DIR, 'tariff_1.json'), encoding='utf-8') as f:
+        data = json.load(f)
+    data.update(version=version, base_rate=base_rate)
+    with open(tariffs_dir / f'tariff_{version}.json', 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+@pytest.fixture
+def registry(tmp_path):
+    write_tariff(tmp_path, 1, 5000)
+    return TariffRegistry(str(tmp_path), check_interval=0)
+
+def test_reload_picks_up_new_tariff_version(registry, tmp_path):
+    assert registry.current().version == 1
+    write_tariff(tmp_path, 2, 6000)
+    assert registry.reload().version == 2
+    assert registry.current().base_rate == 6000
+    # Прежняя версия остается доступной для пересчета старых полисов
+    assert registry.get(1).base_rate == 5000
+
+def test_broken_tariff_version_keeps_current(registry, tmp_path):
+    registry.current()
+    (tmp_path / 'tariff_2.json').write_text('{"version": 2}', encoding='utf-8')
+    assert registry.reload().version == 1
+    assert registry.last_error.startswith('Тариф 2')
+
+def test_quote_cache_hits_and_misses(registry):
+    quotes = QuoteService(registry, maxsize=10)
+    vehicle = SimpleNamespace(engine_power=120, year=datetime.now().year - 5)
+    first = quotes.quote(vehicle, 12, 4, 30, 1.0)
+    assert quotes.quote(vehicle, 12, 4, 30, 1.0) == first
+    # Другие ТС и водитель из тех же интервалов шкал берут тот же расчет
+    same_brackets = SimpleNamespace(engine_power=140, year=datetime.now().year - 6)
+    assert quotes.quote(same_brackets, 12, 5, 40, 1.0) == first
+    assert quotes.stats() == {'hits': 2, 'misses': 1, 'size': 1, 'maxsize': 10}
+
+    quotes.quote(vehicle, 6, 4, 30, 1.0)
+    assert quotes.stats()['misses'] == 2
+
+def test_quote_cache_evicts_least_recently_used(registry):
+    quotes = QuoteService(registry, maxsize=2)
+    vehicle = SimpleNamespace(engine_power=120, year=datetime.now().year - 5)
+    quotes.quote(vehicle, 12, 4, 30, 1.0)
+    quotes.quote(vehicle, 6, 4, 30, 1.0)
+    quotes.quote(vehicle, 12, 4, 30, 1.0)  # Расчет на 12 месяцев становится последним использованным
+    quotes.quote(vehicle, 3, 4, 30, 1.0)   # Вытесняет расчет на 6 месяцев
+    assert quotes.stats() == {'hits': 1, 'misses': 3, 'size': 2, 'maxsize': 2}
+
+    quotes.quote(vehicle, 12, 4, 30, 1.0)
+    assert quotes.stats()['hits'] == 2
+    quotes.quote(vehicle, 6, 4, 30, 1.0)
+    assert quotes.stats()['misses'] == 4
+
+def test_quote_cache_key_includes_tariff_version(registry, tmp_path):
+    quotes = QuoteService(registry)
+    vehicle = SimpleNamespace(engine_power=120, year=datetime.now().year - 5)
+    old = quotes.quote(vehicle, 12, 4, 30, 1.0)
+    write_tariff(tmp_path, 2, 6000)
+
+    new = quotes.quote(vehicle, 12, 4, 30, 1.0)
+    assert new['tariff_version'] == 2
+    assert new['cost'] == round(old['cost'] * 6000 / 5000, 2)
+    assert quotes.stats()['misses'] == 2
+    # Расчет по прежней версии по-прежнему берется из кэша
+    assert quotes.quote(vehicle, 12, 4, 30, 1.0, tariff=registry.get(1)) == old
+    assert quotes.stats()['hits'] == 1
@@ -0,0 +1,115 @@
+"""
+Условия WHERE из queries.py дают те же строки, что и прежняя фильтрация
+списками в Python (фильтры list_clients, list_vehicles и list_policies
+до переноса в SQL).
+"""
+from datetime import timedelta
+
+import pytest
+
+from models import db, Client, Vehicle, Policy
+from queries import client_search_criteria, policy_search_criteria, policy_status_criteria, vehicle_search_criteria
+from tests.conftest import CURRENT_DATE, VEHICLES
+
+STATUS_FILTERS = ['all', 'active', 'cancelled', 'expired', 'expiring_soon']
+
+SEARCH_TERMS = ['иванов', 'ИВАНОВ', 'иВаНоВа', 'ёлкин', 'Елкин', 'пётр', 'smith', 'SMITH', '123', '4510 12',
+                'лада', 'Лада', 'toyota', 'TOYOTA', 'а123', 'А123ВС', 'xta', '389', 'OSG', '-0005', 'веста',
+                'нет такого']
+
+def python_status_filter(rows, status_filter, current_date):
+    """Прежняя фильтрация по статусу в list_policies"""
+    if status_filter == 'active':
+        return [(p, v, c) for p, v, c in rows if p.status == 'active' and p.end_date >= current_date]
+    if status_filter == 'cancelled':
+        return [(p, v, c) for p, v, c in rows if p.status == 'cancelled']
+    if status_filter == 'expired':
+        return [(p, v, c) for p, v, c in rows if p.status == 'active' and p.end_date < current_date]
+    if status_filter == 'expiring_soon':
+        return [(p, v, c) for p, v, c in rows
+                if p.status == 'active' and p.end_date > current_date
+                and p.end_date < (current_date + timedelta(days=30))]
+    return rows
+
+def python_policy_search(rows, search_term):
+    """Прежний поиск по строке в list_policies"""
+    if not search_term:
+        return rows
+    search_term = search_term.lower()
+    return [(p, v, c) for p, v, c in rows if
+            search_term in p.number.lower() or
+            search_term in c.full_name.lower() or
+            search_term in v.brand.lower() or
+            search_term in v.model.lower() or
+            search_term in v.reg_number.lower()]
+
+def python_client_search(clients, search_term):
+    """Прежний поиск в list_clients"""
+    return [c for c in clients if search_term.lower() in c.full_name.lower() or search_term in c.passport]
+
+def python_vehicle_search(vehicles, search_term):
+    """Прежний поиск в list_vehicles"""
+    search_term = search_term.lower()
+    return [(v, c) for v, c in vehicles if
+            search_term in v.brand.lower() or
+            search_term in v.model.lower() or
+            search_term in v.vin.lower() or
+            search_term in v.reg_number.lower()]
+
+def policy_rows(*criteria):
+    return (db.session.query(Policy, Vehicle, Client)
+            .join(Policy.vehicle)
+            .join(Vehicle.client)
+            .filter(*criteria)
+            .all())
+
+def policy_ids(rows):
+    return sorted(p.id for p, _, _ in rows)
+
+@pytest.mark.parametrize('status_filter', STATUS_FILTERS)
+def test_status_criteria_match_python_filter(seeded, status_filter):
+    expected = python_status_filter(policy_rows(), status_filter, CURRENT_DATE)
+    actual = policy_rows(*policy_status_criteria(status_filter, CURRENT_DATE))
+    assert policy_ids(actual) == policy_ids(expected)
+
+def test_status_criteria_boundaries(seeded):
+    # На каждое ТС: действующие - все активные, кроме истекшего вчера,
+    # истекающие - от секунды до 29 дней 23 часов (ровно 30 дней и сегодня - нет)
+    per_vehicle = len(VEHICLES)
+    assert len(policy_rows(*policy_status_criteria('active', CURRENT_DATE))) == 6 * per_vehicle
+    assert len(policy_rows(*policy_status_criteria('expiring_soon', CURRENT_DATE))) == 3 * per_vehicle
+    assert len(policy_rows(*policy_status_criteria('expired', CURRENT_DATE))) == 1 * per_vehicle
+
+@pytest.mark.parametrize('search_term', SEARCH_TERMS)
+def test_policy_search_criteria_match_python_filter(seeded, search_term):
+    expected = python_policy_search(policy_rows(), search_term)
+    actual = policy_rows(*policy_search_criteria(search_term))
+    assert policy_ids(actual) == policy_ids(expected)
+
+@pytest.mark.parametrize('status_filter', STATUS_FILTERS)
+@pytest.mark.parametrize('search_term', ['иванов', 'ЛАДА', 'а123', 'toyota'])
+def test_combined_policy_filters_match_python_filter(seeded, status_filter, search_term):
+    expected = python_policy_search(python_status_filter(policy_rows(), status_filter, CURRENT_DATE),
+                                    search_term)
+    actual = policy_rows(*policy_status_criteria(status_filter, CURRENT_DATE),
+                         *policy_search_criteria(search_term))
+    assert policy_ids(actual) == policy_ids(expected)
+
+@pytest.mark.parametrize('search_term', SEARCH_TERMS)
+def test_client_search_criteria_match_python_filter(seeded, search_term):
+    expected = python_client_search(Client.query.all(), search_term)
+    actual = Client.query.filter(*client_search_criteria(search_term)).all()
+    assert sorted(c.id for c in actual) == sorted(c.id for c in expected)
+
+@pytest.mark.parametrize('search_term', SEARCH_TERMS)
+def test_vehicle_search_criteria_match_python_filter(seeded, search_term):
+    vehicles = Vehicle.query.join(Vehicle.client).add_entity(Client)
+    expected = python_vehicle_search(vehicles.all(), search_term)
+    actual = vehicles.filter(*vehicle_search_criteria(search_term)).all()
+    assert sorted(v.id for v, _ in actual) == sorted(v.id for v, _ in expected)
+
+def test_cyrillic_search_ignores_case(seeded):
+    names = {c.full_name for c in Client.query.filter(*client_search_criteria('иванов')).all()}
+    assert names == {'Иванов Иван Иванович', 'ИВАНОВА Мария Петровна'}
+    brands = {v.brand for v in Vehicle.query.filter(*vehicle_search_criteria('лада')).all()}
+    assert brands == {'Лада', 'ЛАДА'}
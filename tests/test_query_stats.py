@@ -0,0 +1,74 @@
+"""
+Бюджет запросов (query_stats.assert_query_budget) для выборок списков и
+учет посещений экранов (QueryStats.track_screen) отдельно от фоновых
+заданий (QueryStats.track_job).
+"""
+import pytest
+
+from models import db, Client, Vehicle, Policy
+from queries import fetch_client_page, fetch_policy_page, fetch_vehicle_page, policy_status_criteria
+from query_stats import QueryBudgetExceeded, QueryStats, assert_query_budget
+from tests.conftest import CURRENT_DATE
+
+def test_list_pages_fit_query_budget(seeded):
+    # Каждая страница списка - один запрос, без запросов на строку
+    with assert_query_budget(1, 'fetch_policy_page'):
+        page = fetch_policy_page(policy_status_criteria('active', CURRENT_DATE), page_size=10)
+        for policy, vehicle, client in page['rows']:
+            assert policy.number and vehicle.reg_number and client.full_name
+    with assert_query_budget(1, 'fetch_client_page'):
+        fetch_client_page(page_size=10)
+    with assert_query_budget(1, 'fetch_vehicle_page'):
+        for vehicle, client in fetch_vehicle_page(page_size=10)['rows']:
+            assert client.full_name
+
+def test_n_plus_one_exceeds_budget(seeded):
+    db.session.expunge_all()
+    with pytest.raises(QueryBudgetExceeded) as error:
+        with assert_query_budget(2, 'policies with lazy vehicles'):
+            # По одному отмененному полису на ТС: каждое ТС загружается отдельным запросом
+            policies = (Policy.query.filter(Policy.status == 'cancelled', Policy.end_date > CURRENT_DATE)
+                        .limit(5).all())
+            for policy in policies:
+                assert policy.vehicle.reg_number
+    assert 'выполнено запросов 6 при бюджете 2' in str(error.value)
+    assert '5 x SELECT' in str(error.value)
+
+def test_tracked_screen_visit_is_recorded_on_return(seeded):
+    stats = QueryStats()
+
+    @stats.track_screen
+    def show_counts():
+        return Client.query.count(), Vehicle.query.count()
+
+    @stats.track_screen
+    def menu():
+        # Экран, вызванный из другого экрана, учитывается отдельно
+        show_counts()
+        return Policy.query.count()
+
+    menu()
+    menu()
+    screens = {screen['screen']: screen for screen in stats.snapshot()}
+    assert screens['show_counts']['visits'] == 2
+    assert screens['show_counts']['queries'] == 4
+    assert screens['menu']['visits'] == 2
+    assert screens['menu']['max_queries'] == 1
+
+def test_job_queries_are_kept_out_of_screen_summary(seeded):
+    stats = QueryStats()
+
+    @stats.track_screen
+    def show_counts():
+        return Client.query.count()
+
+    @stats.track_job
+    def export_job():
+        return Policy.query.count(), Vehicle.query.count()
+
+    show_counts()
+    export_job()
+    assert [screen['screen'] for screen in stats.snapshot()] == ['show_counts']
+    jobs = stats.snapshot('job')
+    assert [job['screen'] for job in jobs] == ['export_job']
+    assert jobs[0]['category'] == 'job' and jobs[0]['queries'] == 2
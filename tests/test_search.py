@@ -0,0 +1,125 @@
+"""
+Полнотекстовый поиск (search_index.py) находит фрагменты идентификаторов
+из середины строки, как прежний поиск подстрокой, и постраничная выборка
+списков клиентов и ТС проходит все строки без пропусков и повторов.
+"""
+import pytest
+from sqlalchemy import text
+
+from models import db, Client, Vehicle, Policy
+from queries import fetch_client_page, fetch_policy_page, fetch_vehicle_page, search_clients, search_vehicles
+
+@pytest.fixture(params=['trigram', 'instr'])
+def search_mode(request, seeded):
+    """Поиск фрагментов по индексу trigram и без него (база до миграции 6)"""
+    if request.param == 'instr':
+        for table in ('client_id_fts', 'vehicle_id_fts', 'policy_id_fts'):
+            db.session.execute(text(f"DROP TABLE {table}"))
+        db.session.commit()
+    return request.param
+
+def client_passports(term):
+    return {client.passport for client in search_clients(term)}
+
+def vehicle_vins(term):
+    return {vehicle.vin for vehicle, _ in search_vehicles(term)}
+
+def policy_reg_numbers(term):
+    page = fetch_policy_page([], search_term=term, page_size=1000)
+    return {vehicle.reg_number for _, vehicle, _ in page['rows']}
+
+def test_vehicle_found_by_vin_tail(search_mode):
+    assert vehicle_vins('766389') == {'XTA210990Y2766389'}
+    assert vehicle_vins('2766389') == {'XTA210990Y2766389'}
+
+def test_vehicle_found_by_reg_number_fragment(search_mode):
+    # «123» есть также в VIN ТС с номерами Е789КХ50 и О777ОО777
+    assert ({vehicle.reg_number for vehicle, _ in search_vehicles('123')}
+            == {'А123ВС77', 'Н123АА197', 'Е789КХ50', 'О777ОО777'})
+    assert {vehicle.reg_number for vehicle, _ in search_vehicles('123вс')} == {'А123ВС77'}
+
+def test_client_found_by_passport_digits(search_mode):
+    assert client_passports('123456') == {'4510 123456'}
+    assert client_passports('0 1234') == {'4510 123456'}
+    assert client_passports('000123') == {'4512 000123'}
+    assert client_passports('00') == {'4512 000123', '4514 123000'}
+
+def test_words_ranked_before_fragments(search_mode):
+    # «лада» - слово марки; ТС, найденные по слову, идут первыми
+    assert {vehicle.brand for vehicle, _ in search_vehicles('лада')} == {'Лада', 'ЛАДА'}
+    clients = search_clients('иванов')
+    assert [client.full_name for client in clients][:2] == ['Иванов Иван Иванович', 'ИВАНОВА Мария Петровна']
+
+def test_search_limit_applies_to_fragment_results(search_mode):
+    assert len(search_vehicles('1', limit=2)) == 2
+
+def test_policy_found_by_reg_number_fragment(search_mode):
+    assert policy_reg_numbers('123') == {'А123ВС77', 'Н123АА197'}
+    assert policy_reg_numbers('23вс') == {'А123ВС77'}
+
+def test_policy_found_by_number_fragment(search_mode):
+    page = fetch_policy_page([], search_term='0514-0005', page_size=1000)
+    assert [policy.number for policy, _, _ in page['rows']] == ['OSG-20250514-0005']
+
+def test_policy_identifier_search_pages_by_date(seeded):
+    pages = []
+    cursor = None
+    while True:
+        page = fetch_policy_page([], cursor, 'next', 4, '123')
+        pages.append([policy.id for policy, _, _ in page['rows']])
+        if not page['has_next']:
+            break
+        cursor = page['last_cursor']
+    ids = [policy_id for page_ids in pages for policy_id in page_ids]
+    policies = [db.session.get(Policy, policy_id) for policy_id in ids]
+    assert len(ids) == len(set(ids)) == 18
+    assert [(p.created_at, p.id) for p in policies] == sorted(((p.created_at, p.id) for p in policies),
+                                                              reverse=True)
+
+def walk_pages(fetch_page, key, page_size):
+    """Все строки, пройденные вперед, и первая страница, полученная обратным переходом"""
+    rows = []
+    page = fetch_page(None, 'next', page_size)
+    first_ids = [key(row) for row in page['rows']]
+    assert not page['has_prev']
+    while True:
+        rows.extend(key(row) for row in page['rows'])
+        if not page['has_next']:
+            break
+        previous = page
+        page = fetch_page(page['last_cursor'], 'next', page_size)
+        assert page['has_prev']
+    back = fetch_page(page['first_cursor'], 'prev', page_size)
+    assert back['has_next']
+    assert [key(row) for row in back['rows']] == [key(row) for row in previous['rows']]
+    return rows, first_ids
+
+@pytest.mark.parametrize('page_size', [1, 2, 4])
+def test_client_pages_cover_all_clients(seeded, page_size):
+    rows, first_ids = walk_pages(fetch_client_page, lambda client: client.id, page_size)
+    assert rows == sorted(client.id for client in Client.query.all())
+    assert len(first_ids) == page_size
+
+@pytest.mark.parametrize('page_size', [1, 4, 5])
+def test_vehicle_pages_cover_all_vehicles(seeded, page_size):
+    rows, _ = walk_pages(fetch_vehicle_page, lambda row: row[0].id, page_size)
+    assert rows == sorted(vehicle.id for vehicle in Vehicle.query.all())
+
+def test_single_page_has_no_navigation(seeded):
+    page = fetch_client_page(page_size=100)
+    assert len(page['rows']) == Client.query.count()
+    assert not page['has_prev'] and not page['has_next']
+
+def test_identifier_index_follows_updates(seeded):
+    vehicle = Vehicle.query.filter_by(vin='XTA210990Y2766389').one()
+    vehicle.reg_number = 'К555КК55'
+    db.session.commit()
+    assert policy_reg_numbers('555кк') == {'К555КК55'}
+    assert policy_reg_numbers('123вс') == set()
+    client = Client(full_name='Новый Клиент', passport='4599 246813')
+    db.session.add(client)
+    db.session.commit()
+    assert client_passports('246813') == {'4599 246813'}
+    db.session.delete(client)
+    db.session.commit()
+    assert client_passports('246813') == set()
@@ -1,26 +1,118 @@
+"""
+Скрипт обновления базы данных: версионированные миграции схемы.
+
+Текущая версия схемы хранится в PRAGMA user_version файла SQLite, поэтому
+существующий osago.db обновляется на месте, без пересоздания. Каждая миграция
+написана идемпотентно (IF NOT EXISTS, проверка столбцов), так что прерванный
+запуск можно безопасно повторить.
+"""
 from flask import Flask
-from models import db, Policy
-import os
+from models import db
 from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from search_index import (create_identifier_index, create_search_index, rebuild_identifier_index,
+                          rebuild_search_index)
+from policy_stats import create_rollup_triggers, rebuild_rollup
+
+# Список миграций: (версия, описание, функция)
+MIGRATIONS = []
+
+def migration(version, description):
+    """Декоратор для регистрации миграции с указанным номером версии"""
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+def _table_columns(conn, table):
+    """Возвращает список столбцов таблицы"""
+    result = conn.execute(text(f"PRAGMA table_info({table})")).fetchall()
+    return [row[1] for row in result]
+
+@migration(1, "Столбец notes в таблице policy")
+def add_policy_notes(conn):
+    if 'notes' not in _table_columns(conn, 'policy'):
+        conn.execute(text("ALTER TABLE policy ADD COLUMN notes TEXT"))
+
+@migration(2, "Индексы по статусу, сроку действия, дате создания и связям полисов")
+def add_policy_indexes(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_policy_status_end_date ON policy (status, end_date)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_policy_created_at ON policy (created_at)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_policy_vehicle_id_start_date ON policy (vehicle_id, start_date)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_vehicle_client_id ON vehicle (client_id)"))
+    # Обновляем статистику планировщика запросов для новых индексов
+    conn.execute(text("ANALYZE"))
+
+@migration(3, "Полнотекстовый поиск FTS5 по клиентам, ТС и полисам")
+def add_search_index(conn):
+    try:
+        conn.execute(text("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)"))
+        conn.execute(text("DROP TABLE temp.fts5_probe"))
+    except OperationalError:
+        # SQLite собран без FTS5 - поиск работает через условия instr()
+        print('SQLite не поддерживает FTS5, полнотекстовый индекс не создан')
+        return
+    create_search_index(conn)
+    rebuild_search_index(conn)
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///osago.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+@migration(4, "Свертка статистики по полисам и триггеры для ее обновления")
+def add_policy_stats_rollup(conn):
+    create_rollup_triggers(conn)
+    rebuild_rollup(conn)
 
-db.init_app(app)
+@migration(5, "Столбец tariff_version в таблице policy")
+def add_policy_tariff_version(conn):
+    if 'tariff_version' not in _table_columns(conn, 'policy'):
+        conn.execute(text("ALTER TABLE policy ADD COLUMN tariff_version INTEGER"))
 
-with app.app_context():
+@migration(6, "Индекс фрагментов паспортов, VIN, гос. номеров и номеров полисов (FTS5 trigram)")
+def add_identifier_index(conn):
     try:
-        # Проверяем, существует ли столбец
-        result = db.session.execute(text("PRAGMA table_info(policy)")).fetchall()
-        columns = [row[1] for row in result]
-        
-        if 'notes' not in columns:
-            # Добавляем столбец notes
-            db.session.execute(text("ALTER TABLE policy ADD COLUMN notes TEXT"))
-            db.session.commit()
-            print('База данных успешно обновлена: добавлен столбец notes в таблицу policy')
-        else:
-            print('Столбец notes уже существует в таблице policy')
-    except Exception as e:
-        print(f'Ошибка при обновлении базы данных: {str(e)}')
+        conn.execute(text("CREATE VIRTUAL TABLE temp.trigram_probe USING fts5(x, tokenize = 'trigram')"))
+        conn.execute(text("DROP TABLE temp.trigram_probe"))
+    except OperationalError:
+        # Нет FTS5 или токенизатора trigram (SQLite до 3.34) - фрагменты ищутся через instr()
+        print('SQLite не поддерживает токенизатор trigram, индекс фрагментов не создан')
+        return
+    create_identifier_index(conn)
+    rebuild_identifier_index(conn)
+
+def get_schema_version(conn):
+    """Возвращает текущую версию схемы базы данных"""
+    return conn.execute(text("PRAGMA user_version")).scalar() or 0
+
+def run_migrations(engine):
+    """Применяет все миграции с версией выше текущей, возвращает список примененных"""
+    with engine.connect() as conn:
+        current_version = get_schema_version(conn)
+
+    applied = []
+    for version, description, func in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version <= current_version:
+            continue
+        with engine.begin() as conn:
+            func(conn)
+            conn.execute(text(f"PRAGMA user_version = {int(version)}"))
+        print(f'Применена миграция {version}: {description}')
+        applied.append(version)
+    return applied
+
+if __name__ == '__main__':
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///osago.db'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    db.init_app(app)
+
+    with app.app_context():
+        try:
+            # Создаем недостающие таблицы, существующие не изменяются
+            db.create_all()
+            applied = run_migrations(db.engine)
+
+            if applied:
+                print(f'База данных успешно обновлена до версии {applied[-1]}')
+            else:
+                print('База данных уже имеет актуальную версию схемы')
+        except Exception as e:
+            print(f'Ошибка при обновлении базы данных: {str(e)}')
@@ -0,0 +1,38 @@
+"""
+Модуль проверки данных клиентов и транспортных средств.
+
+Функции возвращают текст ошибки или None и используются как формами
+приложения, так и пакетным импортом (fleet_import.py).
+"""
+
+def validate_passport(passport):
+    """Валидация паспортных данных"""
+    # Проверка формата: 1234 567890
+    if len(passport.replace(" ", "")) != 10 or not passport.replace(" ", "").isdigit():
+        return "Паспорт должен содержать 10 цифр"
+    return None
+
+def validate_phone(phone):
+    """Валидация телефонного номера"""
+    if phone and (not phone.startswith('+') or not phone[1:].isdigit()):
+        return "Телефон должен начинаться с '+' и содержать только цифры"
+    return None
+
+def validate_email(email):
+    """Простая валидация email"""
+    if email and '@' not in email:
+        return "Email должен содержать символ '@'"
+    return None
+
+def validate_vin(vin):
+    """Валидация VIN-кода"""
+    if len(vin) != 17:
+        return "VIN должен содержать 17 символов"
+    return None
+
+def validate_reg_number(reg_number):
+    """Валидация государственного номера автомобиля"""
+    # Простая проверка на минимальную длину
+    if len(reg_number) < 6:
+        return "Государственный номер слишком короткий"
+    return None